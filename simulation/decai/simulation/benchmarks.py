@@ -0,0 +1,473 @@
+"""
+Benchmarks for the contracts, incentive mechanisms, and classifiers using synthetic data.
+
+Run all of the benchmarks and save the results:
+```bash
+python -m decai.simulation.benchmarks --output saved_runs/benchmarks-new.json
+```
+
+Compare with the results from another commit:
+```bash
+python -m decai.simulation.benchmarks --compare saved_runs/benchmarks-old.json
+```
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import sklearn
+from injector import Injector, Module
+
+from decai.simulation.contract.balances import Balances
+from decai.simulation.contract.classification.classifier import Classifier
+from decai.simulation.contract.data.data_handler import DataHandler, StoredData
+from decai.simulation.contract.incentive.incentive_mechanism import IncentiveMechanism
+from decai.simulation.contract.incentive.prediction_market import PredictionMarket, PredictionMarketImModule
+from decai.simulation.contract.incentive.stakeable import Stakeable, StakeableImModule
+from decai.simulation.contract.objects import Msg, TimeMock
+from decai.simulation.logging_module import LoggingModule
+from decai.simulation.registry import models
+
+_NUM_FEATURES = 20
+_NUM_TEST_SAMPLES = 200
+_NUM_CONTRIBUTORS = 10
+
+Operation = Callable[[], Any]
+""" Runs the operations to time. """
+
+
+@dataclass
+class Benchmark:
+    """
+    A benchmark for one type of operation.
+    """
+
+    name: str
+
+    setup: Callable[[int, np.random.RandomState], Operation]
+    """
+    Prepares `size` operations that use data from the random state and returns a function to run them.
+    Called before each repetition so that the operations always start from the same state.
+    """
+
+    sizes: Sequence[int]
+    """ The numbers of operations to time. """
+
+    quick_sizes: Sequence[int]
+    """ The numbers of operations to time for a quick check. """
+
+
+def make_data(num_samples: int, rng: np.random.RandomState, num_features: int = _NUM_FEATURES) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Make data that is mostly linearly separable.
+    The features are non-negative counts so that they work with all of the models.
+
+    :param num_samples: The number of samples to make.
+    :param rng: The source of randomness.
+    :param num_features: The number of features for each sample.
+    :return: The features and the binary labels.
+    """
+    x = rng.randint(0, 4, size=(num_samples, num_features)).astype(np.float64)
+    weights = rng.normal(size=num_features)
+    scores = x @ weights
+    y = (scores > np.median(scores)).astype(np.int64)
+    # Add some noise.
+    flip = rng.random_sample(num_samples) < 0.05
+    y[flip] = 1 - y[flip]
+    return x, y
+
+
+def _injector(*modules: Module) -> Injector:
+    return Injector([LoggingModule(logging.WARNING), *modules])
+
+
+def _data_handler_add(size: int, rng: np.random.RandomState) -> Operation:
+    x, y = make_data(size, rng)
+    data_handler = _injector().get(DataHandler)
+
+    def run():
+        for i in range(size):
+            data_handler.handle_add_data(f'contributor-{i % _NUM_CONTRIBUTORS}', 1, x[i], y[i])
+
+    return run
+
+
+def _data_handler_get(size: int, rng: np.random.RandomState) -> Operation:
+    x, y = make_data(size, rng)
+    data_handler = _injector().get(DataHandler)
+    for i in range(size):
+        data_handler.handle_add_data(f'contributor-{i % _NUM_CONTRIBUTORS}', 1, x[i], y[i])
+
+    def run():
+        for i in range(size):
+            stored_data = data_handler.get_data(x[i], y[i], 0, f'contributor-{i % _NUM_CONTRIBUTORS}')
+            assert stored_data is not None
+
+    return run
+
+
+def _balances_send(size: int, rng: np.random.RandomState) -> Operation:
+    balances = _injector().get(Balances)
+    addresses = [f'agent-{i}' for i in range(_NUM_CONTRIBUTORS)]
+    for address in addresses:
+        balances.initialize(address, 1E12)
+    senders = rng.randint(len(addresses), size=size)
+    receivers = rng.randint(len(addresses), size=size)
+    amounts = rng.randint(1, 100, size=size).tolist()
+
+    def run():
+        for s, r, amount in zip(senders, receivers, amounts):
+            balances.send(addresses[s], addresses[r], amount)
+
+    return run
+
+
+def _stakeable(size: int, rng: np.random.RandomState) -> Tuple[TimeMock, Stakeable, np.ndarray, np.ndarray]:
+    x, y = make_data(size, rng)
+    inj = _injector(StakeableImModule)
+    time_method = inj.get(TimeMock)
+    time_method.set_time(1)
+    im = inj.get(IncentiveMechanism)
+    assert isinstance(im, Stakeable)
+    return time_method, im, x, y
+
+
+def _stakeable_add(size: int, rng: np.random.RandomState) -> Operation:
+    time_method, im, x, y = _stakeable(size, rng)
+
+    def run():
+        for i in range(size):
+            time_method.add_time(60)
+            im.handle_add_data(f'contributor-{i % _NUM_CONTRIBUTORS}', 1E9, x[i], y[i])
+
+    return run
+
+
+def _stakeable_refund(size: int, rng: np.random.RandomState) -> Operation:
+    time_method, im, x, y = _stakeable(size, rng)
+    stored_data = [StoredData(y[i], 0, f'contributor-{i % _NUM_CONTRIBUTORS}', 100, 100) for i in range(size)]
+    time_method.set_time(im.refund_time_s + 1)
+
+    def run():
+        for i, d in enumerate(stored_data):
+            im.handle_refund(d.sender, d, d.claimable_amount, False, y[i])
+
+    return run
+
+
+def _stakeable_report(size: int, rng: np.random.RandomState) -> Operation:
+    time_method, im, x, y = _stakeable(size, rng)
+    stored_data = [StoredData(y[i], 0, f'contributor-{i % _NUM_CONTRIBUTORS}', 100, 100) for i in range(size)]
+    reporter = 'reporter'
+    im.num_good_data_per_user[reporter] = 1
+    im.total_num_good_data = 10
+    time_method.set_time(im.refund_time_s + 1)
+
+    def run():
+        for i, d in enumerate(stored_data):
+            im.handle_report(reporter, d, False, 1 - y[i])
+
+    return run
+
+
+def _prediction_market(num_contributions: int, rng: np.random.RandomState) \
+        -> Tuple[PredictionMarket, Balances, np.ndarray, np.ndarray, List[Tuple[np.ndarray, np.ndarray]], int]:
+    """
+    Set up a market in the participation phase with an initialized perceptron.
+
+    :return: The market, the balances, the data to contribute, the labels for the data,
+        the portions of the test set, and the index of the portion of the test set that was revealed.
+    """
+    num_init = 50
+    x, y = make_data(num_init + num_contributions + _NUM_TEST_SAMPLES, rng)
+    x_init, y_init = x[:num_init], y[:num_init]
+    x_contributions, y_contributions = x[num_init:-_NUM_TEST_SAMPLES], y[num_init:-_NUM_TEST_SAMPLES]
+    x_test, y_test = x[-_NUM_TEST_SAMPLES:], y[-_NUM_TEST_SAMPLES:]
+
+    inj = _injector(models.get_module('perceptron'), PredictionMarketImModule())
+    balances = inj.get(Balances)
+    im = inj.get(IncentiveMechanism)
+    assert isinstance(im, PredictionMarket)
+    im.owner = 'owner'
+    initializer_address = 'initializer'
+    total_bounty = 100_000
+    balances.initialize(initializer_address, total_bounty)
+    for i in range(_NUM_CONTRIBUTORS):
+        balances.initialize(f'contributor-{i}', 1E9)
+
+    im.model.init_model(x_init, y_init)
+    test_set_hashes, test_sets = im.get_test_set_hashes(10, x_test, y_test)
+    test_reveal_index = im.initialize_market(Msg(initializer_address, total_bounty), test_set_hashes,
+                                             min_length_s=0, min_num_contributions=num_contributions)
+    im.reveal_init_test_set(test_sets[test_reveal_index])
+    return im, balances, x_contributions, y_contributions, test_sets, test_reveal_index
+
+
+def _prediction_market_add(size: int, rng: np.random.RandomState) -> Operation:
+    im, balances, x, y, _, _ = _prediction_market(size, rng)
+
+    def run():
+        for i in range(size):
+            contributor = f'contributor-{i % _NUM_CONTRIBUTORS}'
+            cost, _ = im.handle_add_data(contributor, 1, x[i], y[i])
+            balances.send(contributor, im.owner, cost)
+
+    return run
+
+
+def _prediction_market_settle(size: int, rng: np.random.RandomState) -> Operation:
+    im, balances, x, y, test_sets, test_reveal_index = _prediction_market(size, rng)
+    for i in range(size):
+        contributor = f'contributor-{i % _NUM_CONTRIBUTORS}'
+        # Some contributors are bad so that contributions get removed between rounds.
+        classification = y[i] if i % _NUM_CONTRIBUTORS < _NUM_CONTRIBUTORS // 2 else 1 - y[i]
+        cost, _ = im.handle_add_data(contributor, 1, x[i], classification)
+        balances.send(contributor, im.owner, cost)
+
+    def run():
+        im.end_market()
+        for i, test_set_portion in enumerate(test_sets):
+            if i != test_reveal_index:
+                im.verify_next_test_set(test_set_portion)
+        while im.remaining_bounty_rounds > 0:
+            im.process_contribution()
+        for i in range(_NUM_CONTRIBUTORS):
+            contributor = f'contributor-{i}'
+            # noinspection PyTypeChecker
+            reward = im.handle_refund(contributor, None, 0, False, None)
+            balances.send(im.owner, contributor, reward)
+
+    return run
+
+
+def _classifier(model_name: str, num_train: int, num_ops: int, rng: np.random.RandomState) \
+        -> Tuple[Classifier, np.ndarray, np.ndarray]:
+    """
+    :return: A classifier trained on `num_train` samples and `num_ops` other samples.
+    """
+    x, y = make_data(num_train + num_ops, rng)
+    c = _injector(models.get_module(model_name)).get(Classifier)
+    c.init_model(x[:num_train], y[:num_train])
+    return c, x[num_train:], y[num_train:]
+
+
+def _classifier_benchmarks(model_name: str) -> List[Benchmark]:
+    def predict(size: int, rng: np.random.RandomState) -> Operation:
+        c, x, _ = _classifier(model_name, 100, size, rng)
+
+        def run():
+            for sample in x:
+                c.predict(sample)
+
+        return run
+
+    def predict_batch(size: int, rng: np.random.RandomState) -> Operation:
+        c, x, _ = _classifier(model_name, 100, size, rng)
+        return lambda: c.predict_batch(x)
+
+    def update(size: int, rng: np.random.RandomState) -> Operation:
+        c, x, y = _classifier(model_name, 100, size, rng)
+
+        def run():
+            for sample, label in zip(x, y):
+                c.update(sample, label)
+
+        return run
+
+    def evaluate(size: int, rng: np.random.RandomState) -> Operation:
+        # Each operation evaluates on the test set once like the prediction market does for each contribution.
+        c, x, y = _classifier(model_name, 100, _NUM_TEST_SAMPLES, rng)
+
+        def run():
+            for _ in range(size):
+                c.evaluate(x, y)
+
+        return run
+
+    prefix = f'SciKitClassifier-{model_name}'
+    return [
+        Benchmark(f'{prefix}.predict', predict, sizes=(1_000,), quick_sizes=(20,)),
+        Benchmark(f'{prefix}.predict_batch', predict_batch, sizes=(10_000,), quick_sizes=(20,)),
+        Benchmark(f'{prefix}.update', update, sizes=(1_000,), quick_sizes=(20,)),
+        Benchmark(f'{prefix}.evaluate', evaluate, sizes=(1_000,), quick_sizes=(5,)),
+    ]
+
+
+def get_benchmarks(model_names: Optional[Sequence[str]] = None) -> List[Benchmark]:
+    """
+    :param model_names: The names of the models in the registry to benchmark.
+        Defaults to all of the models that can be imported.
+    :return: The benchmarks.
+    """
+    result = [
+        Benchmark('DataHandler.handle_add_data', _data_handler_add, sizes=(1_000, 10_000), quick_sizes=(20,)),
+        Benchmark('DataHandler.get_data', _data_handler_get, sizes=(1_000, 10_000), quick_sizes=(20,)),
+        Benchmark('Balances.send', _balances_send, sizes=(10_000, 100_000), quick_sizes=(20,)),
+        Benchmark('Stakeable.handle_add_data', _stakeable_add, sizes=(10_000,), quick_sizes=(20,)),
+        Benchmark('Stakeable.handle_refund', _stakeable_refund, sizes=(10_000,), quick_sizes=(20,)),
+        Benchmark('Stakeable.handle_report', _stakeable_report, sizes=(10_000,), quick_sizes=(20,)),
+        Benchmark('PredictionMarket.handle_add_data', _prediction_market_add, sizes=(10_000,), quick_sizes=(20,)),
+        Benchmark('PredictionMarket.settle', _prediction_market_settle, sizes=(100, 300, 1_000),
+                  quick_sizes=(20,)),
+    ]
+    if model_names is None:
+        model_names = []
+        for name in models.names():
+            try:
+                models.get_module(name)
+            except ImportError:
+                # The dependencies for some models are optional.
+                continue
+            model_names.append(name)
+    for model_name in model_names:
+        result.extend(_classifier_benchmarks(model_name))
+    return result
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=Path(__file__).parent,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              check=True, universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(benchmarks: Sequence[Benchmark],
+                   repeats: int = 3,
+                   quick: bool = False,
+                   seed: int = 0xDeCA10B,
+                   log: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """
+    Time benchmarks.
+
+    :param benchmarks: The benchmarks to run.
+    :param repeats: The number of times to time each benchmark.
+    :param quick: `True` to use `Benchmark.quick_sizes` to quickly check that the benchmarks work.
+    :param seed: Seeds the random state for the data so that the results can be compared across runs.
+    :param log: Called with the result of each benchmark as it finishes.
+    :return: The results in a format that can be saved as JSON.
+        `results` maps "name[size]" to the time for the fastest repetition (`best_s`),
+        the median time (`median_s`), and the fastest time per operation (`per_op_s`).
+    """
+    assert repeats > 0
+    results: Dict[str, Dict[str, Any]] = dict()
+    for benchmark in benchmarks:
+        for size in (benchmark.quick_sizes if quick else benchmark.sizes):
+            times_s = []
+            for _ in range(repeats):
+                run = benchmark.setup(size, np.random.RandomState(seed))
+                start = time.perf_counter()
+                run()
+                times_s.append(time.perf_counter() - start)
+            key = f'{benchmark.name}[{size}]'
+            best_s = min(times_s)
+            results[key] = dict(num_ops=size, repeats=repeats,
+                                best_s=best_s, median_s=statistics.median(times_s), per_op_s=best_s / size)
+            if log is not None:
+                log(f"{key:<50} {best_s:>10.4f}s {best_s / size * 1E6:>12.2f}us/op")
+    return dict(
+        metadata=dict(
+            time=time.time(),
+            git_commit=_git_commit(),
+            quick=quick,
+            seed=seed,
+            python=platform.python_version(),
+            numpy=np.__version__,
+            sklearn=sklearn.__version__,
+            platform=platform.platform(),
+            cpu_count=os.cpu_count(),
+        ),
+        results=results,
+    )
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.1) \
+        -> List[Dict[str, Any]]:
+    """
+    Compare the times for benchmarks that are in both results.
+
+    :param baseline: Results from `run_benchmarks`, e.g. for an older commit.
+    :param current: Results from `run_benchmarks`.
+    :param threshold: The relative change in time to consider a regression or an improvement.
+    :return: For each benchmark: the `name`, the `baseline_s` and `current_s` times,
+        the `ratio` of the current time to the baseline time,
+        and the `change` which is "slower", "faster", or "same".
+    """
+    result = []
+    baseline_results = baseline['results']
+    for name, current_result in current['results'].items():
+        baseline_result = baseline_results.get(name)
+        if baseline_result is None:
+            continue
+        baseline_s, current_s = baseline_result['best_s'], current_result['best_s']
+        ratio = current_s / baseline_s if baseline_s > 0 else float('inf')
+        if ratio > 1 + threshold:
+            change = 'slower'
+        elif ratio < 1 - threshold:
+            change = 'faster'
+        else:
+            change = 'same'
+        result.append(dict(name=name, baseline_s=baseline_s, current_s=current_s, ratio=ratio, change=change))
+    return result
+
+
+def save_results(path, results: Dict[str, Any]):
+    """
+    :param path: Where to save the results as JSON.
+    :param results: Results from `run_benchmarks`.
+    """
+    path = Path(path)
+    os.makedirs(path.parent, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp' + path.suffix)
+    with open(tmp_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def main(args: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark contracts, incentive mechanisms, and classifiers.")
+    parser.add_argument('--output', help="Where to save the results as JSON. "
+                                         "Defaults to saved_runs/{time}-benchmarks.json.")
+    parser.add_argument('--compare', metavar='BASELINE', help="Results to compare with.")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="The relative change in time to report as a regression. Default: %(default)s.")
+    parser.add_argument('--filter', help="Only run benchmarks with names that contain this text.")
+    parser.add_argument('--models', nargs='+', help="The models to benchmark. Default: all available models.")
+    parser.add_argument('--repeats', type=int, default=3, help="Default: %(default)s.")
+    parser.add_argument('--quick', action='store_true', help="Use small sizes to check that the benchmarks work.")
+    args = parser.parse_args(args)
+
+    benchmarks = get_benchmarks(args.models)
+    if args.filter:
+        benchmarks = [b for b in benchmarks if args.filter in b.name]
+    results = run_benchmarks(benchmarks, repeats=args.repeats, quick=args.quick, log=print)
+    output = args.output or f'saved_runs/{int(results["metadata"]["time"])}-benchmarks.json'
+    save_results(output, results)
+    print(f"Saved results to \"{output}\".")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        comparison = compare_results(baseline, results, args.threshold)
+        print(f"\n{'Benchmark':<50} {'Baseline (s)':>12} {'Current (s)':>12} {'Ratio':>8}")
+        for c in comparison:
+            print(f"{c['name']:<50} {c['baseline_s']:>12.4f} {c['current_s']:>12.4f} {c['ratio']:>8.2f}"
+                  + (f"  {c['change']}" if c['change'] != 'same' else ""))
+        if any(c['change'] == 'slower' for c in comparison):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
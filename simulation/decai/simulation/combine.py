@@ -1,19 +1,20 @@
-import json
-from collections import defaultdict
 from dataclasses import dataclass
 from itertools import cycle
 from logging import Logger
-from operator import itemgetter
+from multiprocessing import Pool
 from pathlib import Path
 from typing import List, Dict
 
+import numpy as np
 from bokeh import colors
 from bokeh.io import export_png
 from bokeh.models import FuncTickFormatter, Legend, PrintfTickFormatter, AdaptiveTicker
 from bokeh.plotting import figure, output_file
 from injector import Injector, inject
 
+from decai.simulation.downsampling import lttb
 from decai.simulation.logging_module import LoggingModule
+from decai.simulation.run_metrics import load_metrics
 from decai.simulation.simulate import Agent
 
 
@@ -22,11 +23,17 @@ from decai.simulation.simulate import Agent
 class SimulationCombiner(object):
     _logger: Logger
 
-    def combine(self, runs: List[Dict], img_save_path: str):
+    def combine(self, runs: List[Dict], img_save_path: str, max_points_per_line: int = 1000,
+                num_workers: int = None):
         """
         Combine runs from several files.
 
-        :param paths: The paths to the runs to combine.
+        :param runs: The name and path of each run to combine.
+            Columnar metrics saved next to a run's JSON file are used if they exist.
+        :param img_save_path: Where to save the image of the plot.
+        :param max_points_per_line: The maximum number of points to plot for each line.
+            Lines with more points are downsampled in a way that keeps their shape.
+        :param num_workers: The number of processes to use to load runs. Defaults to the number of CPUs.
         """
         output_file('combined_plots.html')
         plot = figure(title="Balances & Accuracy on Hidden Test Set", )
@@ -86,50 +93,56 @@ class SimulationCombiner(object):
 
         legend = []
 
-        for run in runs:
+        paths = [run['path'] for run in runs]
+        for path in paths:
+            self._logger.info("Opening \"%s\".", path)
+        if len(paths) > 1 and num_workers != 1:
+            with Pool(num_workers) as pool:
+                runs_data = pool.map(load_metrics, paths)
+        else:
+            runs_data = list(map(load_metrics, paths))
+
+        for run, data in zip(runs, runs_data):
             name = run['name']
-            path = run['path']
             line_dash = next(line_dashes)
-            self._logger.info("Opening \"%s\".", path)
-            with open(path) as f:
-                data = json.load(f)
-                baseline_accuracy = data['baselineAccuracy']
-                if baseline_accuracy is not None:
-                    self._logger.debug("Baseline accuracy: %s", baseline_accuracy)
-                    r = plot.ray(x=[0], y=[baseline_accuracy * 100], length=0, angle=0, line_width=2,
-                                 line_dash=line_dash,
-                                 color=next(baseline_accuracy_colors))
-                    legend.append((f"{name} accuracy when trained with all data: {baseline_accuracy * 100:0.1f}%", [r]))
-                agents: Dict[str, Agent] = dict()
-                for agent in data['agents']:
-                    agent = Agent(**agent)
-                    agents[agent.address] = agent
-                l = plot.line(x=[d['t'] for d in data['accuracies']],
-                              y=[d['accuracy'] * 100 for d in data['accuracies']],
+            metadata = data['metadata']
+            baseline_accuracy = metadata['baselineAccuracy']
+            if baseline_accuracy is not None:
+                self._logger.debug("Baseline accuracy: %s", baseline_accuracy)
+                r = plot.ray(x=[0], y=[baseline_accuracy * 100], length=0, angle=0, line_width=2,
+                             line_dash=line_dash,
+                             color=next(baseline_accuracy_colors))
+                legend.append((f"{name} accuracy when trained with all data: {baseline_accuracy * 100:0.1f}%", [r]))
+            agents = [Agent(**agent) for agent in metadata['agents']]
+            x, y = lttb(data['accuracy_t'], data['accuracy'] * 100, max_points_per_line)
+            l = plot.line(x=x, y=y,
+                          line_dash=line_dash,
+
+                          line_width=2,
+                          color=next(accuracy_colors),
+                          )
+            legend.append((f"{name} Accuracy", [l]))
+            # Group the data for each agent while keeping the order that it was recorded in.
+            order = np.argsort(data['balance_agent'], kind='stable')
+            balance_agent = data['balance_agent'][order]
+            agent_indices, starts = np.unique(balance_agent, return_index=True)
+            ends = np.append(starts[1:], len(balance_agent))
+            for agent_index, start, end in sorted(zip(agent_indices, starts, ends),
+                                                  key=lambda item: agents[item[0]].address):
+                agent = agents[agent_index]
+                if agent.good:
+                    color = next(good_colors)
+                else:
+                    color = next(bad_colors)
+                indices = order[start:end]
+                x, y = lttb(data['balance_t'][indices], data['balance'][indices] * 100 / agent.start_balance,
+                            max_points_per_line)
+                l = plot.line(x=x, y=y,
                               line_dash=line_dash,
-
                               line_width=2,
-                              color=next(accuracy_colors),
+                              color=color,
                               )
-                legend.append((f"{name} Accuracy", [l]))
-                agent_balance_data = defaultdict(list)
-                for balance_data in data['balances']:
-                    agent = balance_data['a']
-                    agent_balance_data[agent].append(
-                        (balance_data['t'], balance_data['b'] * 100 / agents[agent].start_balance))
-                for agent_id, balance_data in sorted(agent_balance_data.items(), key=itemgetter(0)):
-                    agent = agents[agent_id]
-                    if agent.good:
-                        color = next(good_colors)
-                    else:
-                        color = next(bad_colors)
-                    l = plot.line(x=list(map(itemgetter(0), balance_data)),
-                                  y=list(map(itemgetter(1), balance_data)),
-                                  line_dash=line_dash,
-                                  line_width=2,
-                                  color=color,
-                                  )
-                    legend.append((f"{name} {agent.address} Agent Balance", [l]))
+                legend.append((f"{name} {agent.address} Agent Balance", [l]))
         self._logger.info("Done going through runs.")
 
         legend = Legend(items=legend, location='center_left')
@@ -5,6 +5,7 @@ from typing import Dict
 from injector import inject, singleton
 
 from decai.simulation.contract.objects import Address
+from decai.simulation.profiling import profiled
 
 
 @inject
@@ -44,6 +45,7 @@ class Balances(object):
         assert address not in self._balances, f"'{address}' already has a balance."
         self._balances[address] = start_balance
 
+    @profiled()
     def send(self, sending_address: Address, receiving_address: Address, amount):
         """ Send funds from one participant to another. """
         assert amount >= 0
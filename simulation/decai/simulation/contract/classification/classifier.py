@@ -1,3 +1,4 @@
+import copy
 import logging
 from abc import ABC, abstractmethod
 from typing import List
@@ -54,6 +55,25 @@ class Classifier(ABC, SmartContract):
         """
         pass
 
+    def predict_batch(self, data):
+        """
+        Predict for many samples at once.
+        Implementations should override this if their model can predict for many samples faster than one at a time.
+
+        :param data: The data or features for many samples, one per row.
+        :return: The predicted classification or label for each sample in `data`.
+        """
+        return [self.predict(sample) for sample in data]
+
+    def snapshot(self) -> 'Classifier':
+        """
+        Copy the classifier so that it can be used, e.g. evaluated in another thread, while this one is updated.
+        Implementations should override this if they can avoid copying parts that don't change when updated.
+
+        :return: A copy of the classifier that is not affected by future updates to this one.
+        """
+        return copy.deepcopy(self)
+
     @abstractmethod
     def update(self, data, classification):
         """
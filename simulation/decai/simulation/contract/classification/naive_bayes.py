@@ -0,0 +1,9 @@
+from sklearn.naive_bayes import MultinomialNB
+
+from decai.simulation.contract.classification.scikit_classifier import SciKitClassifierModule
+
+
+class NaiveBayesModule(SciKitClassifierModule):
+    def __init__(self):
+        super().__init__(
+            _model_initializer=MultinomialNB)
@@ -1,3 +1,4 @@
+import copy
 import json
 import logging
 import os
@@ -18,6 +19,7 @@ from sklearn.naive_bayes import MultinomialNB
 from decai.simulation.contract.classification.classifier import Classifier
 from decai.simulation.contract.classification.ncc import NearestCentroidClassifier
 from decai.simulation.data.featuremapping.feature_index_mapper import FeatureIndexMapping
+from decai.simulation.profiling import profiled
 
 
 # Purposely not a singleton so that it is easy to get a model that has not been initialized.
@@ -36,6 +38,7 @@ class SciKitClassifier(Classifier):
     def __post_init__(self):
         self._original_model_path = Path('saved_models') / f'{time.time()}-{id(self)}.joblib'
 
+    @profiled()
     def evaluate(self, data, labels) -> float:
         assert self._model is not None, "The model has not been initialized yet."
         assert isinstance(data, np.ndarray) or scipy.sparse.isspmatrix(data), \
@@ -44,6 +47,7 @@ class SciKitClassifier(Classifier):
         self._logger.debug("Evaluating.")
         return self._model.score(data, labels)
 
+    @profiled()
     def log_evaluation_details(self, data, labels, level=logging.INFO) -> float:
         assert self._model is not None, "The model has not been initialized yet."
         assert isinstance(data, np.ndarray), "The data must be an array."
@@ -61,6 +65,7 @@ class SciKitClassifier(Classifier):
                              m, report, result * 100)
         return result
 
+    @profiled()
     def init_model(self, training_data, labels, save_model=False):
         assert self._model is None, "The model has already been initialized."
         self._logger.debug("Initializing model.")
@@ -72,21 +77,40 @@ class SciKitClassifier(Classifier):
             os.makedirs(os.path.dirname(self._original_model_path), exist_ok=True)
             joblib.dump(self._model, self._original_model_path)
 
+    @profiled()
     def predict(self, data):
         assert self._model is not None, "The model has not been initialized yet."
         assert isinstance(data, np.ndarray), "The data must be an array."
         return self._model.predict([data])[0]
 
+    @profiled()
+    def predict_batch(self, data):
+        assert self._model is not None, "The model has not been initialized yet."
+        assert isinstance(data, np.ndarray) or scipy.sparse.isspmatrix(data), \
+            f"The data must be a matrix. Got: {type(data)}"
+        return self._model.predict(data)
+
+    @profiled()
+    def snapshot(self) -> 'SciKitClassifier':
+        assert self._model is not None, "The model has not been initialized yet."
+        # Only the model changes when updating so share everything else.
+        result = copy.copy(self)
+        result._model = copy.deepcopy(self._model)
+        return result
+
+    @profiled()
     def update(self, data, classification):
         assert self._model is not None, "The model has not been initialized yet."
         self._model.partial_fit([data], [classification])
 
+    @profiled()
     def reset_model(self):
         assert self._model is not None, "The model has not been initialized yet."
         assert self._original_model_path.exists(), "The model has not been saved. Perhaps saving was disabled."
         self._logger.debug("Loading model from \"%s\".", self._original_model_path)
         self._model = joblib.load(self._original_model_path)
 
+    @profiled()
     def export(self,
                path: str,
                classifications: List[str] = None,
@@ -207,3 +207,32 @@ class TestCollaborativeTrainer(unittest.TestCase):
         m.reset_model()
         new_predictions = [m.predict(x) for x in data]
         self.assertEqual(original_predictions, new_predictions)
+
+    def test_snapshot(self):
+        inj = Injector([
+            LoggingModule,
+            PerceptronModule,
+        ])
+        m = inj.get(Classifier)
+        X = np.array([
+            [0, 0, 0],
+            [1, 1, 1],
+        ])
+        y = np.array([_ground_truth(x) for x in X])
+        m.init_model(X, y)
+        data = np.array([
+            [0, 0, 1],
+            [0, 1, 1],
+            [1, 0, 1],
+            [1, 1, 0],
+        ])
+        labels = np.array([_ground_truth(x) for x in data])
+        snapshot = m.snapshot()
+        original_predictions = snapshot.predict_batch(data).tolist()
+        self.assertEqual(m.predict_batch(data).tolist(), original_predictions)
+        for _ in range(5):
+            for x, label in zip(data, labels):
+                m.update(x, label)
+        self.assertNotEqual(original_predictions, m.predict_batch(data).tolist())
+        # The snapshot isn't affected by the updates.
+        self.assertEqual(original_predictions, snapshot.predict_batch(data).tolist())
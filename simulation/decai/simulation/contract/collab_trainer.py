@@ -7,6 +7,7 @@ from decai.simulation.contract.classification.classifier import Classifier
 from decai.simulation.contract.data.data_handler import DataHandler
 from decai.simulation.contract.incentive.incentive_mechanism import IncentiveMechanism
 from decai.simulation.contract.objects import Msg, SmartContract
+from decai.simulation.profiling import profiled
 
 
 class CollaborativeTrainer(ABC, SmartContract):
@@ -97,12 +98,14 @@ class DefaultCollaborativeTrainer(CollaborativeTrainer):
         self.im.owner = self.address
         self.model.owner = self.address
 
+    @profiled()
     def predict(self, msg: Msg, data):
         self.im.distribute_payment_for_prediction(msg.sender, msg.value)
         return self.model.predict(data)
 
     # FUNCTIONS FOR HANDLING DATA
 
+    @profiled()
     def add_data(self, msg: Msg, data, classification):
         # Consider making sure duplicate data isn't added until it's been claimed.
 
@@ -115,6 +118,7 @@ class DefaultCollaborativeTrainer(CollaborativeTrainer):
         # Here we do this at the end in case something failed while trying to add data.
         self._balances.send(msg.sender, self.address, cost)
 
+    @profiled()
     def refund(self, msg: Msg, data, classification, added_time: int):
         (claimable_amount, claimed_by_submitter, stored_data) = \
             self.data_handler.handle_refund(msg.sender, data, classification, added_time)
@@ -127,6 +131,7 @@ class DefaultCollaborativeTrainer(CollaborativeTrainer):
         # then the changes automatically get reverted.
         self.data_handler.update_claimable_amount(msg.sender, stored_data, refund_amount)
 
+    @profiled()
     def report(self, msg: Msg, data, classification, added_time: int, original_author: str):
         claimed_by_reporter, stored_data = \
             self.data_handler.handle_report(msg.sender, data, classification, added_time, original_author)
@@ -6,6 +6,7 @@ import numpy as np
 from injector import inject, singleton
 
 from decai.simulation.contract.objects import Address, RejectException, SmartContract, TimeMock
+from decai.simulation.profiling import profiled
 
 
 @dataclass
@@ -44,6 +45,7 @@ class DataHandler(SmartContract):
     def __iter__(self):
         return iter(self._added_data.items())
 
+    @profiled()
     def _get_key(self, data, classification, added_time: int, original_author: Address):
         if isinstance(data, np.ndarray):
             # The `.tolist()` isn't necessary but is faster.
@@ -52,6 +54,7 @@ class DataHandler(SmartContract):
             data = tuple(data)
         return (data, classification, added_time, original_author)
 
+    @profiled()
     def get_data(self, data, classification, added_time: int, original_author: Address) -> StoredData:
         """
         :param data: The originally submitted features.
@@ -64,6 +67,7 @@ class DataHandler(SmartContract):
         result = self._added_data.get(key)
         return result
 
+    @profiled()
     def handle_add_data(self, contributor_address: Address, cost, data, classification):
         """
         Log an attempt to add data
@@ -80,6 +84,7 @@ class DataHandler(SmartContract):
         d = StoredData(classification, current_time_s, contributor_address, cost, cost)
         self._added_data[key] = d
 
+    @profiled()
     def handle_refund(self, submitter: Address, data, classification, added_time: int) -> (float, bool, StoredData):
         """
         Log a refund attempt.
@@ -101,6 +106,7 @@ class DataHandler(SmartContract):
 
         return (claimable_amount, claimed_by_submitter, stored_data)
 
+    @profiled()
     def handle_report(self, reporter: Address, data, classification, added_time: int, original_author: Address) \
             -> (bool, StoredData):
         """
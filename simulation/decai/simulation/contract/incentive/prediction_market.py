@@ -1,5 +1,6 @@
+import logging
 import random
-from collections import Counter, defaultdict
+from collections import defaultdict
 from dataclasses import dataclass, field
 from enum import Enum
 from hashlib import sha256
@@ -8,6 +9,7 @@ from typing import Dict, List, Optional, Tuple
 
 import math
 import numpy as np
+import scipy.sparse
 from injector import ClassAssistedBuilder, inject, Module, provider, singleton
 
 from decai.simulation.contract.balances import Balances
@@ -15,6 +17,7 @@ from decai.simulation.contract.classification.classifier import Classifier
 from decai.simulation.contract.data.data_handler import StoredData
 from decai.simulation.contract.incentive.incentive_mechanism import IncentiveMechanism
 from decai.simulation.contract.objects import Address, Msg, RejectException, TimeMock
+from decai.simulation.profiling import profiled
 
 
 class MarketPhase(Enum):
@@ -43,37 +46,128 @@ class MarketPhase(Enum):
     """ The reward values have been computed and are ready to be collected. """
 
 
-@dataclass
-class _Contribution:
+class _ContributionStore(object):
     """
-    A contribution to train data.
+    The contributions to train data in a market.
+
+    The information for each contribution is stored in columns so that the rewards for a round
+    can be settled for all contributions at once.
+    Contributions are only appended and are marked inactive when they are kicked out of the reward phase
+    so the position of a contribution is the number of contributions that were added before it.
 
-    This is stored for convenience but for some applications, storing the data could be very expensive,
-    instead, hashes could be stored and during the reward phase,
-    the hash can be used to verify data as data is re-submitted.
+    The data is stored for convenience but for some applications, storing the data could be very expensive,
+    so instead, only a hash of the data can be stored and during the reward phase,
+    the hash is used to verify data as data is re-submitted.
     Note: this is not in the spirit of the prediction market (the current state should be public)
     since the model would not actually be updated and the submitted data would be private
     so new data contributors have very limited information.
     """
-    contributor_address: Address
-    data: np.array
-    classification: int
 
-    balance: int
-    """
-    Initially this is the amount deposited with this contribution.
-    If contributions are not grouped by contributor, then while calculating rewards this gets updated to be the balance
-    for this particular contribution, to know if it should get kicked out of the reward phase.
-    """
+    _INITIAL_CAPACITY = 1024
 
-    score: Optional[int] = field(default=None, init=False)
-    """
-    The score for this contribution.
-    Mainly used for when contributions are not grouped.
-    """
+    def __init__(self, store_data: bool):
+        """
+        :param store_data: `True` to store the data for each contribution, `False` to only store hashes.
+        """
+        self.contributors: List[Address] = []
+        """ The address for each contributor ID. """
+        self._contributor_ids: Dict[Address, int] = dict()
+
+        self.data: Optional[List[np.ndarray]] = [] if store_data else None
+        self._size = 0
+        self.num_active = 0
+
+        capacity = self._INITIAL_CAPACITY
+        self.contributor = np.empty(capacity, dtype=np.int32)
+        """ The ID of the contributor for each contribution. """
+        self.classification = np.empty(capacity, dtype=np.int64)
+        self.balance = np.empty(capacity, dtype=np.float64)
+        """
+        Initially this is the amount deposited with the contribution.
+        If contributions are not grouped by contributor, then while calculating rewards this gets updated to be the
+        balance for the particular contribution, to know if it should get kicked out of the reward phase.
+        """
+        self.score = np.empty(capacity, dtype=np.float64)
+        """
+        The score for each contribution.
+        Mainly used for when contributions are not grouped.
+        """
+        self.accuracy = np.empty(capacity, dtype=np.float64)
+        """ The accuracy of the model on the test set after adding the contribution or NaN if it's not known. """
+        self.active = np.empty(capacity, dtype=bool)
+        """ `False` if the contribution was kicked out of the reward phase. """
+        self.data_hash = None if store_data else np.empty((capacity, sha256().digest_size), dtype=np.uint8)
+        """ The bytes of the hash of the data for each contribution if the data is not stored. """
+
+    def __len__(self):
+        return self._size
 
-    accuracy: Optional[float] = field(default=None, init=False)
-    """ The accuracy of the model on the test set after adding this contribution. """
+    @property
+    def num_contributors(self) -> int:
+        return len(self.contributors)
+
+    def _grow(self):
+        capacity = 2 * len(self.contributor)
+        for name in ('contributor', 'classification', 'balance', 'score', 'accuracy', 'active', 'data_hash'):
+            column = getattr(self, name)
+            if column is not None:
+                new_column = np.empty((capacity,) + column.shape[1:], dtype=column.dtype)
+                new_column[:self._size] = column[:self._size]
+                setattr(self, name, new_column)
+
+    def append(self, contributor_address: Address, classification: int, balance: float,
+               data=None, data_hash: Optional[bytes] = None):
+        """
+        Add a contribution.
+
+        :param contributor_address: The address of the contributor.
+        :param classification: The label for the data.
+        :param balance: The amount deposited with the contribution.
+        :param data: The features if the data is stored.
+        :param data_hash: The hash of the features if the data is not stored.
+        """
+        if self._size == len(self.contributor):
+            self._grow()
+        contributor_id = self._contributor_ids.get(contributor_address)
+        if contributor_id is None:
+            contributor_id = self._contributor_ids[contributor_address] = len(self.contributors)
+            self.contributors.append(contributor_address)
+        i = self._size
+        self.contributor[i] = contributor_id
+        self.classification[i] = classification
+        self.balance[i] = balance
+        self.score[i] = math.nan
+        self.accuracy[i] = math.nan
+        self.active[i] = True
+        if self.data is not None:
+            self.data.append(data)
+        else:
+            self.data_hash[i] = np.frombuffer(data_hash, dtype=np.uint8)
+        self._size += 1
+        self.num_active += 1
+
+    def get_active(self) -> np.ndarray:
+        """
+        :return: The positions of the contributions that are still in the market, in the order they were added.
+        """
+        return np.flatnonzero(self.active[:self._size])
+
+    def deactivate(self, positions: np.ndarray):
+        """
+        Kick contributions out of the market.
+
+        :param positions: The positions of active contributions.
+        """
+        self.active[positions] = False
+        self.num_active -= len(positions)
+
+    def sum_by_contributor(self, positions: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """
+        :param positions: The positions of contributions.
+        :param values: A value for each contribution.
+        :return: The sum of `values` for each contributor ID.
+        """
+        return np.bincount(self.contributor[positions], weights=values, minlength=self.num_contributors)
 
 
 class PredictionMarket(IncentiveMechanism):
@@ -99,7 +193,12 @@ class PredictionMarket(IncentiveMechanism):
                  allow_greater_deposit=False,
                  group_contributions=False,
                  reset_model_during_reward_phase=False,
+                 store_data_hashes=False,
                  ):
+        """
+        :param store_data_hashes: `True` to only store a hash of the data for each contribution instead of the data.
+            The data must then be re-submitted to `process_contribution` during the reward phase.
+        """
         super().__init__(any_address_claim_wait_time_s=any_address_claim_wait_time_s)
 
         self._balances = balances
@@ -111,6 +210,7 @@ class PredictionMarket(IncentiveMechanism):
         self._allow_greater_deposit = allow_greater_deposit
         self._group_contributions = group_contributions
         self._reset_model_during_reward_phase = reset_model_during_reward_phase
+        self._store_data_hashes = store_data_hashes
 
         self._market_earliest_end_time_s = None
         self._market_balances: Dict[Address, float] = defaultdict(float)
@@ -130,6 +230,11 @@ class PredictionMarket(IncentiveMechanism):
     def reset_model_during_reward_phase(self):
         return self._reset_model_during_reward_phase
 
+    @property
+    def store_data_hashes(self):
+        return self._store_data_hashes
+
+    @profiled()
     def distribute_payment_for_prediction(self, sender, value):
         pass
 
@@ -138,16 +243,59 @@ class PredictionMarket(IncentiveMechanism):
         :return: The total number of contributions currently in the market.
             This can decrease as "bad" contributors are removed during the reward phase.
         """
-        return len(self._market_data)
+        return self._contributions.num_active
+
+    @staticmethod
+    def _as_array(a) -> np.ndarray:
+        """
+        :param a: Features or labels, possibly in a sparse matrix.
+        :return: `a` as a dense array.
+        """
+        if scipy.sparse.issparse(a):
+            return a.toarray()
+        return np.asarray(a)
+
+    @staticmethod
+    def _hash_arrays(arrays):
+        result = sha256()
+        for a in arrays:
+            # Sparse matrices are hashed like their dense form so that either can be revealed.
+            a = np.ascontiguousarray(PredictionMarket._as_array(a))
+            # Include the type and shape so that the same bytes with a different layout do not match.
+            result.update(f'{a.dtype.str}{a.shape}'.encode())
+            result.update(a.data)
+        return result
+
+    @staticmethod
+    def hash_data(data) -> bytes:
+        """
+        :param data: The features for a contribution.
+        :return: The hash of `data`.
+        """
+        return PredictionMarket._hash_arrays([data]).digest()
+
+    @property
+    def next_contribution_index(self) -> int:
+        """
+        :return: The index of the contribution that `process_contribution` will process next,
+            i.e. the number of contributions that were added before it.
+        """
+        assert self.state in (MarketPhase.REWARD, MarketPhase.REWARD_RESTART), f'Current state is: {self.state}.'
+        return self._get_next_position()
+
+    def _get_next_position(self) -> int:
+        if self.state == MarketPhase.REWARD_RESTART:
+            return int(np.argmax(self._contributions.active[:len(self._contributions)]))
+        return int(self._positions[self._next_data_index])
 
     # Methods in chronological order of the PM.
     @staticmethod
     def hash_test_set(test_set):
         """
-        :param test_set: A test set.
+        :param test_set: A test set as a tuple of the features and the labels.
         :return: The hash of `test_set`.
         """
-        return sha256(str(test_set).encode()).hexdigest()
+        return PredictionMarket._hash_arrays(test_set).hexdigest()
 
     @staticmethod
     def get_test_set_hashes(num_pieces, x_test, y_test) -> Tuple[list, list]:
@@ -160,17 +308,23 @@ class PredictionMarket(IncentiveMechanism):
         :return: tuple
             A list of `num_pieces` hashes for each portion of the test set.
             The test set divided into `num_pieces`.
+            Each portion is a tuple of views into `x_test` and `y_test`.
+            Portions of a sparse `x_test` are made dense.
         """
         test_sets = []
         test_dataset_hashes = []
-        assert len(x_test) == len(y_test) >= num_pieces
+        if not scipy.sparse.issparse(x_test):
+            x_test = np.asarray(x_test)
+        y_test = np.asarray(y_test)
+        num_samples = x_test.shape[0]
+        assert num_samples == len(y_test) >= num_pieces
         for i in range(num_pieces):
-            start = int(i / num_pieces * len(x_test))
-            end = int((i + 1) / num_pieces * len(x_test))
-            test_set = list(zip(x_test[start:end], y_test[start:end]))
+            start = int(i / num_pieces * num_samples)
+            end = int((i + 1) / num_pieces * num_samples)
+            test_set = (PredictionMarket._as_array(x_test[start:end]), y_test[start:end])
             test_sets.append(test_set)
             test_dataset_hashes.append(PredictionMarket.hash_test_set(test_set))
-        assert sum(len(t) for t in test_sets) == len(x_test)
+        assert sum(len(t[1]) for t in test_sets) == num_samples
         return test_dataset_hashes, test_sets
 
     def initialize_market(self, msg: Msg,
@@ -202,7 +356,7 @@ class PredictionMarket(IncentiveMechanism):
         if self.next_test_set_index_to_verify == self.test_reveal_index:
             self.next_test_set_index_to_verify += 1
 
-        self._market_data: List[_Contribution] = []
+        self._contributions = _ContributionStore(store_data=not self._store_data_hashes)
         self.min_num_contributions = min_num_contributions
         self._market_earliest_end_time_s = self._time() + min_length_s
 
@@ -246,10 +400,11 @@ class PredictionMarket(IncentiveMechanism):
         Verify that a portion of the test set matches the committed to hash.
 
         :param index: The index of the test set in the originally committed list of hashes.
-        :param test_set_portion: The portion of the test set to reveal.
+        :param test_set_portion: The portion of the test set to reveal as a tuple of the features and the labels.
         """
         assert 0 <= index < len(self.test_set_hashes)
-        assert len(test_set_portion) > 0
+        assert len(test_set_portion) == 2, "The portion must be a tuple of the features and the labels."
+        assert np.shape(test_set_portion[0])[0] == len(test_set_portion[1]) > 0
         test_set_hash = self.hash_test_set(test_set_portion)
         assert test_set_hash == self.test_set_hashes[index]
 
@@ -263,6 +418,7 @@ class PredictionMarket(IncentiveMechanism):
         self.verify_test_set(self.test_reveal_index, test_set_portion)
         self.state = MarketPhase.PARTICIPATION
 
+    @profiled()
     def handle_add_data(self, contributor_address: Address, msg_value: float, data, classification) -> (float, bool):
         # Allow them to stake as much as they want to ensure they get included in future rounds.
         assert self.state == MarketPhase.PARTICIPATION, f'Current state is: {self.state}.'
@@ -273,10 +429,14 @@ class PredictionMarket(IncentiveMechanism):
         else:
             cost = self.min_stake
         update_model = False
-        self._market_data.append(_Contribution(contributor_address, data, classification, cost))
+        if self._store_data_hashes:
+            self._contributions.append(contributor_address, classification, cost, data_hash=self.hash_data(data))
+        else:
+            self._contributions.append(contributor_address, classification, cost, data=data)
         self._market_balances[contributor_address] += cost
         return (cost, update_model)
 
+    @profiled()
     def end_market(self):
         """
         Signal the end of the prediction market.
@@ -289,33 +449,88 @@ class PredictionMarket(IncentiveMechanism):
         self._logger.info("Ending market.")
         self.state = MarketPhase.REVEAL_TEST_SET
         self._next_data_index = 0
-        self.test_data, self.test_labels = [], []
+        self.test_data, self.test_labels = None, None
+        self._num_test_samples = 0
 
+    def _reserve_test_set_buffer(self, num_samples: int, test_data: np.ndarray, test_labels: np.ndarray):
+        """
+        Make sure that the test set buffers can hold `num_samples` more samples.
+
+        The buffers are C-contiguous so that `evaluate` can be given views of them without copying.
+        Their types are widened if a portion has a type that can't be stored without losing information.
+        """
+        required = self._num_test_samples + num_samples
+        if self.test_data is None:
+            # Portions are usually about the same size so guess the total size from the first one.
+            num_portions_left = sum(1 for i in range(self.next_test_set_index_to_verify, len(self.test_set_hashes))
+                                    if i != self.test_reveal_index)
+            capacity = max(required, (num_samples + 1) * num_portions_left)
+            self.test_data = np.empty((capacity,) + test_data.shape[1:], dtype=test_data.dtype)
+            self.test_labels = np.empty((capacity,) + test_labels.shape[1:], dtype=test_labels.dtype)
+            return
+        data_dtype = np.result_type(self.test_data.dtype, test_data.dtype)
+        labels_dtype = np.result_type(self.test_labels.dtype, test_labels.dtype)
+        capacity = len(self.test_data)
+        if required > capacity:
+            capacity = max(required, 2 * capacity)
+        if capacity != len(self.test_data) or data_dtype != self.test_data.dtype:
+            self.test_data = self._resize_buffer(self.test_data, capacity, self._num_test_samples, data_dtype)
+        if capacity != len(self.test_labels) or labels_dtype != self.test_labels.dtype:
+            self.test_labels = self._resize_buffer(self.test_labels, capacity, self._num_test_samples, labels_dtype)
+
+    @staticmethod
+    def _resize_buffer(buffer: np.ndarray, capacity: int, num_used: int, dtype: np.dtype) -> np.ndarray:
+        result = np.empty((capacity,) + buffer.shape[1:], dtype=dtype)
+        result[:num_used] = buffer[:num_used]
+        return result
+
+    @profiled()
     def verify_next_test_set(self, test_set_portion):
+        """
+        Verify the next portion of the test set and add it to the test set used to compute rewards.
+
+        :param test_set_portion: The portion of the test set to reveal as a tuple of the features and the labels.
+        """
         assert self.state == MarketPhase.REVEAL_TEST_SET
-        self.verify_test_set(self.next_test_set_index_to_verify, test_set_portion)
-        test_data, test_labels = zip(*test_set_portion)
-        self.test_data += test_data
-        self.test_labels += test_labels
+        test_data, test_labels = map(self._as_array, test_set_portion)
+        self.verify_test_set(self.next_test_set_index_to_verify, (test_data, test_labels))
+        num_samples = len(test_labels)
+        self._reserve_test_set_buffer(num_samples, test_data, test_labels)
+        end = self._num_test_samples + num_samples
+        self.test_data[self._num_test_samples:end] = test_data
+        self.test_labels[self._num_test_samples:end] = test_labels
+        self._num_test_samples = end
         self.next_test_set_index_to_verify += 1
         if self.next_test_set_index_to_verify == self.test_reveal_index:
             self.next_test_set_index_to_verify += 1
         if self.next_test_set_index_to_verify == len(self.test_set_hashes):
             self.state = MarketPhase.REWARD_RESTART
-            self.test_data = np.array(self.test_data)
-            self.test_labels = np.array(self.test_labels)
+            # Views of the filled part of the buffers.
+            self.test_data = self.test_data[:self._num_test_samples]
+            self.test_labels = self.test_labels[:self._num_test_samples]
 
-    def process_contribution(self):
+    @profiled()
+    def process_contribution(self, data=None):
         """
         Reward Phase:
         Process the next data contribution.
+
+        :param data: The features for the next contribution, see `next_contribution_index`.
+            Required if only hashes of the data are stored, otherwise it is ignored.
         """
         assert self.remaining_bounty_rounds > 0, "The market has ended."
+        if self._store_data_hashes:
+            assert data is not None, "The data for the contribution must be re-submitted."
+            data = np.asarray(data)
+            if self.hash_data(data) != self._contributions.data_hash[self._get_next_position()].tobytes():
+                raise RejectException("The data does not match the contribution.")
 
         if self.state == MarketPhase.REWARD_RESTART:
             self._next_data_index = 0
             self._logger.debug("Remaining bounty rounds: %s", self.remaining_bounty_rounds)
-            self._scores = defaultdict(float)
+            self._positions = self._contributions.get_active()
+            # The score for each contributor ID or NaN if they have no contributions in this round.
+            self._scores = np.full(self._contributions.num_contributors, math.nan)
 
             if self._reset_model_during_reward_phase:
                 # The paper implies that we should not retrain the model and instead only train once.
@@ -333,52 +548,55 @@ class PredictionMarket(IncentiveMechanism):
                 # When calculating rewards, the score, the same accuracy for the initial model should be used.
                 self.prev_acc = self.original_acc
 
-            self._num_market_contributions: Dict[Address, int] = Counter()
-            self._worst_contribution: Optional[_Contribution] = None
-            self._worst_contributor: Optional[Address] = None
+            self._worst_contribution: Optional[int] = None
+            self._worst_contributor: Optional[int] = None
             self._min_score = math.inf
             self.state = MarketPhase.REWARD
         else:
             assert self.state == MarketPhase.REWARD
 
-        contribution = self._market_data[self._next_data_index]
-        self._num_market_contributions[contribution.contributor_address] += 1
-        self.model.update(contribution.data, contribution.classification)
-        if not self._reset_model_during_reward_phase and contribution.accuracy is None:
+        contributions = self._contributions
+        position = self._positions[self._next_data_index]
+        contributor = contributions.contributor[position]
+        if contributions.data is not None:
+            data = contributions.data[position]
+        self.model.update(data, contributions.classification[position])
+        if not self._reset_model_during_reward_phase and math.isnan(contributions.accuracy[position]):
             # XXX Potentially expensive gas cost.
-            contribution.accuracy = self.model.evaluate(self.test_data, self.test_labels)
+            contributions.accuracy[position] = self.model.evaluate(self.test_data, self.test_labels)
 
         self._next_data_index += 1
-        iterated_through_all_contributions = self._next_data_index >= self.get_num_contributions_in_market()
+        iterated_through_all_contributions = self._next_data_index >= len(self._positions)
 
         if iterated_through_all_contributions \
                 or not self._group_contributions \
-                or self._market_data[self._next_data_index].contributor_address != contribution.contributor_address:
+                or contributions.contributor[self._positions[self._next_data_index]] != contributor:
             # Need to compute score.
 
             if self._reset_model_during_reward_phase:
                 # XXX Potentially expensive gas cost.
                 acc = self.model.evaluate(self.test_data, self.test_labels)
             else:
-                acc = contribution.accuracy
+                acc = contributions.accuracy[position]
 
             score_change = acc - self.prev_acc
             if self._group_contributions:
-                new_score = self._scores[contribution.contributor_address] = \
-                    self._scores[contribution.contributor_address] + score_change
+                if math.isnan(self._scores[contributor]):
+                    self._scores[contributor] = 0
+                new_score = self._scores[contributor] = self._scores[contributor] + score_change
             else:
-                new_score = contribution.score = score_change
+                new_score = contributions.score[position] = score_change
 
             if new_score < self._min_score:
                 self._min_score = new_score
                 if self._group_contributions:
-                    self._worst_contributor = contribution.contributor_address
+                    self._worst_contributor = contributor
                 else:
-                    self._worst_contribution = contribution
-            elif self._group_contributions and self._worst_contributor == contribution.contributor_address:
+                    self._worst_contribution = position
+            elif self._group_contributions and self._worst_contributor == contributor:
                 # Their score increased, they might not be the worst anymore.
-                # Optimize: use a heap.
-                self._worst_contributor, self._min_score = min(self._scores.items(), key=lambda x: x[1])
+                self._worst_contributor = int(np.nanargmin(self._scores))
+                self._min_score = self._scores[self._worst_contributor]
 
             self.prev_acc = acc
             if iterated_through_all_contributions:
@@ -386,9 +604,10 @@ class PredictionMarket(IncentiveMechanism):
                 self._logger.debug("Minimum score: %.2f", self._min_score)
                 if self._min_score < 0:
                     if self._group_contributions:
-                        num_rounds = self._market_balances[self._worst_contributor] / -self._min_score
+                        worst_address = contributions.contributors[self._worst_contributor]
+                        num_rounds = self._market_balances[worst_address] / -self._min_score
                     else:
-                        num_rounds = self._worst_contribution.balance / -self._min_score
+                        num_rounds = contributions.balance[self._worst_contribution] / -self._min_score
 
                     if num_rounds > self.remaining_bounty_rounds:
                         num_rounds = self.remaining_bounty_rounds
@@ -399,25 +618,26 @@ class PredictionMarket(IncentiveMechanism):
                     if self.remaining_bounty_rounds == 0:
                         self._end_reward_phase(num_rounds)
                     else:
+                        positions = self._positions
                         if self._group_contributions:
-                            participants_to_remove = set()
-                            for participant, score in self._scores.items():
-                                self._logger.debug("Score for \"%s\": %.2f", participant, score)
-                                self._market_balances[participant] += score * num_rounds
-                                if self._market_balances[participant] < self._num_market_contributions[participant]:
-                                    # They don't have enough left to stake next time.
-                                    participants_to_remove.add(participant)
-                            self._market_data: List[_Contribution] = list(
-                                filter(lambda c: c.contributor_address not in participants_to_remove,
-                                       self._market_data))
+                            participants = np.flatnonzero(~np.isnan(self._scores))
+                            market_balances = self._update_market_balances(
+                                participants, self._scores[participants] * num_rounds)
+                            num_market_contributions = np.bincount(contributions.contributor[positions],
+                                                                   minlength=contributions.num_contributors)
+                            # Remove participants that don't have enough left to stake next time.
+                            participants_to_remove = participants[
+                                market_balances < num_market_contributions[participants]]
+                            kicked_out = positions[np.isin(contributions.contributor[positions],
+                                                           participants_to_remove)]
                         else:
-                            for contribution in self._market_data:
-                                contribution.balance += contribution.score * num_rounds
-                                if contribution.balance < 1:
-                                    # Contribution is going to get kicked out.
-                                    self._market_balances[contribution.contributor_address] += contribution.balance
-                            self._market_data: List[_Contribution] = \
-                                list(filter(lambda c: c.balance >= 1, self._market_data))
+                            contributions.balance[positions] += contributions.score[positions] * num_rounds
+                            kicked_out = positions[contributions.balance[positions] < 1]
+                            # Contributions that are getting kicked out keep what's left of their balance.
+                            totals = contributions.sum_by_contributor(kicked_out, contributions.balance[kicked_out])
+                            contributors = np.unique(contributions.contributor[kicked_out])
+                            self._update_market_balances(contributors, totals[contributors])
+                        contributions.deactivate(kicked_out)
                         if self.get_num_contributions_in_market() == 0:
                             self.state = MarketPhase.REWARD_COLLECT
                             self.remaining_bounty_rounds = 0
@@ -429,6 +649,24 @@ class PredictionMarket(IncentiveMechanism):
                     self.remaining_bounty_rounds = 0
                     self._end_reward_phase(num_rounds)
 
+    def _update_market_balances(self, contributor_ids: np.ndarray, amounts: np.ndarray) -> np.ndarray:
+        """
+        Add to the balances in the market for several contributors.
+
+        :param contributor_ids: The IDs of the contributors.
+        :param amounts: The amount to add for each contributor.
+        :return: The new balance in the market for each contributor.
+        """
+        result = np.empty(len(contributor_ids))
+        debug = self._logger.isEnabledFor(logging.DEBUG)
+        for i, (contributor_id, amount) in enumerate(zip(contributor_ids.tolist(), amounts.tolist())):
+            address = self._contributions.contributors[contributor_id]
+            if debug and self._group_contributions:
+                self._logger.debug("Score for \"%s\": %.2f", address, self._scores[contributor_id])
+            self._market_balances[address] += amount
+            result[i] = self._market_balances[address]
+        return result
+
     def _end_reward_phase(self, num_rounds):
         """
         Distribute rewards.
@@ -439,17 +677,19 @@ class PredictionMarket(IncentiveMechanism):
                            num_rounds)
         self.reward_phase_end_time_s = self._time()
         self.state = MarketPhase.REWARD_COLLECT
+        contributions = self._contributions
         if self._group_contributions:
-            for participant, score in self._scores.items():
-                self._logger.debug("Score for \"%s\": %.2f", participant, score)
-                self._market_balances[participant] += score * num_rounds
+            participants = np.flatnonzero(~np.isnan(self._scores))
+            self._update_market_balances(participants, self._scores[participants] * num_rounds)
         else:
-            for contribution in self._market_data:
-                self._market_balances[contribution.contributor_address] += \
-                    contribution.score * num_rounds
+            positions = self._positions
+            totals = contributions.sum_by_contributor(positions, contributions.score[positions] * num_rounds)
+            contributors = np.unique(contributions.contributor[positions])
+            self._update_market_balances(contributors, totals[contributors])
 
-        self._market_data = []
+        contributions.deactivate(contributions.get_active())
 
+    @profiled()
     def handle_refund(self, submitter: Address, stored_data: StoredData,
                       claimable_amount: float, claimed_by_submitter: bool,
                       prediction) -> float:
@@ -463,6 +703,7 @@ class PredictionMarket(IncentiveMechanism):
             result = 0
         return result
 
+    @profiled()
     def handle_report(self, reporter: Address, stored_data: StoredData, claimed_by_reporter: bool, prediction) -> float:
         assert self.state == MarketPhase.REWARD_COLLECT, "The reward phase has not finished processing contributions."
         assert self.remaining_bounty_rounds == 0
@@ -483,6 +724,7 @@ class PredictionMarketImModule(Module):
     allow_greater_deposit: bool = field(default=False)
     group_contributions: bool = field(default=False)
     reset_model_during_reward_phase: bool = field(default=False)
+    store_data_hashes: bool = field(default=False)
 
     @provider
     @singleton
@@ -491,4 +733,5 @@ class PredictionMarketImModule(Module):
             allow_greater_deposit=self.allow_greater_deposit,
             group_contributions=self.group_contributions,
             reset_model_during_reward_phase=self.reset_model_during_reward_phase,
+            store_data_hashes=self.store_data_hashes,
         )
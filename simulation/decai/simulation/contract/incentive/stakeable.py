@@ -8,6 +8,7 @@ from decai.simulation.contract.balances import Balances
 from decai.simulation.contract.data.data_handler import StoredData
 from decai.simulation.contract.incentive.incentive_mechanism import IncentiveMechanism
 from decai.simulation.contract.objects import Address, RejectException, TimeMock
+from decai.simulation.profiling import profiled
 
 
 @singleton
@@ -45,6 +46,7 @@ class Stakeable(IncentiveMechanism):
         self.total_num_good_data = 0
         self._last_update_time_s = int(self._time())
 
+    @profiled()
     def distribute_payment_for_prediction(self, sender, value):
         if value > 0:
             for agent_address, num_good in self.num_good_data_per_user.items():
@@ -77,6 +79,7 @@ class Stakeable(IncentiveMechanism):
             result = 1
         return result
 
+    @profiled()
     def handle_add_data(self, contributor_address: Address, msg_value: float, data, classification) -> (float, bool):
         cost = self.get_next_add_data_cost(data, classification)
         update_model = True
@@ -85,6 +88,7 @@ class Stakeable(IncentiveMechanism):
         self._last_update_time_s = self._time()
         return (cost, update_model)
 
+    @profiled()
     def handle_refund(self, submitter: str, stored_data: StoredData,
                       claimable_amount: float, claimed_by_submitter: bool,
                       prediction) -> float:
@@ -109,6 +113,7 @@ class Stakeable(IncentiveMechanism):
 
         return result
 
+    @profiled()
     def handle_report(self, reporter: str, stored_data: StoredData, claimed_by_reporter: bool, prediction) -> float:
         if stored_data.claimable_amount <= 0:
             raise RejectException("There is no reward left to claim.")
@@ -1,7 +1,10 @@
+import random
 import unittest
 from collections import defaultdict
 from typing import cast
 
+import numpy as np
+import scipy.sparse
 from injector import Injector
 
 from decai.simulation.contract.balances import Balances
@@ -10,7 +13,7 @@ from decai.simulation.contract.data.data_handler import StoredData
 from decai.simulation.contract.incentive.incentive_mechanism import IncentiveMechanism
 from decai.simulation.contract.incentive.prediction_market import MarketPhase, \
     PredictionMarket, PredictionMarketImModule
-from decai.simulation.contract.objects import Msg, TimeMock
+from decai.simulation.contract.objects import Msg, RejectException, TimeMock
 from decai.simulation.data.data_loader import DataLoader
 from decai.simulation.data.simple_data_loader import SimpleDataModule
 from decai.simulation.logging_module import LoggingModule
@@ -399,3 +402,143 @@ class TestPredictionMarket(unittest.TestCase):
         self.assertEqual(initial_good_balance - total_deposits[good_contributor_address],
                          balances[good_contributor_address],
                          "The good contributor should lose all of their deposits.")
+
+    def test_verify_test_set(self):
+        inj = Injector([
+            SimpleDataModule,
+            LoggingModule,
+            PerceptronModule,
+            PredictionMarketImModule,
+        ])
+        balances = inj.get(Balances)
+        im = cast(PredictionMarket, inj.get(IncentiveMechanism))
+        im.owner = 'owner'
+
+        initializer_address = 'initializer'
+        total_bounty = 1_000
+        balances.initialize(initializer_address, total_bounty)
+
+        # Uneven portions so that the buffer has to grow.
+        x_test = np.arange(2 * 23, dtype=np.float32).reshape(23, 2)
+        y_test = np.arange(23, dtype=np.int8) % 2
+        test_sets = [(x_test[:2], y_test[:2]), (x_test[2:4], y_test[2:4]), (x_test[4:], y_test[4:])]
+        test_dataset_hashes = [im.hash_test_set(t) for t in test_sets]
+
+        test_reveal_index = im.initialize_market(Msg(initializer_address, total_bounty), test_dataset_hashes,
+                                                 min_length_s=0, min_num_contributions=0)
+        im.reveal_init_test_set(test_sets[test_reveal_index])
+        im.end_market()
+
+        tampered_x, tampered_y = test_sets[im.next_test_set_index_to_verify]
+        with self.assertRaises(AssertionError):
+            im.verify_next_test_set((tampered_x, 1 - tampered_y))
+
+        for i, test_set_portion in enumerate(test_sets):
+            if i != test_reveal_index:
+                im.verify_next_test_set(test_set_portion)
+        self.assertEqual(MarketPhase.REWARD_RESTART, im.state)
+
+        expected_x = np.concatenate([t[0] for i, t in enumerate(test_sets) if i != test_reveal_index])
+        expected_y = np.concatenate([t[1] for i, t in enumerate(test_sets) if i != test_reveal_index])
+        np.testing.assert_array_equal(expected_x, im.test_data)
+        np.testing.assert_array_equal(expected_y, im.test_labels)
+        self.assertEqual(x_test.dtype, im.test_data.dtype)
+        self.assertEqual(y_test.dtype, im.test_labels.dtype)
+        self.assertTrue(im.test_data.flags.c_contiguous)
+        self.assertTrue(im.test_labels.flags.c_contiguous)
+
+    def test_verify_sparse_test_set(self):
+        inj = Injector([
+            SimpleDataModule,
+            LoggingModule,
+            PerceptronModule,
+            PredictionMarketImModule,
+        ])
+        balances = inj.get(Balances)
+        im = cast(PredictionMarket, inj.get(IncentiveMechanism))
+        im.owner = 'owner'
+
+        initializer_address = 'initializer'
+        total_bounty = 1_000
+        balances.initialize(initializer_address, total_bounty)
+
+        x_test = np.eye(9, 4, dtype=np.int8)
+        y_test = np.arange(9) % 2
+        dense_hashes, dense_test_sets = im.get_test_set_hashes(3, x_test, y_test)
+        sparse_hashes, sparse_test_sets = im.get_test_set_hashes(3, scipy.sparse.csr_matrix(x_test), y_test)
+        self.assertEqual(dense_hashes, sparse_hashes)
+        self.assertEqual(len(set(sparse_hashes)), len(sparse_hashes))
+        for (x, _), (dense_x, _) in zip(sparse_test_sets, dense_test_sets):
+            np.testing.assert_array_equal(dense_x, x)
+
+        # Later portions have wider types so the buffer has to be widened instead of casting them.
+        test_sets = [(x.astype(dtype) / 2 if dtype == np.float64 else x.astype(dtype), y)
+                     for (x, y), dtype in zip(dense_test_sets, [np.int8, np.int32, np.float64])]
+        test_dataset_hashes = [im.hash_test_set(t) for t in test_sets]
+        test_reveal_index = im.initialize_market(Msg(initializer_address, total_bounty), test_dataset_hashes,
+                                                 min_length_s=0, min_num_contributions=0)
+        im.reveal_init_test_set(test_sets[test_reveal_index])
+        im.end_market()
+        for i, (x, y) in enumerate(test_sets):
+            if i != test_reveal_index:
+                im.verify_next_test_set((scipy.sparse.csr_matrix(x), y))
+        self.assertEqual(MarketPhase.REWARD_RESTART, im.state)
+        expected_x = np.concatenate([x for i, (x, _) in enumerate(test_sets) if i != test_reveal_index])
+        self.assertEqual(expected_x.dtype, im.test_data.dtype)
+        np.testing.assert_array_equal(expected_x, im.test_data)
+
+    def test_data_hashes(self):
+        def run_market(store_data_hashes: bool):
+            inj = Injector([
+                SimpleDataModule,
+                LoggingModule,
+                PerceptronModule,
+                PredictionMarketImModule(store_data_hashes=store_data_hashes),
+            ])
+            balances = inj.get(Balances)
+            im = cast(PredictionMarket, inj.get(IncentiveMechanism))
+            im.owner = 'owner'
+            balances.initialize('initializer', 1_000)
+            contributors = ['good', 'bad']
+            for contributor in contributors:
+                balances.initialize(contributor, 100)
+
+            (x_train, y_train), (x_test, y_test) = inj.get(DataLoader).load_data()
+            init_idx = 4
+            im.model.init_model(x_train[:init_idx], y_train[:init_idx], save_model=True)
+            test_dataset_hashes, test_sets = im.get_test_set_hashes(3, x_test, y_test)
+            # Reveal the same portion of the test set in both markets.
+            random.seed(1)
+            test_reveal_index = im.initialize_market(Msg('initializer', 1_000), test_dataset_hashes,
+                                                     min_length_s=0, min_num_contributions=0)
+            im.reveal_init_test_set(test_sets[test_reveal_index])
+
+            sample_indices = []
+            for i in range(init_idx, len(x_train)):
+                contributor = contributors[i % 2]
+                classification = y_train[i] if contributor == 'good' else 1 - y_train[i]
+                cost, _ = im.handle_add_data(contributor, 1, x_train[i], classification)
+                balances.send(contributor, im.owner, cost)
+                sample_indices.append(i)
+            if store_data_hashes:
+                self.assertIsNone(im._contributions.data)
+
+            im.end_market()
+            for i, test_set_portion in enumerate(test_sets):
+                if i != test_reveal_index:
+                    im.verify_next_test_set(test_set_portion)
+            if store_data_hashes:
+                with self.assertRaises(AssertionError):
+                    im.process_contribution()
+                with self.assertRaises(RejectException):
+                    im.process_contribution(x_train[sample_indices[im.next_contribution_index]] + 1)
+            while im.remaining_bounty_rounds > 0:
+                im.process_contribution(x_train[sample_indices[im.next_contribution_index]])
+
+            for contributor in contributors:
+                # noinspection PyTypeChecker
+                balances.send(im.owner, contributor, im.handle_refund(contributor, None, 0, False, None))
+            return balances.get_all()
+
+        expected = run_market(store_data_hashes=False)
+        self.assertEqual(expected, run_market(store_data_hashes=True))
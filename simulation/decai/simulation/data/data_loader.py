@@ -1,5 +1,117 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse
+
+
+class SampleStream(object):
+    """
+    Training samples that are read one at a time from chunks.
+
+    Only the current chunk is kept so the memory used is bounded by the size of the chunks
+    instead of the size of the dataset.
+    Sparse chunks are made dense when they are read since models are updated with dense samples.
+    """
+
+    def __init__(self, chunks: Iterable[Tuple[Any, np.ndarray]], num_samples: Optional[int] = None):
+        """
+        :param chunks: The features and labels for each chunk of samples.
+        :param num_samples: The total number of samples in all of the chunks, if it is known.
+        """
+        self.num_samples = num_samples
+        self.num_read = 0
+        """ The number of samples that have been read. """
+
+        self._chunks: Iterator[Tuple[Any, np.ndarray]] = iter(chunks)
+        self._x: Optional[np.ndarray] = None
+        self._y: Optional[np.ndarray] = None
+        self._index = 0
+
+    @classmethod
+    def from_arrays(cls, x, y, chunk_size: Optional[int] = None) -> 'SampleStream':
+        """
+        :param x: The features of all of the samples.
+        :param y: The labels of all of the samples.
+        :param chunk_size: The number of samples to make dense at a time if `x` is sparse.
+            Defaults to all of them.
+        :return: A stream of the samples.
+        """
+        num_samples = x.shape[0]
+        if chunk_size is None or chunk_size >= num_samples:
+            return cls([(x, y)], num_samples)
+        return cls(((x[start:start + chunk_size], y[start:start + chunk_size])
+                    for start in range(0, num_samples, chunk_size)),
+                   num_samples)
+
+    @property
+    def num_remaining(self) -> Optional[int]:
+        """
+        :return: The number of samples that have not been read, if the total number of samples is known.
+        """
+        if self.num_samples is None:
+            return None
+        return self.num_samples - self.num_read
+
+    def _ensure_chunk(self) -> bool:
+        """
+        Read chunks until there is an unread sample in the current chunk.
+
+        :return: `True` if there is another sample, `False` if all of the samples have been read.
+        """
+        while self._y is None or self._index >= len(self._y):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._x, self._y = None, None
+                return False
+            x, y = chunk
+            if scipy.sparse.issparse(x):
+                x = x.toarray()
+            self._x, self._y = x, np.asarray(y)
+            self._index = 0
+        return True
+
+    def has_next(self) -> bool:
+        """
+        :return: `True` if there is another sample, `False` if all of the samples have been read.
+        """
+        return self._ensure_chunk()
+
+    def peek(self) -> Tuple[np.ndarray, Any]:
+        """
+        :return: The features and label of the next sample without reading it.
+            The features are a copy so that they don't keep the chunk in memory.
+        """
+        assert self._ensure_chunk(), "There are no more samples."
+        return self._x[self._index].copy(), self._y[self._index]
+
+    def advance(self):
+        """
+        Mark the next sample as read.
+        """
+        assert self._ensure_chunk(), "There are no more samples."
+        self._index += 1
+        self.num_read += 1
+
+    def read(self, num_samples: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Read several samples at once, e.g. to initialize a model.
+
+        :param num_samples: The maximum number of samples to read.
+        :return: The features and labels of the samples that were read.
+        """
+        xs, ys = [], []
+        remaining = num_samples
+        while remaining > 0 and self._ensure_chunk():
+            end = min(self._index + remaining, len(self._y))
+            xs.append(self._x[self._index:end])
+            ys.append(self._y[self._index:end])
+            remaining -= end - self._index
+            self.num_read += end - self._index
+            self._index = end
+        if len(xs) == 0:
+            return np.empty((0,)), np.empty((0,))
+        return np.concatenate(xs), np.concatenate(ys)
 
 
 class DataLoader(ABC):
@@ -20,3 +132,18 @@ class DataLoader(ABC):
         :return: Training Data, Test Data: (x_train, y_train), (x_test, y_test)
         """
         pass
+
+    def load_data_stream(self, train_size: int = None, test_size: int = None, chunk_size: int = 10_000) \
+            -> Tuple[SampleStream, tuple]:
+        """
+        Load the training data lazily for datasets that might not fit in memory.
+
+        By default, all of the data is loaded with `load_data`.
+        Loaders that can read or generate their training data in parts should override this.
+
+        :param chunk_size: The number of training samples to load at a time.
+            Loaders that produce data in fixed chunks might use their own size.
+        :return: Training Data, Test Data: stream, (x_test, y_test)
+        """
+        (x_train, y_train), test = self.load_data(train_size=train_size, test_size=test_size)
+        return SampleStream.from_arrays(x_train, y_train, chunk_size), test
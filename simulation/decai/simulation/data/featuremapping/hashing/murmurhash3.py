@@ -1,5 +1,5 @@
 import mmh3
-from injector import Module
+from injector import Module, singleton
 
 from decai.simulation.data.featuremapping.hashing.token_hash import TokenHash
 
@@ -12,4 +12,5 @@ class MurmurHash3(TokenHash):
 
 class MurmurHash3Module(Module):
     def configure(self, binder):
-        binder.bind(TokenHash, to=MurmurHash3)
+        # Use a singleton so that remembered hashes are shared.
+        binder.bind(TokenHash, to=MurmurHash3, scope=singleton)
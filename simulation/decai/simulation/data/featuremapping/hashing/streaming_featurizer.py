@@ -0,0 +1,181 @@
+import heapq
+import re
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from decai.simulation.data.featuremapping.hashing.token_hash import TokenHash
+
+_WHITESPACE = re.compile(r'\s+')
+
+NUM_HASH_FEATURES = 1 << 32
+""" Hashes are unsigned 32-bit integers. """
+
+
+def tokenize_like_demo(text: str) -> List[str]:
+    """
+    Tokenize the same way as the JavaScript demo: `query.toLocaleLowerCase('en').split(/\\s+/)`.
+    Like in JavaScript, text that starts or ends with whitespace gives an empty token.
+    """
+    return _WHITESPACE.split(text.lower())
+
+
+class SpaceSaving(object):
+    """
+    Approximate counts of the most frequent items in a stream using bounded memory.
+
+    An implementation of the Space-Saving algorithm from "Efficient Computation of Frequent and Top-k Elements
+    in Data Streams" by Metwally et al. that is updated with batches of exact counts.
+    Any item with a true count more than N / `capacity`, where N is the total count, is guaranteed to be kept.
+    Counts can only be over-estimated and by at most `errors[item]`.
+    """
+
+    def __init__(self, capacity: int):
+        """
+        :param capacity: The maximum number of items to keep track of.
+        """
+        assert capacity > 0
+        self.capacity = capacity
+        self.counts: Dict[int, int] = dict()
+        self.errors: Dict[int, int] = dict()
+
+    def update(self, counts: Mapping[int, int]):
+        """
+        :param counts: Exact counts of items in a batch.
+        """
+        # Items that were not tracked could have been seen up to the minimum tracked count times.
+        floor = min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+        for item, count in counts.items():
+            current = self.counts.get(item)
+            if current is not None:
+                self.counts[item] = current + count
+            else:
+                self.counts[item] = count + floor
+                self.errors[item] = floor
+        if len(self.counts) > self.capacity:
+            kept = heapq.nlargest(self.capacity, self.counts.items(), key=lambda item_count: item_count[1])
+            self.counts = dict(kept)
+            self.errors = {item: self.errors[item] for item in self.counts}
+
+    def top(self, k: int) -> List[Tuple[int, int]]:
+        """
+        :param k: The number of items to get.
+        :return: Up to `k` items and their estimated counts, most frequent first. Ties are sorted by item.
+        """
+        return heapq.nsmallest(k, self.counts.items(), key=lambda item_count: (-item_count[1], item_count[0]))
+
+
+class StreamingHashingFeaturizer(object):
+    """
+    Featurizes texts the same way as the JavaScript demo:
+    texts are tokenized by whitespace and each token's hash is its feature index.
+
+    Approximate counts of the most frequent hashes are kept with a heavy hitters sketch during a counting pass.
+    A second pass emits the rows for each chunk of texts with only the top features
+    so the texts and the counts for all of the hashes never need to be in memory at once.
+    """
+
+    def __init__(self,
+                 token_hash: TokenHash,
+                 max_num_features: int,
+                 sketch_capacity: Optional[int] = None,
+                 chunk_size: int = 1000):
+        """
+        :param token_hash: Hashes tokens. Should be `MurmurHash3` to be consistent with the demo.
+        :param max_num_features: The number of top features to select.
+        :param sketch_capacity: The number of hashes to track counts for.
+            Larger values give more accurate top features. Defaults to 10 times `max_num_features`.
+        :param chunk_size: The number of texts to hash at once and the number of rows in each emitted matrix.
+        """
+        assert max_num_features > 0
+        assert chunk_size > 0
+        self._token_hash = token_hash
+        self.max_num_features = max_num_features
+        self.sketch = SpaceSaving(sketch_capacity or 10 * max_num_features)
+        self.chunk_size = chunk_size
+
+    def _chunks(self, texts: Iterable[str]) -> Iterator[List[str]]:
+        chunk = []
+        for text in texts:
+            chunk.append(text)
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if len(chunk) > 0:
+            yield chunk
+
+    def _hash_chunk(self, texts: List[str]) -> Tuple[np.ndarray, List[int]]:
+        """
+        :return: The hash of each token in the texts and the number of tokens in each text.
+        """
+        tokens = []
+        row_lengths = []
+        for text in texts:
+            text_tokens = tokenize_like_demo(text)
+            tokens.extend(text_tokens)
+            row_lengths.append(len(text_tokens))
+        return np.array(self._token_hash.hash_many(tokens), dtype=np.int64), row_lengths
+
+    def count(self, texts: Iterable[str]):
+        """
+        Count features in the texts to help select the top features.
+        Only the sketch is kept so `texts` can be a stream that is too large to fit in memory.
+
+        :param texts: The texts to count features in. Should be the training data.
+        """
+        for chunk in self._chunks(texts):
+            columns, _ = self._hash_chunk(chunk)
+            unique_columns, counts = np.unique(columns, return_counts=True)
+            self.sketch.update(dict(zip(unique_columns.tolist(), counts.tolist())))
+
+    def featurize(self, texts: Iterable[str], features: Optional[np.ndarray] = None) -> Iterator[csr_matrix]:
+        """
+        Featurize texts without changing the counts.
+
+        :param texts: The texts to featurize. Can be a stream that is too large to fit in memory.
+        :param features: The sorted hashes to keep. Defaults to `top_features()`.
+        :return: Matrices of feature counts for each chunk of texts with one row per text.
+            Columns are the hashes of the tokens and only the columns for `features` have values.
+        """
+        if features is None:
+            features = self.top_features()
+        for chunk in self._chunks(texts):
+            columns, row_lengths = self._hash_chunk(chunk)
+            rows = np.repeat(np.arange(len(chunk)), row_lengths)
+            # Duplicate tokens in a text are summed to get counts.
+            result = csr_matrix((np.ones(len(columns), dtype=np.int64), (rows, columns)),
+                                shape=(len(chunk), NUM_HASH_FEATURES))
+            result.sum_duplicates()
+            yield self.select(result, features)
+
+    def fit_featurize(self, texts: Iterable[str]) -> Iterator[csr_matrix]:
+        """
+        Count the features in the texts and then featurize them with the top features.
+
+        :param texts: The training data. This is iterated over twice so it cannot be an iterator.
+        :return: See `featurize`.
+        """
+        assert iter(texts) is not texts, "The texts need to be iterated over twice."
+        self.count(texts)
+        return self.featurize(texts, self.top_features())
+
+    def top_features(self) -> np.ndarray:
+        """
+        :return: The hashes of the most frequent features counted so far, sorted.
+        """
+        return np.sort(np.array([h for h, _ in self.sketch.top(self.max_num_features)], dtype=np.int64))
+
+    @staticmethod
+    def select(matrix: csr_matrix, features: np.ndarray) -> csr_matrix:
+        """
+        :param matrix: Feature counts with the hashes as columns.
+        :param features: The sorted hashes to keep such as from `top_features`.
+        :return: `matrix` with the other features removed. Kept features stay in the same column.
+        """
+        positions = np.searchsorted(features, matrix.indices)
+        positions[positions == len(features)] = 0
+        keep = features[positions] == matrix.indices if len(features) > 0 \
+            else np.zeros(len(matrix.indices), dtype=bool)
+        indptr = np.concatenate([[0], np.cumsum(keep)])[matrix.indptr]
+        return csr_matrix((matrix.data[keep], matrix.indices[keep], indptr), shape=matrix.shape)
@@ -14,3 +14,10 @@ class TestMurmurHash3(unittest.TestCase):
         assert h == 318325784
 
         assert self.h.hash("blockchain") == 3905957473
+
+    def test_hash_many(self):
+        h = MurmurHash3(max_cache_size=2)
+        self.assertEqual([318325784, 3905957473, 318325784, self.h.hash("you")],
+                         h.hash_many(["hey", "blockchain", "hey", "you"]))
+        # Only the first tokens are remembered.
+        self.assertEqual({"hey": 318325784, "blockchain": 3905957473}, h._cache)
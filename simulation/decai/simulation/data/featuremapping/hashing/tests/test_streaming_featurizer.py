@@ -0,0 +1,66 @@
+import random
+import unittest
+from collections import Counter
+
+import numpy as np
+
+from decai.simulation.data.featuremapping.hashing.murmurhash3 import MurmurHash3
+from decai.simulation.data.featuremapping.hashing.streaming_featurizer import SpaceSaving, \
+    StreamingHashingFeaturizer, tokenize_like_demo
+
+
+class TestStreamingHashingFeaturizer(unittest.TestCase):
+    def test_tokenize(self):
+        self.assertEqual(['hey', 'you', 'hey'], tokenize_like_demo("Hey  you\tHEY"))
+        # Same as `" hey ".split(/\s+/)` in JavaScript.
+        self.assertEqual(['', 'hey', ''], tokenize_like_demo(" hey "))
+
+    def test_space_saving(self):
+        r = random.Random(0xDeCA10B)
+        stream = [r.choice([0, 0, 1]) for _ in range(1000)] + list(range(2, 1002))
+        r.shuffle(stream)
+        expected = Counter(stream)
+        s = SpaceSaving(capacity=10)
+        for start in range(0, len(stream), 100):
+            s.update(Counter(stream[start:start + 100]))
+        (first, first_count), (second, second_count) = s.top(2)
+        self.assertEqual([0, 1], [first, second])
+        for item, count in [(first, first_count), (second, second_count)]:
+            self.assertGreaterEqual(count, expected[item])
+            self.assertLessEqual(count - s.errors[item], expected[item])
+
+    def test_featurize(self):
+        h = MurmurHash3()
+        f = StreamingHashingFeaturizer(h, max_num_features=2, chunk_size=2)
+        texts = ["hey you", "hey blockchain hey", "you hey"]
+        chunks = list(f.fit_featurize(texts))
+        self.assertEqual([(2, 1 << 32), (1, 1 << 32)], [c.shape for c in chunks])
+        top = f.top_features()
+        self.assertEqual(sorted([h.hash("hey"), h.hash("you")]), top.tolist())
+        # Only the top features are kept.
+        self.assertEqual(2, chunks[0][1, 318325784])
+        self.assertEqual(0, chunks[0][1, 3905957473])
+        self.assertEqual(3, chunks[0].nnz)
+        self.assertEqual(2, chunks[1].nnz)
+
+        # The texts need to be counted before they are featurized.
+        with self.assertRaises(AssertionError):
+            f.fit_featurize(iter(texts))
+
+        # Test data shouldn't change the counts.
+        chunks = list(f.featurize(["blockchain"] * 10))
+        self.assertEqual(top.tolist(), f.top_features().tolist())
+        self.assertEqual(0, sum(c.nnz for c in chunks))
+
+    def test_select(self):
+        h = MurmurHash3()
+        f = StreamingHashingFeaturizer(h, max_num_features=1)
+        f.count(["hey you", "hey blockchain hey"])
+        top = f.top_features()
+        self.assertEqual([h.hash("hey")], top.tolist())
+        all_features = np.array(sorted(h.hash_many(["hey", "you", "blockchain"])), dtype=np.int64)
+        chunk, = f.featurize(["hey blockchain hey"], all_features)
+        self.assertEqual(2, chunk.nnz)
+        selected = f.select(chunk, top)
+        self.assertEqual(2, selected[0, h.hash("hey")])
+        self.assertEqual(1, selected.nnz)
@@ -1,12 +1,40 @@
 from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List
 
 
 class TokenHash(ABC):
     """
     Hashes token to unsigned integers.
     Useful for sparse representation.
+
+    `hash_many` remembers the hashes of tokens so that tokens that appear often are only hashed once.
     """
 
+    def __init__(self, max_cache_size: int = 1_000_000):
+        """
+        :param max_cache_size: The maximum number of hashes to remember.
+        """
+        assert max_cache_size >= 0
+        self._max_cache_size = max_cache_size
+        self._cache: Dict[str, int] = dict()
+
     @abstractmethod
     def hash(self, text: str) -> int:
         raise NotImplementedError
+
+    def hash_many(self, texts: Iterable[str]) -> List[int]:
+        """
+        :param texts: The tokens to hash.
+        :return: The hash of each token.
+        """
+        cache = self._cache
+        result = []
+        for text in texts:
+            h = cache.get(text)
+            if h is None:
+                h = self.hash(text)
+                # Stop remembering new hashes once the cache is full.
+                if len(cache) < self._max_cache_size:
+                    cache[text] = h
+            result.append(h)
+        return result
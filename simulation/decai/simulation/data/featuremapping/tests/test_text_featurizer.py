@@ -0,0 +1,51 @@
+import random
+import unittest
+
+from sklearn.feature_extraction.text import CountVectorizer
+
+from decai.simulation.data.featuremapping.text_featurizer import ParallelTextFeaturizer
+
+
+class TestParallelTextFeaturizer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        r = random.Random(0xDeCA10B)
+        words = [f"w{i}" for i in range(300)] + ["Hey", "hey", "blockchain"]
+        # Use few words in some texts to make sure that there are many ties for the top tokens.
+        cls.texts = [" ".join(r.choice(words[:r.randint(2, len(words))]) for _ in range(r.randint(0, 20)))
+                     for _ in range(500)]
+
+    def _check_same_as_scikit_learn(self, max_features, **analyzer_params):
+        train, test = self.texts[:400], self.texts[400:]
+        expected = CountVectorizer(max_features=max_features, **analyzer_params)
+        expected_train = expected.fit_transform(train)
+        expected_test = expected.transform(test)
+
+        for num_workers in [1, 2]:
+            f = ParallelTextFeaturizer(max_features=max_features, chunk_size=37, num_workers=num_workers,
+                                       **analyzer_params)
+            actual_train = f.fit_transform(train, total=len(train))
+            actual_test = f.transform(test)
+            self.assertEqual(expected.vocabulary_, f.vocabulary_)
+            self.assertEqual(list(expected.get_feature_names_out()), f.get_feature_names())
+            self.assertEqual(expected_train.shape, actual_train.shape)
+            self.assertEqual(0, (expected_train != actual_train).nnz)
+            self.assertEqual(expected_test.shape, actual_test.shape)
+            self.assertEqual(0, (expected_test != actual_test).nnz)
+
+    def test_top_tokens(self):
+        self._check_same_as_scikit_learn(max_features=50)
+
+    def test_all_tokens(self):
+        self._check_same_as_scikit_learn(max_features=None)
+
+    def test_ngrams(self):
+        self._check_same_as_scikit_learn(max_features=100, ngram_range=(2, 2))
+
+    def test_token_order(self):
+        f = ParallelTextFeaturizer(num_workers=1)
+        x = f.fit_transform(["bb aa bb", "cc"])
+        self.assertEqual(["aa", "bb", "cc"], f.get_feature_names())
+        # Tokens keep the order that they first appear in each text.
+        self.assertEqual([1, 0, 2], x.indices.tolist())
+        self.assertEqual([2, 1, 1], x.data.tolist())
@@ -0,0 +1,168 @@
+import os
+from collections import Counter
+from multiprocessing import Pool
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+from sklearn.feature_extraction.text import CountVectorizer
+from tqdm import tqdm
+
+_ChunkCounts = Tuple[List[str], csr_matrix]
+"""
+The tokens found in a chunk of texts and a matrix with the count of each token (column) in each text (row).
+"""
+
+
+def _count_chunk(args: Tuple[Dict[str, Any], Sequence[str]]) -> _ChunkCounts:
+    """
+    Count tokens in a chunk of texts.
+    Defined at the module level so that it can be sent to worker processes.
+    """
+    analyzer_params, texts = args
+    analyze = CountVectorizer(**analyzer_params).build_analyzer()
+    vocabulary: Dict[str, int] = dict()
+    indices = []
+    data = []
+    indptr = [0]
+    for text in texts:
+        counts: Dict[int, int] = dict()
+        for token in analyze(text):
+            index = vocabulary.setdefault(token, len(vocabulary))
+            counts[index] = counts.get(index, 0) + 1
+        # Keep the order that the tokens first appeared in.
+        indices.extend(counts.keys())
+        data.extend(counts.values())
+        indptr.append(len(indices))
+    matrix = csr_matrix((np.array(data, dtype=np.int64), np.array(indices, dtype=np.int64), indptr),
+                        shape=(len(texts), len(vocabulary)))
+    return list(vocabulary.keys()), matrix
+
+
+class ParallelTextFeaturizer(object):
+    """
+    Counts tokens in texts by splitting the texts into chunks that are tokenized in a pool of processes.
+
+    Gives the same vocabulary and counts as scikit-learn's `CountVectorizer` with the same analyzer parameters:
+    when limiting the number of features, the most frequent tokens across all texts are kept
+    and the kept tokens are sorted alphabetically.
+    """
+
+    def __init__(self,
+                 max_features: Optional[int] = None,
+                 chunk_size: int = 2000,
+                 num_workers: Optional[int] = None,
+                 **analyzer_params):
+        """
+        :param max_features: The maximum number of tokens to keep. Keeps all tokens if `None`.
+        :param chunk_size: The number of texts to process in each task.
+        :param num_workers: The number of processes to use. Defaults to the number of CPUs.
+            Texts are processed in this process if this is 1.
+        :param analyzer_params: Parameters for `CountVectorizer` to choose how to tokenize,
+            e.g. `ngram_range` or `lowercase`.
+        """
+        assert max_features is None or max_features > 0
+        assert chunk_size > 0
+        self.max_features = max_features
+        self.chunk_size = chunk_size
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.analyzer_params = analyzer_params
+        self.vocabulary_: Optional[Dict[str, int]] = None
+
+    def get_feature_names(self) -> List[str]:
+        """
+        :return: The kept tokens in the order of their columns.
+        """
+        assert self.vocabulary_ is not None, "The featurizer has not been fit yet."
+        return sorted(self.vocabulary_, key=self.vocabulary_.get)
+
+    def _count_chunks(self, texts: Iterable[str], desc: str, total: int = None) -> Iterator[_ChunkCounts]:
+        def chunks():
+            chunk = []
+            for text in texts:
+                chunk.append(text)
+                if len(chunk) == self.chunk_size:
+                    yield self.analyzer_params, chunk
+                    chunk = []
+            if len(chunk) > 0:
+                yield self.analyzer_params, chunk
+
+        num_chunks = None if total is None else (total + self.chunk_size - 1) // self.chunk_size
+        if self.num_workers == 1 or num_chunks == 1:
+            results = map(_count_chunk, chunks())
+            yield from tqdm(results, desc=desc, total=num_chunks, unit_scale=True, mininterval=2, unit=" chunks")
+        else:
+            with Pool(self.num_workers) as pool:
+                # `imap` keeps the order of the chunks.
+                results = pool.imap(_count_chunk, chunks())
+                yield from tqdm(results, desc=desc, total=num_chunks, unit_scale=True, mininterval=2, unit=" chunks")
+
+    def _select_vocabulary(self, totals: Counter) -> Dict[str, int]:
+        tokens = sorted(totals)
+        if self.max_features is not None and len(tokens) > self.max_features:
+            # Select the same way as `CountVectorizer._limit_features` so that ties are broken the same way.
+            term_frequencies = np.array([totals[token] for token in tokens], dtype=np.int64)
+            kept_indices = np.sort((-term_frequencies).argsort()[:self.max_features])
+            tokens = [tokens[i] for i in kept_indices]
+        return {token: index for index, token in enumerate(tokens)}
+
+    def _map_chunk(self, chunk_counts: _ChunkCounts) -> csr_matrix:
+        """
+        Map the columns of a chunk's matrix to the columns of the vocabulary and drop the other tokens.
+        """
+        chunk_tokens, matrix = chunk_counts
+        column_mapping = np.array([self.vocabulary_.get(token, -1) for token in chunk_tokens], dtype=np.int64)
+        columns = column_mapping[matrix.indices]
+        keep = columns >= 0
+        # Filtering keeps the order of the tokens within each row.
+        indptr = np.concatenate([[0], np.cumsum(keep)])[matrix.indptr]
+        return csr_matrix((matrix.data[keep], columns[keep], indptr),
+                          shape=(matrix.shape[0], len(self.vocabulary_)))
+
+    def _stack(self, matrices: List[csr_matrix]) -> csr_matrix:
+        if len(matrices) == 0:
+            return csr_matrix((0, len(self.vocabulary_)), dtype=np.int64)
+        return vstack(matrices, format='csr')
+
+    def fit(self, texts: Iterable[str], total: int = None) -> 'ParallelTextFeaturizer':
+        """
+        Find the vocabulary.
+
+        :param texts: The texts to learn the vocabulary from.
+        :param total: The number of texts, if known, for progress updates.
+        :return: This featurizer.
+        """
+        self.fit_transform(texts, total, keep_matrix=False)
+        return self
+
+    def fit_transform(self, texts: Iterable[str], total: int = None, keep_matrix: bool = True) \
+            -> Optional[csr_matrix]:
+        """
+        Find the vocabulary and count the tokens in each text while only tokenizing each text once.
+
+        :param texts: The texts to learn the vocabulary from and to count tokens in.
+        :param total: The number of texts, if known, for progress updates.
+        :param keep_matrix: `False` to only find the vocabulary.
+        :return: The count of each kept token (column) in each text (row).
+        """
+        totals = Counter()
+        chunks = []
+        for chunk_tokens, matrix in self._count_chunks(texts, "Counting tokens", total):
+            # Reduce the counts from each chunk.
+            totals.update(dict(zip(chunk_tokens, np.asarray(matrix.sum(axis=0)).ravel().tolist())))
+            if keep_matrix:
+                chunks.append((chunk_tokens, matrix))
+        self.vocabulary_ = self._select_vocabulary(totals)
+        if not keep_matrix:
+            return None
+        return self._stack([self._map_chunk(chunk) for chunk in chunks])
+
+    def transform(self, texts: Iterable[str], total: int = None) -> csr_matrix:
+        """
+        :param texts: The texts to count tokens in.
+        :param total: The number of texts, if known, for progress updates.
+        :return: The count of each token in the vocabulary (column) in each text (row).
+        """
+        assert self.vocabulary_ is not None, "The featurizer has not been fit yet."
+        return self._stack([self._map_chunk(chunk)
+                            for chunk in self._count_chunks(texts, "Counting tokens", total)])
@@ -1,13 +1,12 @@
-import ast
 import logging
 import os
 import re
-import time
 from collections import Counter
 from dataclasses import dataclass, field
 from logging import Logger
+from multiprocessing import Pool
 from pathlib import Path
-from typing import List, Set, Tuple
+from typing import Collection, Dict, List, Set, Tuple
 
 import numpy as np
 from injector import ClassAssistedBuilder, inject, Module, provider, singleton
@@ -16,6 +15,97 @@ from tqdm import tqdm
 
 from .data_loader import DataLoader
 
+_NUM_RAW_VALUES = 6
+
+_SPORT_PATTERN = re.compile(r"'sport': '([^']*)'")
+_GENDER_PATTERN = re.compile(r"'gender': '([^']*)'")
+_HEART_RATE_PATTERN = re.compile(r"'heart_rate': \[([^\]]*)\]")
+_SPEED_PATTERN = re.compile(r"'speed': \[([^\]]*)\]")
+
+
+def _parse_numbers(lists: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :param lists: Comma separated numbers.
+    :return: All of the numbers and the number of numbers in each list.
+    """
+    lengths = np.array([text.count(',') + 1 for text in lists], dtype=np.int64)
+    values = np.fromstring(','.join(lists), dtype=np.float64, sep=',')
+    assert len(values) == lengths.sum(), "Could not parse some numbers."
+    return values, lengths
+
+
+def _segment_stats(values: np.ndarray, lengths: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    :param values: Values for many records concatenated together.
+    :param lengths: The number of values for each record. All must be positive.
+    :return: The mean, median, min, and max of each record's values.
+    """
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    segment_ids = np.repeat(np.arange(len(lengths)), lengths)
+    # Sort within each record to find the medians.
+    sorted_values = values[np.lexsort((values, segment_ids))]
+    lower_middle = sorted_values[starts + (lengths - 1) // 2]
+    upper_middle = sorted_values[starts + lengths // 2]
+    return dict(
+        mean=np.add.reduceat(values, starts) / lengths,
+        median=(lower_middle + upper_middle) / 2,
+        min=np.minimum.reduceat(values, starts),
+        max=np.maximum.reduceat(values, starts),
+    )
+
+
+def _parse_records(args: Tuple[str, int, int, Collection[str]]) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    """
+    Parse the records that start in a byte range of the Endomondo data.
+    Only the needed fields are extracted instead of evaluating each record.
+    Defined at the module level so that it can be sent to worker processes.
+
+    :param args: The data path, the start and end of the byte range, and the sports to keep.
+    :return: The sport, gender, and raw values for each record that has a sport to keep and speeds.
+        The raw values are: mean heart rate / min heart rate, median heart rate / min heart rate,
+        max speed, min speed, mean speed, and median speed.
+    """
+    path, start, end, sports = args
+    result_sports = []
+    genders = []
+    heart_rate_lists = []
+    speed_lists = []
+    with open(path, 'rb') as f:
+        if start > 0:
+            # Skip the line that started in the previous range.
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            line = line.decode('utf-8')
+            match = _SPORT_PATTERN.search(line)
+            if match is None or match.group(1) not in sports:
+                continue
+            speeds = _SPEED_PATTERN.search(line)
+            if speeds is None:
+                continue
+            heart_rates = _HEART_RATE_PATTERN.search(line)
+            if heart_rates is None or not heart_rates.group(1).strip() or not speeds.group(1).strip():
+                continue
+            result_sports.append(match.group(1))
+            genders.append(_GENDER_PATTERN.search(line).group(1))
+            heart_rate_lists.append(heart_rates.group(1))
+            speed_lists.append(speeds.group(1))
+
+    raw_values = np.empty((len(result_sports), _NUM_RAW_VALUES), dtype=np.float64)
+    if len(result_sports) > 0:
+        heart_rate = _segment_stats(*_parse_numbers(heart_rate_lists))
+        speed = _segment_stats(*_parse_numbers(speed_lists))
+        raw_values[:, 0] = heart_rate['mean'] / heart_rate['min']
+        raw_values[:, 1] = heart_rate['median'] / heart_rate['min']
+        raw_values[:, 2] = speed['max']
+        raw_values[:, 3] = speed['min']
+        raw_values[:, 4] = speed['mean']
+        raw_values[:, 5] = speed['median']
+    return np.array(result_sports, dtype=str), genders, raw_values
+
 
 @inject
 @dataclass
@@ -38,126 +128,106 @@ class FitnessDataLoader(DataLoader):
     _train_split: float = field(default=0.7, init=False)
     _classes: Set[str] = field(default_factory=lambda: {'bike', 'run'}, init=False)
 
+    _chunk_size_bytes: int = field(default=64 * 1024 * 1024, init=False)
+    _cache_dir: Path = field(default=Path(os.path.dirname(__file__)) / 'cached_data', init=False)
+
     def classifications(self) -> List[str]:
         return ["BIKING", "RUNNING"]
 
+    def _load_records(self, data_path: Path) -> Dict[str, np.ndarray]:
+        """
+        Load the needed values for each record with a sport to keep.
+        The values are saved in a columnar format the first time so that later loads are fast.
+
+        :return: The sport, gender, and raw values of each record in the order they appear in the data.
+        """
+        stat = data_path.stat()
+        cache_path = self._cache_dir / f'fitness-records-{"_".join(sorted(self._classes))}.npz'
+        if cache_path.exists():
+            with np.load(cache_path, allow_pickle=False) as cached:
+                if cached['source_size'] == stat.st_size and cached['source_mtime'] == stat.st_mtime:
+                    self._logger.info("Loaded cached Endomondo fitness records from \"%s\".", cache_path)
+                    return {k: cached[k] for k in ['sports', 'genders', 'raw_values']}
+
+        ranges = [(str(data_path), start, min(start + self._chunk_size_bytes, stat.st_size), self._classes)
+                  for start in range(0, stat.st_size, self._chunk_size_bytes)]
+        sports = []
+        genders = []
+        raw_values = []
+        with Pool(max(1, min(os.cpu_count() or 1, len(ranges)))) as pool:
+            # `imap` keeps the order of the records.
+            for chunk_sports, chunk_genders, chunk_raw_values in tqdm(pool.imap(_parse_records, ranges),
+                                                                     desc="Parsing data",
+                                                                     total=len(ranges),
+                                                                     unit_scale=True, mininterval=2,
+                                                                     unit=" chunks"):
+                sports.append(chunk_sports)
+                genders.extend(chunk_genders)
+                raw_values.append(chunk_raw_values)
+        result = dict(
+            sports=np.concatenate(sports) if sports else np.array([], dtype=str),
+            genders=np.array(genders, dtype=str),
+            raw_values=np.concatenate(raw_values) if raw_values else np.empty((0, _NUM_RAW_VALUES)),
+        )
+
+        os.makedirs(self._cache_dir, exist_ok=True)
+        # Write to a temporary file first so that an interrupted run doesn't leave a partial cache.
+        tmp_path = cache_path.with_suffix('.tmp.npz')
+        np.savez(tmp_path, source_size=stat.st_size, source_mtime=stat.st_mtime, **result)
+        os.replace(tmp_path, cache_path)
+        return result
+
     def load_data(self, train_size: int = None, test_size: int = None) -> (Tuple, Tuple):
         self._logger.info("Loading Endomondo fitness data.")
 
-        # Look for cached data.
-        file_identifier = f'fitness-data-{train_size}-{test_size}.npy'
-        base_path = Path(os.path.dirname(__file__)) / 'cached_data'
-        os.makedirs(base_path, exist_ok=True)
-        cache_paths = {
-            'x_train': base_path / f'x_train-{file_identifier}',
-            'y_train': base_path / f'y_train-{file_identifier}',
-            'x_test': base_path / f'x_test-{file_identifier}',
-            'y_test': base_path / f'y_test-{file_identifier}'
-        }
-
-        # Use if modified in the last day.
-        if all([p.exists() for p in cache_paths.values()]) and \
-                all([time.time() - p.stat().st_mtime < 60 * 60 * 24 for p in cache_paths.values()]):
-            self._logger.info("Loaded cached Endomondo fitness data from %s.", cache_paths)
-            return (np.load(cache_paths['x_train']), np.load(cache_paths['y_train'])), \
-                   (np.load(cache_paths['x_test']), np.load(cache_paths['y_test']))
-
-        data = []
-        labels = []
         data_folder_path = Path(__file__, '../../../../training_data/fitness').resolve()
-        user_id_to_set = {}
         sport_to_label = {
             'bike': 0,
             'run': 1
         }
-        gender_to_index = {}
         if train_size is not None and test_size is not None:
             max_num_samples = train_size + test_size
         else:
             max_num_samples = 10_000
-        classes = '|'.join(self._classes)
-        classes_pattern = re.compile(f' \'sport\': \'({classes})\', ')
         data_path = data_folder_path / 'endomondoHR_proper.json'
         assert data_path.exists(), f"See the documentation for how to download the dataset. It must be stored at {data_path}"
-        with open(data_path) as f, \
-                tqdm(f,
-                     desc="Loading data",
-                     unit_scale=True, mininterval=2, unit=" samples",
-                     total=max_num_samples,
-                     ) as pbar:
-            for line in f:
-                # TODO Keep users in train set mutually exclusive from users in test set.
-                # Check line before more expensive parsing.
-                if not classes_pattern.search(line):
-                    continue
-                record = ast.literal_eval(line)
-                sport = record['sport']
-                if sport not in self._classes:
-                    continue
-                if 'speed' not in record:
-                    continue
-                label = sport_to_label[sport]
-                labels.append(label)
-                heart_rates = record['heart_rate']
-                gender = gender_to_index.setdefault(record['gender'], len(gender_to_index))
-                speeds = record['speed']
-                # Other fields:
-                # record['longitude']
-                # record['altitude']
-                # record['latitude']
-                # record['id']
-                # record['timestamp']
-                # record['userId']
-                data.append({
-                    # Values to keep as they are:
-                    'rawValues':
-                        [
-                            np.mean(heart_rates) / np.min(heart_rates),
-                            np.median(heart_rates) / np.min(heart_rates),
-                            np.max(speeds),
-                            np.min(speeds),
-                            np.mean(speeds),
-                            np.median(speeds),
-                        ],
-                    # Values that need to be converted:
-                    'gender': gender,
-                })
-                pbar.update()
-                if len(data) >= max_num_samples:
-                    break
+        # TODO Keep users in train set mutually exclusive from users in test set.
+        records = self._load_records(data_path)
+        num_samples = min(max_num_samples, len(records['sports']))
+        labels = np.array([sport_to_label[sport] for sport in records['sports'][:num_samples]], dtype=np.int64)
+        raw_values = records['raw_values'][:num_samples]
+        # Number genders in the order they first appear.
+        genders, first_indices, gender_indices = np.unique(records['genders'][:num_samples],
+                                                           return_index=True, return_inverse=True)
+        gender_order = np.argsort(first_indices)
+        gender_to_index = dict(zip(genders[gender_order], range(len(genders))))
+        gender_indices = np.argsort(gender_order)[gender_indices]
 
         if train_size is None:
             if test_size is None:
-                train_size = int(self._train_split * len(data))
+                train_size = int(self._train_split * num_samples)
             else:
-                train_size = len(data) - test_size
+                train_size = num_samples - test_size
         if test_size is None:
-            test_size = len(data) - train_size
+            test_size = num_samples - train_size
 
         # Thresholds for making sure features can be discretized for Naive Bayes.
         # Just use training data to make thresholds.
-        thresholds = np.empty(len(data[0]['rawValues']), dtype=np.int32)
-        for i in range(len(data[0]['rawValues'])):
-            thresholds[i] = np.median([d['rawValues'][i] for d in data[:train_size]])
+        thresholds = np.median(raw_values[:train_size], axis=0).astype(np.int32)
 
-        def _featurize(datum):
-            raw_values = np.array(thresholds < datum['rawValues'], dtype=np.int8)
-            gender_one_hot = np.zeros(len(gender_to_index), dtype=np.int8)
-            gender_one_hot[datum['gender']] = 1
-            return np.concatenate([raw_values, gender_one_hot])
+        gender_one_hot = np.zeros((num_samples, len(gender_to_index)), dtype=np.int8)
+        gender_one_hot[np.arange(num_samples), gender_indices] = 1
+        data = np.concatenate([np.array(thresholds < raw_values, dtype=np.int8), gender_one_hot], axis=1)
 
         if self._logger.isEnabledFor(logging.DEBUG):
-            self._logger.debug("Labels: %s", Counter(labels))
+            self._logger.debug("Labels: %s", Counter(labels.tolist()))
+            self._logger.debug("Genders: %s", gender_to_index)
         data, labels = shuffle(data, labels, random_state=self._seed)
-        x_train = np.array([_featurize(d) for d in data[:train_size]])
-        y_train = np.array(labels[:train_size])
-        x_test = np.array([_featurize(d) for d in data[-test_size:]])
-        y_test = np.array(labels[-test_size:])
-
-        np.save(cache_paths['x_train'], x_train, allow_pickle=False)
-        np.save(cache_paths['y_train'], y_train, allow_pickle=False)
-        np.save(cache_paths['x_test'], x_test, allow_pickle=False)
-        np.save(cache_paths['y_test'], y_test, allow_pickle=False)
+        x_train = data[:train_size]
+        y_train = labels[:train_size]
+        x_test = data[-test_size:]
+        y_test = labels[-test_size:]
+
         self._logger.info("Done loading Endomondo fitness data.")
         return (x_train, y_train), (x_test, y_test)
 
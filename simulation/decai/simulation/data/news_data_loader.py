@@ -1,10 +1,11 @@
+import hashlib
 import itertools
 import json
 import os
 import random
 import time
 from collections import Counter
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 from logging import Logger
 from operator import itemgetter
@@ -13,13 +14,11 @@ from typing import Collection, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
-import spacy
 from injector import ClassAssistedBuilder, inject, Module, provider, singleton
-from sklearn.feature_extraction.text import TfidfVectorizer
-from spacy.cli import download
 from tqdm import tqdm
 
 from .data_loader import DataLoader
+from .featuremapping.text_featurizer import ParallelTextFeaturizer
 
 
 class Label(Enum):
@@ -141,7 +140,7 @@ class NewsDataLoader(DataLoader):
     _logger: Logger
     _train_split = 0.7
 
-    _replace_entities_enabled = False
+    _replace_entities_enabled: bool = field(default=False)
     """
     If True, entities will be replaced in text with the entity's label surrounded by angle brackets: "<LABEL>".
     Accuracy with replacement: 0.9172
@@ -151,6 +150,15 @@ class NewsDataLoader(DataLoader):
     and it didn't change the evaluation metrics much.
     """
 
+    _nlp_n_process: int = field(default=1)
+    """
+    The number of processes spaCy should use when replacing entities. -1 uses all CPUs.
+    """
+
+    _cache_dir: Path = field(default=Path(os.path.dirname(__file__)) / 'cached_data', init=False)
+
+    _spacy_model = 'en_core_web_lg'
+
     _entity_types_to_replace = {'PERSON', 'GPE', 'ORG', 'DATE', 'TIME', 'PERCENT',
                                 'MONEY', 'QUANTITY', 'ORDINAL', 'CARDINAL'}
 
@@ -158,9 +166,22 @@ class NewsDataLoader(DataLoader):
         return ["RELIABLE", "UNRELIABLE"]
 
     def __post_init__(self):
-        spacy_model = 'en_core_web_lg'
-        download(spacy_model)
-        self._nlp = spacy.load(spacy_model, disable={'tagger', 'parser', 'textcat'})
+        self._loaded_nlp = None
+
+    @property
+    def _nlp(self):
+        """
+        The spaCy pipeline.
+        Only loaded when it is first used because loading it is slow and it is not needed unless replacing entities.
+        """
+        if self._loaded_nlp is None:
+            import spacy
+            if not spacy.util.is_package(self._spacy_model):
+                from spacy.cli import download
+                download(self._spacy_model)
+            self._logger.debug("Loading spaCy model \"%s\".", self._spacy_model)
+            self._loaded_nlp = spacy.load(self._spacy_model, disable={'tagger', 'parser', 'textcat'})
+        return self._loaded_nlp
 
     def _load_kaggle_data(self, data_folder_path: str) -> Collection[News]:
         """
@@ -200,39 +221,59 @@ class NewsDataLoader(DataLoader):
             result = doc
         return result
 
+    def _pre_process_texts(self, texts: List[str]) -> List[str]:
+        """
+        Pre-process texts.
+        Texts with entities replaced are cached so that spaCy only needs to process them once.
+        """
+        if not self._replace_entities_enabled:
+            self._logger.debug("Replacing entities is disabled.")
+            return list(map(self._pre_process_text, texts))
+
+        h = hashlib.sha256()
+        h.update(f"{self._spacy_model}{sorted(self._entity_types_to_replace)}".encode())
+        for text in texts:
+            h.update(text.encode())
+            h.update(b'\0')
+        cache_path = self._cache_dir / f'news-texts-replace_ents-{h.hexdigest()[:16]}.json'
+        if cache_path.exists():
+            self._logger.info("Loaded cached pre-processed texts from \"%s\".", cache_path)
+            with open(cache_path) as f:
+                return json.load(f)
+
+        self._logger.debug("Will replace entities.")
+        docs = self._nlp.pipe(texts, batch_size=128, n_process=self._nlp_n_process)
+        result = [self._pre_process_text(doc) for doc in tqdm(docs,
+                                                              desc="Replacing entities",
+                                                              total=len(texts),
+                                                              unit_scale=True, mininterval=2,
+                                                              unit=" articles"
+                                                              )]
+        os.makedirs(self._cache_dir, exist_ok=True)
+        # Write to a temporary file first so that an interrupted run doesn't leave a partial cache.
+        tmp_path = cache_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp_path, cache_path)
+        return result
+
     def _pre_process(self, news_articles: Collection[News], train_size: int, test_size: int) -> \
             Tuple[Tuple[np.ndarray, np.ndarray], Tuple[np.ndarray, np.ndarray]]:
         self._logger.info("Getting features for %d articles.", len(news_articles))
         # Only use binary features.
         ngram_range = (2, 2)
-        # Don't use IDF because we need integer features.
-        t = TfidfVectorizer(max_features=1000, ngram_range=ngram_range, norm=None, use_idf=False)
+        # Only count tokens (no IDF) because we need integer features.
+        t = ParallelTextFeaturizer(max_features=1000, ngram_range=ngram_range)
         test_start = len(news_articles) - test_size
 
-        x_train = map(lambda news: news.text, itertools.islice(news_articles, train_size))
-        x_test = map(lambda news: news.text, itertools.islice(news_articles, test_start, len(news_articles)))
-        if self._replace_entities_enabled:
-            self._logger.debug("Will replace entities.")
-            x_train = self._nlp.pipe(x_train, batch_size=128)
-            x_test = self._nlp.pipe(x_test, batch_size=128)
-        else:
-            self._logger.debug("Replacing entities is disabled.")
+        texts = self._pre_process_texts(
+            [news.text for news in itertools.chain(itertools.islice(news_articles, train_size),
+                                                   itertools.islice(news_articles, test_start, len(news_articles)))])
+        x_train, x_test = texts[:train_size], texts[train_size:]
 
-        x_train = map(self._pre_process_text, x_train)
-        x_test = map(self._pre_process_text, x_test)
-
-        x_train = t.fit_transform(tqdm(x_train,
-                                       desc="Processing training data",
-                                       total=train_size,
-                                       unit_scale=True, mininterval=2,
-                                       unit=" articles"
-                                       )).toarray()
-        x_test = t.transform(tqdm(x_test,
-                                  desc="Processing testing data",
-                                  total=test_size,
-                                  unit_scale=True, mininterval=2,
-                                  unit=" articles"
-                                  )).toarray()
+        # Use floats to be consistent with the values from scikit-learn's TfidfVectorizer that was used before.
+        x_train = t.fit_transform(x_train, total=train_size).astype(np.float64).toarray()
+        x_test = t.transform(x_test, total=test_size).astype(np.float64).toarray()
 
         y_train = np.array([news.label.value for news in itertools.islice(news_articles, train_size)], np.int8)
         y_test = np.array([news.label.value for news in itertools.islice(news_articles,
@@ -249,7 +290,7 @@ class NewsDataLoader(DataLoader):
 
         # Look for cached data.
         file_identifier = f'news-data-{train_size}-{test_size}-replace_ents_{self._replace_entities_enabled}.npy'
-        base_path = Path(os.path.dirname(__file__)) / 'cached_data'
+        base_path = self._cache_dir
         os.makedirs(base_path, exist_ok=True)
         cache_paths = {
             'x_train': base_path / f'x_train-{file_identifier}',
@@ -291,8 +332,11 @@ class NewsDataLoader(DataLoader):
 
 @dataclass
 class NewsDataModule(Module):
+    replace_entities_enabled: bool = field(default=False)
+    nlp_n_process: int = field(default=1)
 
     @provider
     @singleton
     def provide_data_loader(self, builder: ClassAssistedBuilder[NewsDataLoader]) -> DataLoader:
-        return builder.build()
+        return builder.build(_replace_entities_enabled=self.replace_entities_enabled,
+                             _nlp_n_process=self.nlp_n_process)
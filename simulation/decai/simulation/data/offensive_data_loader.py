@@ -1,23 +1,23 @@
 import html
 import itertools
 import os
-from collections import Counter
 from dataclasses import dataclass, field
 from logging import Logger
 from pathlib import Path
-from typing import Dict, Iterator, List, Tuple
+from typing import Iterable, List, Tuple
 
 import numpy as np
 import pandas as pd
 import requests
 from injector import ClassAssistedBuilder, Module, inject, provider, singleton
-from scipy.sparse import csr_matrix
-from sklearn.feature_extraction.text import TfidfVectorizer
+from scipy.sparse import csr_matrix, vstack
 from sklearn.utils import shuffle
 from tqdm import tqdm
 
 from .data_loader import DataLoader
+from .featuremapping.hashing.streaming_featurizer import StreamingHashingFeaturizer
 from .featuremapping.hashing.token_hash import TokenHash
+from .featuremapping.text_featurizer import ParallelTextFeaturizer
 
 
 @inject
@@ -32,6 +32,14 @@ class OffensiveDataLoader(DataLoader):
 
     max_num_features: int
 
+    use_streaming_featurizer: bool = field(default=False)
+    """
+    If True, texts are tokenized by whitespace like in the JavaScript demo and the top features are approximated
+    while counting features in the training data.
+    Each chunk of texts is then featurized with only the top features.
+    Otherwise, the top features are found with scikit-learn's tokenization.
+    """
+
     _seed: int = field(default=2, init=False)
     _train_split: float = field(default=0.7, init=False)
 
@@ -95,36 +103,28 @@ class OffensiveDataLoader(DataLoader):
             test_size = len(data) - train_size
 
         data, labels = shuffle(data, labels, random_state=self._seed)
-        x_train = itertools.islice(data, train_size)
-
-        # Compute the top features.
-        t = TfidfVectorizer(max_features=self.max_num_features, norm=None)
-        t.fit(tqdm(x_train,
-                   desc="Computing top token features",
-                   total=train_size,
-                   unit_scale=True, mininterval=2,
-                   unit=" texts"
-                   ))
-        top_tokens = t.get_feature_names()
-        self._logger.debug("Some top feature names: %s", top_tokens[:30])
 
-        tokenize = t.build_analyzer()
-        feature_tokens = set(t.get_feature_names())
+        if self.use_streaming_featurizer:
+            x_train, x_test = self._featurize_streaming(data[:train_size], data[-test_size:])
+            y_train = np.array(labels[:train_size])
+            y_test = np.array(labels[-test_size:])
+            self._logger.info("Done loading data.")
+            return (x_train, y_train), (x_test, y_test)
 
-        def _featurize(text: str) -> Dict[int, int]:
-            result = Counter(tokenize(text))
-
-            return {self._token_hash.hash(token): count
-                    for token, count in result.items()
-                    if token in feature_tokens}
+        # Compute the top features while counting tokens in the training data.
+        t = ParallelTextFeaturizer(max_features=self.max_num_features)
+        x_train = t.fit_transform(itertools.islice(data, train_size), total=train_size)
+        top_tokens = t.get_feature_names()
+        self._logger.debug("Some top feature names: %s", top_tokens[:30])
 
-        x_train = map(_featurize, itertools.islice(data, train_size))
-        x_train = self._build_sparse_matrix(x_train)
+        # Use the hash of each token as its feature index.
+        column_hashes = np.array(self._token_hash.hash_many(top_tokens), dtype=np.int64)
+        x_train = self._hash_columns(x_train, column_hashes)
         y_train = np.array(labels[:train_size])
 
-        x_test = map(_featurize, itertools.islice(data, len(data) - test_size, len(data)))
+        x_test = t.transform(itertools.islice(data, len(data) - test_size, len(data)), total=test_size)
         # TODO Might have to might sure it has the same number of columns as x_train.
-        x_test = self._build_sparse_matrix(x_test)
+        x_test = self._hash_columns(x_test, column_hashes)
         y_test = np.array(labels[-test_size:])
 
         self._logger.info("Done loading data.")
@@ -134,26 +134,40 @@ class OffensiveDataLoader(DataLoader):
         """ Handle some simple pre-processing specific to this dataset. """
         return html.unescape(text)
 
-    def _build_sparse_matrix(self, feature_mapped_data: Iterator[Dict[int, int]]):
-        # Make a sparse matrix following the term-document example from:
-        # https://docs.scipy.org/doc/scipy/reference/generated/scipy.sparse.csr_matrix.html
-        data = []
-        indptr = [0]
-        indices = []
-        for feature_indices in feature_mapped_data:
-            if len(feature_indices) > 0:
-                i, d = zip(*feature_indices.items())
-                indices.extend(i)
-                data.extend(d)
-            indptr.append(len(indices))
-        return csr_matrix((data, indices, indptr), dtype=np.uint8)
+    def _featurize_streaming(self, train_data: Iterable[str], test_data: Iterable[str]) \
+            -> Tuple[csr_matrix, csr_matrix]:
+        """
+        :param train_data: The training texts. This is iterated over twice.
+        :param test_data: The test texts.
+        :return: The features for the training and test texts with only the top features from the training texts.
+        """
+        f = StreamingHashingFeaturizer(self._token_hash, self.max_num_features)
+        f.count(tqdm(train_data,
+                     desc="Counting features",
+                     unit_scale=True, mininterval=2, unit=" texts"))
+        top_features = f.top_features()
+        x_train = vstack(list(f.featurize(train_data, top_features)), format='csr', dtype=np.uint8)
+        x_test = vstack(list(f.featurize(test_data, top_features)), format='csr', dtype=np.uint8)
+        return x_train, x_test
+
+    def _hash_columns(self, token_counts: csr_matrix, column_hashes: np.ndarray) -> csr_matrix:
+        """
+        :param token_counts: The count of each token (column) in each text (row).
+        :param column_hashes: The hash of the token for each column.
+        :return: The counts with the columns moved to the hashes of their tokens.
+        """
+        # Let the number of columns be inferred from the largest hash used.
+        return csr_matrix((token_counts.data, column_hashes[token_counts.indices], token_counts.indptr),
+                          dtype=np.uint8)
 
 
 @dataclass
 class OffensiveDataModule(Module):
     max_num_features: int = field(default=1000)
+    use_streaming_featurizer: bool = field(default=False)
 
     @provider
     @singleton
     def provide_data_loader(self, builder: ClassAssistedBuilder[OffensiveDataLoader]) -> DataLoader:
-        return builder.build(max_num_features=self.max_num_features)
+        return builder.build(max_num_features=self.max_num_features,
+                             use_streaming_featurizer=self.use_streaming_featurizer)
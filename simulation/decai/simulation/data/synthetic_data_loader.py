@@ -0,0 +1,205 @@
+from dataclasses import dataclass, field
+from logging import Logger
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse
+from injector import ClassAssistedBuilder, Module, inject, provider, singleton
+
+from .data_loader import DataLoader, SampleStream
+
+_MAX_FEATURE_VALUE = 3
+
+
+@inject
+@dataclass
+class SyntheticDataLoader(DataLoader):
+    """
+    Generate classification data offline to see how simulations scale with the amount and size of data.
+
+    The data is generated in chunks of `chunk_size` samples.
+    Each chunk only depends on `seed` and its position so the same samples are generated
+    no matter how much data is requested at once, and data much larger than memory can be iterated over.
+
+    Features are counts from 0 to 3 so that they work with all of the models, including Naive Bayes.
+    Labels come from linear functions of the features.
+    """
+
+    _logger: Logger
+
+    num_samples: int = field(default=10_000)
+    """ The total number of samples to split into the training and test sets. """
+
+    num_features: int = field(default=20)
+
+    num_classes: int = field(default=2)
+
+    density: float = field(default=1.0)
+    """ The expected fraction of features that are not zero for each sample. """
+
+    sparse: bool = field(default=False)
+    """ `True` to return CSR matrices instead of arrays. Use with a low `density` for many features. """
+
+    label_noise: float = field(default=0.0)
+    """ The fraction of samples that get a random wrong label. """
+
+    drift: float = field(default=0.0)
+    """
+    How much the function for the labels changes by the last sample.
+    The labels for sample `i` use weights `(1 - a) * w_start + a * w_end` where `a = drift * i / num_samples`,
+    so 0 means that there is no concept drift and 1 means that the labels for the last samples come from
+    a completely different function than the labels for the first samples.
+    """
+
+    seed: int = field(default=2)
+
+    chunk_size: int = field(default=10_000)
+
+    _train_split: float = field(default=0.7, init=False)
+
+    def __post_init__(self):
+        assert self.num_samples > 0
+        assert self.num_features > 0
+        assert self.num_classes >= 2
+        assert 0 < self.density <= 1
+        assert 0 <= self.label_noise <= 1
+        assert 0 <= self.drift <= 1
+        assert self.chunk_size > 0
+        rng = np.random.default_rng([self.seed, 0])
+        self._start_weights = rng.standard_normal((self.num_features, self.num_classes))
+        self._end_weights = rng.standard_normal((self.num_features, self.num_classes)) \
+            if self.drift > 0 else self._start_weights
+        # Center the scores so that the classes are balanced.
+        mean_feature_value = self.density * (1 + _MAX_FEATURE_VALUE) / 2
+        self._start_offsets = mean_feature_value * self._start_weights.sum(axis=0)
+        self._end_offsets = mean_feature_value * self._end_weights.sum(axis=0)
+
+    def classifications(self) -> List[str]:
+        return [str(i) for i in range(self.num_classes)]
+
+    def _generate_chunk(self, chunk_index: int) -> Tuple[object, np.ndarray]:
+        start = chunk_index * self.chunk_size
+        num_samples = min(self.chunk_size, self.num_samples - start)
+        # The first seed is for the weights.
+        rng = np.random.default_rng([self.seed, chunk_index + 1])
+        if self.sparse:
+            nnz_per_row = rng.binomial(self.num_features, self.density, size=num_samples)
+            indptr = np.concatenate([[0], np.cumsum(nnz_per_row)])
+            # Duplicate indices are unlikely when the data is sparse and are summed.
+            indices = rng.integers(self.num_features, size=indptr[-1])
+            values = rng.integers(1, _MAX_FEATURE_VALUE + 1, size=indptr[-1])
+            x = scipy.sparse.csr_matrix((values, indices, indptr), shape=(num_samples, self.num_features))
+            x.sum_duplicates()
+            x.data = np.minimum(x.data, _MAX_FEATURE_VALUE)
+        else:
+            x = rng.integers(1, _MAX_FEATURE_VALUE + 1, size=(num_samples, self.num_features))
+            if self.density < 1:
+                x[rng.random((num_samples, self.num_features)) >= self.density] = 0
+
+        scores = x @ self._start_weights - self._start_offsets
+        if self.drift > 0:
+            amounts = (self.drift / self.num_samples * np.arange(start, start + num_samples))[:, None]
+            end_scores = x @ self._end_weights - self._end_offsets
+            scores = (1 - amounts) * scores + amounts * end_scores
+        y = np.argmax(scores, axis=1)
+        if self.label_noise > 0:
+            noisy = rng.random(num_samples) < self.label_noise
+            # Add a random non-zero amount so that the label is always wrong.
+            y[noisy] = (y[noisy] + rng.integers(1, self.num_classes, size=noisy.sum())) % self.num_classes
+        return x, y
+
+    def iter_chunks(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[object, np.ndarray]]:
+        """
+        Generate samples lazily.
+
+        :param start: The index of the first sample.
+        :param stop: The index after the last sample. Defaults to `num_samples`.
+        :return: The features and labels for each chunk of samples.
+            Chunks might be smaller than `chunk_size` at the start and end of the range.
+        """
+        if stop is None:
+            stop = self.num_samples
+        assert 0 <= start <= stop <= self.num_samples
+        for chunk_index in range(start // self.chunk_size, (stop + self.chunk_size - 1) // self.chunk_size):
+            chunk_start = chunk_index * self.chunk_size
+            x, y = self._generate_chunk(chunk_index)
+            begin, end = max(start - chunk_start, 0), min(stop - chunk_start, len(y))
+            if begin > 0 or end < len(y):
+                x, y = x[begin:end], y[begin:end]
+            yield x, y
+
+    def _load(self, start: int, stop: int) -> Tuple[object, np.ndarray]:
+        chunks = list(self.iter_chunks(start, stop))
+        if len(chunks) == 0:
+            x = scipy.sparse.csr_matrix((0, self.num_features), dtype=np.int64) if self.sparse \
+                else np.empty((0, self.num_features), dtype=np.int64)
+            return x, np.empty(0, dtype=np.int64)
+        if len(chunks) == 1:
+            return chunks[0]
+        xs, ys = zip(*chunks)
+        x = scipy.sparse.vstack(xs, format='csr') if self.sparse else np.concatenate(xs)
+        return x, np.concatenate(ys)
+
+    def _get_sizes(self, train_size: Optional[int], test_size: Optional[int]) -> Tuple[int, int]:
+        if train_size is None:
+            if test_size is None:
+                train_size = int(self._train_split * self.num_samples)
+            else:
+                train_size = self.num_samples - test_size
+        if test_size is None:
+            test_size = self.num_samples - train_size
+        assert train_size + test_size <= self.num_samples, \
+            f"Can't split {self.num_samples} samples into {train_size} training and {test_size} test samples."
+        return train_size, test_size
+
+    def load_data(self, train_size: int = None, test_size: int = None) -> (Tuple, Tuple):
+        """
+        The training data is from the start of the samples and the test data is from the end
+        so when there is drift, the test data has the most recent labels.
+        """
+        train_size, test_size = self._get_sizes(train_size, test_size)
+        self._logger.info("Generating %d training and %d test samples with %d features.",
+                          train_size, test_size, self.num_features)
+        x_train, y_train = self._load(0, train_size)
+        x_test, y_test = self._load(self.num_samples - test_size, self.num_samples)
+        self._logger.info("Done generating synthetic data.")
+        return (x_train, y_train), (x_test, y_test)
+
+    def load_data_stream(self, train_size: int = None, test_size: int = None, chunk_size: int = 10_000) \
+            -> Tuple[SampleStream, Tuple]:
+        """
+        Generate the training data lazily in chunks of `self.chunk_size` samples.
+        `chunk_size` is ignored since the samples depend on how they are chunked.
+        """
+        train_size, test_size = self._get_sizes(train_size, test_size)
+        self._logger.info("Generating %d test samples with %d features.", test_size, self.num_features)
+        test = self._load(self.num_samples - test_size, self.num_samples)
+        return SampleStream(self.iter_chunks(0, train_size), train_size), test
+
+
+@dataclass
+class SyntheticDataModule(Module):
+    num_samples: int = field(default=10_000)
+    num_features: int = field(default=20)
+    num_classes: int = field(default=2)
+    density: float = field(default=1.0)
+    sparse: bool = field(default=False)
+    label_noise: float = field(default=0.0)
+    drift: float = field(default=0.0)
+    seed: int = field(default=2)
+    chunk_size: int = field(default=10_000)
+
+    @provider
+    @singleton
+    def provide_data_loader(self, builder: ClassAssistedBuilder[SyntheticDataLoader]) -> DataLoader:
+        return builder.build(
+            num_samples=self.num_samples,
+            num_features=self.num_features,
+            num_classes=self.num_classes,
+            density=self.density,
+            sparse=self.sparse,
+            label_noise=self.label_noise,
+            drift=self.drift,
+            seed=self.seed,
+            chunk_size=self.chunk_size,
+        )
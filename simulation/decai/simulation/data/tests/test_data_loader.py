@@ -0,0 +1,67 @@
+import logging
+import unittest
+
+import numpy as np
+import scipy.sparse
+from injector import Injector
+
+from decai.simulation.data.data_loader import DataLoader, SampleStream
+from decai.simulation.data.simple_data_loader import SimpleDataModule
+from decai.simulation.data.synthetic_data_loader import SyntheticDataLoader
+from decai.simulation.logging_module import LoggingModule
+
+
+class TestSampleStream(unittest.TestCase):
+    def test_read(self):
+        x = np.arange(20).reshape(10, 2)
+        y = np.arange(10)
+        stream = SampleStream.from_arrays(x, y, chunk_size=3)
+        self.assertEqual(10, stream.num_remaining)
+
+        x_init, y_init = stream.read(4)
+        self.assertEqual(x[:4].tolist(), x_init.tolist())
+        self.assertEqual(y[:4].tolist(), y_init.tolist())
+        self.assertEqual(6, stream.num_remaining)
+
+        for i in range(4, 10):
+            self.assertTrue(stream.has_next())
+            sample_x, sample_y = stream.peek()
+            # Peeking doesn't read the sample.
+            self.assertEqual(sample_y, stream.peek()[1])
+            self.assertEqual(x[i].tolist(), sample_x.tolist())
+            self.assertEqual(y[i], sample_y)
+            stream.advance()
+        self.assertFalse(stream.has_next())
+        self.assertEqual(0, stream.num_remaining)
+        with self.assertRaises(AssertionError):
+            stream.peek()
+
+    def test_sparse_chunks(self):
+        x = scipy.sparse.random(10, 5, density=0.5, format='csr', random_state=1)
+        y = np.arange(10)
+        stream = SampleStream(iter([(x[:5], y[:5]), (x[5:], y[5:])]))
+        self.assertIsNone(stream.num_remaining)
+        read_x, read_y = stream.read(7)
+        self.assertIsInstance(read_x, np.ndarray)
+        self.assertEqual(x[:7].toarray().tolist(), read_x.tolist())
+        self.assertEqual(x[7].toarray()[0].tolist(), stream.peek()[0].tolist())
+
+    def test_load_data_stream(self):
+        data_loader = Injector([LoggingModule, SimpleDataModule]).get(DataLoader)
+        (x_train, y_train), (x_test, y_test) = data_loader.load_data()
+        stream, (stream_x_test, stream_y_test) = data_loader.load_data_stream(chunk_size=3)
+        self.assertEqual(x_test.tolist(), stream_x_test.tolist())
+        self.assertEqual(list(y_test), list(stream_y_test))
+        stream_x_train, stream_y_train = stream.read(len(y_train) + 1)
+        self.assertEqual(x_train.tolist(), stream_x_train.tolist())
+        self.assertEqual(list(y_train), stream_y_train.tolist())
+
+    def test_synthetic_stream(self):
+        data_loader = SyntheticDataLoader(logging.getLogger(), num_samples=100, chunk_size=16)
+        (x_train, y_train), (x_test, y_test) = data_loader.load_data()
+        stream, (stream_x_test, stream_y_test) = data_loader.load_data_stream()
+        self.assertEqual(70, stream.num_samples)
+        self.assertEqual(x_test.tolist(), stream_x_test.tolist())
+        stream_x_train, stream_y_train = stream.read(100)
+        self.assertEqual(x_train.tolist(), stream_x_train.tolist())
+        self.assertEqual(y_train.tolist(), stream_y_train.tolist())
@@ -1,10 +1,15 @@
+import ast
+import os
+import random
+import tempfile
 import unittest
 from typing import cast
 
+import numpy as np
 from injector import Injector
 
 from decai.simulation.data.data_loader import DataLoader
-from decai.simulation.data.fitness_data_loader import FitnessDataLoader, FitnessDataModule
+from decai.simulation.data.fitness_data_loader import FitnessDataLoader, FitnessDataModule, _parse_records
 from decai.simulation.logging_module import LoggingModule
 
 
@@ -29,3 +34,46 @@ class TestFitnessDataLoader(unittest.TestCase):
         self.assertEqual(train_size, y_train.shape[0])
         self.assertEqual(test_size, x_test.shape[0])
         self.assertEqual(test_size, y_test.shape[0])
+
+    def test_parse_records(self):
+        r = random.Random(0xDeCA10B)
+        lines = []
+        for i in range(50):
+            n = r.randint(1, 20)
+            record = {'gender': r.choice(['male', 'female']), 'heart_rate': [r.randint(60, 190) for _ in range(n)],
+                      'id': i, 'sport': r.choice(['bike', 'run', 'walk'])}
+            if i % 7 != 0:
+                record['speed'] = [round(r.uniform(0, 40), 4) for _ in range(n)]
+            lines.append(repr(record) + '\n')
+
+        expected_sports = []
+        expected_raw_values = []
+        for line in lines:
+            record = ast.literal_eval(line)
+            if record['sport'] not in {'bike', 'run'} or 'speed' not in record:
+                continue
+            heart_rates, speeds = record['heart_rate'], record['speed']
+            expected_sports.append(record['sport'])
+            expected_raw_values.append([
+                np.mean(heart_rates) / np.min(heart_rates),
+                np.median(heart_rates) / np.min(heart_rates),
+                np.max(speeds),
+                np.min(speeds),
+                np.mean(speeds),
+                np.median(speeds),
+            ])
+
+        with tempfile.TemporaryDirectory() as data_dir:
+            path = os.path.join(data_dir, 'data.json')
+            with open(path, 'w') as f:
+                f.writelines(lines)
+            size = os.path.getsize(path)
+            # Use ranges that split lines to make sure that each record is parsed exactly once.
+            boundaries = [0, 1, 1000, 1001, 2500, size]
+            results = [_parse_records((path, start, end, {'bike', 'run'}))
+                       for start, end in zip(boundaries[:-1], boundaries[1:])]
+        sports = np.concatenate([result[0] for result in results])
+        raw_values = np.concatenate([result[2] for result in results])
+        self.assertEqual(expected_sports, sports.tolist())
+        self.assertEqual(len(expected_sports), sum(len(result[1]) for result in results))
+        np.testing.assert_allclose(expected_raw_values, raw_values)
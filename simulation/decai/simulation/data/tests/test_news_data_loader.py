@@ -1,4 +1,7 @@
+import tempfile
 import unittest
+from pathlib import Path
+from types import SimpleNamespace
 from typing import cast
 
 from injector import Injector
@@ -28,3 +31,31 @@ class TestNewsDataLoader(unittest.TestCase):
         doc = self.data_loader._nlp("December 25, 2019, John Smith walked to a store and bought an apple.")
         actual = self.data_loader._replace_entities(doc)
         self.assertEqual("<DATE>, <PERSON> walked to a store and bought an apple.", actual)
+
+    def test_pre_process_texts_cached(self):
+        inj = Injector([
+            LoggingModule,
+            NewsDataModule(replace_entities_enabled=True),
+        ])
+        data_loader = cast(NewsDataLoader, inj.get(DataLoader))
+        # spaCy should only be loaded when it is needed.
+        self.assertIsNone(data_loader._loaded_nlp)
+
+        num_pipe_calls = 0
+
+        def pipe(texts, **kwargs):
+            nonlocal num_pipe_calls
+            num_pipe_calls += 1
+            for text in texts:
+                start = text.index("John")
+                ent = SimpleNamespace(label_='PERSON', start_char=start, end_char=start + len("John"))
+                yield SimpleNamespace(text=text, ents=[ent])
+
+        data_loader._loaded_nlp = SimpleNamespace(pipe=pipe)
+        texts = ["John walked.", "Then John ran."]
+        expected = ["<PERSON> walked.", "Then <PERSON> ran."]
+        with tempfile.TemporaryDirectory() as cache_dir:
+            data_loader._cache_dir = Path(cache_dir)
+            self.assertEqual(expected, data_loader._pre_process_texts(texts))
+            self.assertEqual(expected, data_loader._pre_process_texts(texts))
+        self.assertEqual(1, num_pipe_calls)
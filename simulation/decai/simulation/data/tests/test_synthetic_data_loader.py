@@ -0,0 +1,86 @@
+import logging
+import unittest
+
+import numpy as np
+import scipy.sparse
+from injector import Injector
+
+from decai.simulation.data.data_loader import DataLoader
+from decai.simulation.data.synthetic_data_loader import SyntheticDataLoader, SyntheticDataModule
+from decai.simulation.logging_module import LoggingModule
+
+
+class TestSyntheticDataLoader(unittest.TestCase):
+    def test_load_data(self):
+        inj = Injector([
+            LoggingModule,
+            SyntheticDataModule(num_samples=1_000, num_features=5, chunk_size=64),
+        ])
+        data_loader = inj.get(DataLoader)
+        self.assertIsInstance(data_loader, SyntheticDataLoader)
+        self.assertEqual(["0", "1"], data_loader.classifications())
+        (x_train, y_train), (x_test, y_test) = data_loader.load_data()
+        self.assertEqual((700, 5), x_train.shape)
+        self.assertEqual((300, 5), x_test.shape)
+        self.assertEqual(700, len(y_train))
+        self.assertEqual(300, len(y_test))
+        self.assertTrue(np.all((0 <= x_train) & (x_train <= 3)))
+        # The classes should be roughly balanced.
+        self.assertGreater(y_train.mean(), 0.3)
+        self.assertLess(y_train.mean(), 0.7)
+
+        (x_train, y_train), (x_test, y_test) = data_loader.load_data(train_size=10, test_size=20)
+        self.assertEqual((10, 5), x_train.shape)
+        self.assertEqual((20, 5), x_test.shape)
+
+    def test_deterministic_chunks(self):
+        logger = logging.getLogger()
+        data_loader = SyntheticDataLoader(logger, num_samples=100, num_classes=3, label_noise=0.1, drift=0.5,
+                                          chunk_size=16)
+        x, y = data_loader._load(0, 100)
+        self.assertEqual(set(range(3)), set(y.tolist()))
+
+        chunks = list(data_loader.iter_chunks(10, 50))
+        self.assertEqual([6, 16, 16, 2], [len(chunk_y) for _, chunk_y in chunks])
+        self.assertEqual(x[10:50].tolist(), np.concatenate([chunk_x for chunk_x, _ in chunks]).tolist())
+        self.assertEqual(y[10:50].tolist(), np.concatenate([chunk_y for _, chunk_y in chunks]).tolist())
+
+        # The samples only depend on the seed.
+        same_seed = SyntheticDataLoader(logger, num_samples=100, num_classes=3, label_noise=0.1, drift=0.5,
+                                        chunk_size=16)
+        self.assertEqual(y.tolist(), same_seed._load(0, 100)[1].tolist())
+        other_seed = SyntheticDataLoader(logger, num_samples=100, num_classes=3, label_noise=0.1, drift=0.5,
+                                         chunk_size=16, seed=3)
+        self.assertNotEqual(y.tolist(), other_seed._load(0, 100)[1].tolist())
+
+    def test_sparse(self):
+        num_features = 1_000_000
+        data_loader = SyntheticDataLoader(logging.getLogger(), num_samples=2_000, num_features=num_features,
+                                          density=1E-4, sparse=True, chunk_size=500)
+        (x_train, y_train), (x_test, y_test) = data_loader.load_data()
+        self.assertTrue(scipy.sparse.isspmatrix_csr(x_train))
+        self.assertTrue(scipy.sparse.isspmatrix_csr(x_test))
+        self.assertEqual((1_400, num_features), x_train.shape)
+        self.assertEqual((600, num_features), x_test.shape)
+        self.assertAlmostEqual(100, x_train.getnnz(axis=1).mean(), delta=5)
+        self.assertTrue(np.all((1 <= x_train.data) & (x_train.data <= 3)))
+
+    def test_label_noise(self):
+        logger = logging.getLogger()
+        clean = SyntheticDataLoader(logger, num_samples=10_000)
+        noisy = SyntheticDataLoader(logger, num_samples=10_000, label_noise=0.2)
+        (x_clean, y_clean), _ = clean.load_data()
+        (x_noisy, y_noisy), _ = noisy.load_data()
+        self.assertEqual(x_clean.tolist(), x_noisy.tolist())
+        self.assertAlmostEqual(0.2, (y_clean != y_noisy).mean(), delta=0.02)
+
+    def test_drift(self):
+        logger = logging.getLogger()
+        no_drift = SyntheticDataLoader(logger, num_samples=10_000)
+        drift = SyntheticDataLoader(logger, num_samples=10_000, drift=1)
+        (x, y), (x_test, y_test) = no_drift.load_data()
+        (x_drift, y_drift), (x_test_drift, y_test_drift) = drift.load_data()
+        self.assertEqual(x.tolist(), x_drift.tolist())
+        # The labels start the same and change more over time.
+        self.assertEqual(y[:10].tolist(), y_drift[:10].tolist())
+        self.assertLess((y[:1000] != y_drift[:1000]).mean(), (y_test != y_test_drift).mean())
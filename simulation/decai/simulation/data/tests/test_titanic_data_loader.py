@@ -0,0 +1,40 @@
+import logging
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from decai.simulation.data.titanic_data_loader import TitanicDataLoader
+
+
+class TestTitanicDataLoader(unittest.TestCase):
+    def test_get_features(self):
+        data = pd.DataFrame([
+            dict(PassengerId=1, Pclass=3, Name="Braund, Mr. Owen Harris", Sex='male', SibSp=1, Parch=0,
+                 Ticket="A/5 21171", Cabin=None),
+            dict(PassengerId=2, Pclass=1, Name="Cumings, Mrs. John Bradley (Florence Briggs Thayer)", Sex='female',
+                 SibSp=1, Parch=0, Ticket="PC 17599", Cabin="C85"),
+            dict(PassengerId=3, Pclass=3, Name="Heikkinen, Miss. Laina", Sex='female', SibSp=0, Parch=0,
+                 Ticket="STON/O2. 3101282", Cabin=None),
+            dict(PassengerId=4, Pclass=3, Name="Palsson, Master. Gosta Leonard", Sex='male', SibSp=3, Parch=1,
+                 Ticket="349909", Cabin=None),
+            dict(PassengerId=5, Pclass=1, Name="Leader, Dr. Alice (Farnham)", Sex='female', SibSp=0, Parch=0,
+                 Ticket="17465", Cabin="D17"),
+            dict(PassengerId=6, Pclass=2, Name="Harper, Rev. John", Sex='male', SibSp=0, Parch=1,
+                 Ticket="248727", Cabin=None),
+            # The later title type is used when there are multiple titles.
+            dict(PassengerId=7, Pclass=1, Name="Rothes, the Countess. of (Lucy Noel Martha Dyer-Edwards) Dr. X",
+                 Sex='male', SibSp=0, Parch=0, Ticket="110152", Cabin="B77"),
+        ])
+        loader = TitanicDataLoader(logging.getLogger())
+        features = loader._get_features(data)
+        self.assertIsInstance(features, np.ndarray)
+        self.assertEqual([
+            [3, 0, 0, 1],
+            [1, 1, 1, 1],
+            [3, 1, 2, 0],
+            [3, 0, 3, 4],
+            [1, 1, 1, 0],
+            [2, 0, 0, 1],
+            [1, 0, 0, 0],
+        ], features.tolist())
@@ -1,6 +1,8 @@
 import unittest
+from collections import Counter
 from typing import cast
 
+import numpy as np
 from injector import Injector
 
 from decai.simulation.data.data_loader import DataLoader
@@ -35,3 +37,101 @@ class TestTicTacToeDataLoader(unittest.TestCase):
 
         assert set(y_train) <= set(range(9))
         assert set(y_test) <= set(range(9))
+
+        # The board is empty where the move is made.
+        x = np.concatenate([x_train, x_test])
+        y = np.concatenate([y_train, y_test])
+        assert np.all(x[np.arange(len(x)), y] == 0)
+
+    def _get_samples(self, ttt: TicTacToeDataLoader) -> Counter:
+        (x_train, y_train), (x_test, y_test) = ttt.load_data()
+        x = np.concatenate([x_train, x_test])
+        y = np.concatenate([y_train, y_test])
+        return Counter(zip(map(tuple, x.tolist()), y.tolist()))
+
+    def _get_original_samples(self) -> Counter:
+        """
+        Enumerate the games for a 3x3 board by trying every path like the original implementation.
+        """
+        samples = Counter()
+        bad_moves = set()
+
+        def fill(board, start_pos, next_player, path):
+            for pos in range(start_pos, 9):
+                if board[pos] == 0:
+                    _board = board.copy()
+                    _board[pos] = next_player
+                    if self.ttt.get_winner(_board) is not None:
+                        if next_player == 1:
+                            for history_board, history_pos, history_player in path + [(board, pos, next_player)]:
+                                if history_player == 1:
+                                    samples[(tuple(history_board.tolist()), history_pos)] += 1
+                                else:
+                                    # The original implementation negated the position.
+                                    bad_moves.add((tuple((-history_board).tolist()), -history_pos))
+                        return
+            for pos in range(start_pos, 9):
+                if board[pos] == 0:
+                    _board = board.copy()
+                    _board[pos] = next_player
+                    fill(_board, start_pos, -next_player, path + [(board, pos, next_player)])
+
+        for init_pos in range(9):
+            for player in (1, -1):
+                board = np.zeros(9, dtype=np.int8)
+                path = [(board.copy(), init_pos, player)]
+                board[init_pos] = player
+                fill(board, init_pos + 1, -player, path)
+
+        for sample in bad_moves:
+            del samples[sample]
+        return samples
+
+    def test_original_samples(self):
+        original_samples = self._get_original_samples()
+        assert sum(original_samples.values()) == 17786
+        assert len(original_samples) == 2144
+        assert self._get_samples(self.ttt) == original_samples
+
+    def test_options(self):
+        original_samples = self._get_original_samples()
+
+        ttt = TicTacToeDataLoader(self.ttt._logger, deduplicate=True)
+        samples = self._get_samples(ttt)
+        assert samples.keys() == original_samples.keys()
+        assert set(samples.values()) == {1}
+
+        ttt = TicTacToeDataLoader(self.ttt._logger, deduplicate=True, remove_bad_moves=True)
+        samples = self._get_samples(ttt)
+        assert set(samples.values()) == {1}
+        assert samples.keys() < original_samples.keys()
+        # The opponent lost some games after starting at position 1.
+        assert (tuple([0] * 9), 1) in original_samples
+        assert (tuple([0] * 9), 1) not in samples
+
+    def test_get_winner(self):
+        board = np.zeros((3, 3), dtype=np.int8)
+        assert self.ttt.get_winner(board) is None
+        board[0, 2] = board[1, 1] = board[2, 0] = -1
+        assert self.ttt.get_winner(board) == -1
+        board[1, 1] = 1
+        assert self.ttt.get_winner(board) is None
+
+    def test_win_length(self):
+        inj = Injector([
+            LoggingModule,
+            TicTacToeDataModule(width=4, length=4, win_length=3),
+        ])
+        ttt = inj.get(DataLoader)
+        assert isinstance(ttt, TicTacToeDataLoader)
+        ttt = cast(TicTacToeDataLoader, ttt)
+
+        board = np.zeros((4, 4), dtype=np.int8)
+        board[1, 3] = board[2, 2] = board[3, 1] = 1
+        assert ttt.get_winner(board) == 1
+        board[3, 1] = 0
+        board[1, 0] = board[1, 1] = board[1, 2] = -1
+        assert ttt.get_winner(board) == -1
+        # Each way to win has 3 positions.
+        assert len(ttt._win_masks) == 2 * 4 * 2 + 2 * 2 * 2
+        assert all(bin(mask).count('1') == 3 for mask in ttt._win_masks)
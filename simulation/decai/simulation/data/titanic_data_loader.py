@@ -1,4 +1,5 @@
 import os
+import re
 from dataclasses import dataclass, field
 from logging import Logger
 from typing import List
@@ -28,7 +29,7 @@ class TitanicDataLoader(DataLoader):
     def classifications(self) -> List[str]:
         return ["DIED", "SURVIVED"]
 
-    def _get_features(self, data: pd.DataFrame):
+    def _get_features(self, data: pd.DataFrame) -> np.ndarray:
         """
         Map the data to numbers.
         Also uses some ideas from https://triangleinequality.wordpress.com/2013/09/08/basic-feature-engineering-with-the-titanic-data/
@@ -51,56 +52,35 @@ class TitanicDataLoader(DataLoader):
             ' Miss. ': 2,
             ' Master. ': 3,
         }
-
-        def _get_title(row):
-            result = None
-            name = row['Name']
-            for index, titles in enumerate(title_tuples):
-                for t in titles:
-                    if t in name:
-                        result = titles[0]
-            if result == ' Dr. ':
-                if row['Sex'] == 'male':
-                    result = ' Mr. '
+        is_male = (data['Sex'] == 'male').to_numpy()
+
+        def _get_titles() -> np.ndarray:
+            result = np.full(len(data), -1)
+            # Later titles take precedence when a name has more than one.
+            for titles in title_tuples:
+                has_title = data['Name'].str.contains('|'.join(map(re.escape, titles))).to_numpy()
+                if titles[0] == ' Dr. ':
+                    title_nums = np.where(is_male, title_to_num[' Mr. '], title_to_num[' Mrs. '])
                 else:
-                    result = ' Mrs. '
-            assert result is not None, f"No title found in {row}."
-            result = title_to_num[result]
-            return result
-
-        def _get_cabin(row):
-            result = -1
-            cabin = row['Cabin']
-            if isinstance(cabin, str):
-                for c in 'ABCDEFGT':
-                    if c in cabin:
-                        result = ord(c) - ord('A')
-                        break
+                    title_nums = title_to_num[titles[0]]
+                result = np.where(has_title, title_nums, result)
+            assert np.all(result >= 0), f"No title found in {data[result < 0]}."
             return result
 
-        result = []
-        for index, row in data.iterrows():
-            if row['Sex'] == 'male':
-                sex = 0
-            else:
-                sex = 1
-
-            family_size = row['SibSp'] + row['Parch']
-            datum = [
-                row['Pclass'],
-                sex,
-                _get_title(row),
-                family_size,
-
-                # These features did not help:
-                # _get_cabin(row),
-                # row['Age'],
-                # row['Parch'],
-                # row['SibSp'],
-                # row['Fare'],
-                # row['Fare'] / (family_size + 1),
-            ]
-            result.append(datum)
+        family_size = (data['SibSp'] + data['Parch']).to_numpy()
+        result = np.column_stack([
+            data['Pclass'].to_numpy(),
+            (~is_male).astype(np.int64),
+            _get_titles(),
+            family_size,
+
+            # These features did not help:
+            # data['Age'],
+            # data['Parch'],
+            # data['SibSp'],
+            # data['Fare'],
+            # data['Fare'] / (family_size + 1),
+        ])
 
         return result
 
@@ -117,7 +97,6 @@ class TitanicDataLoader(DataLoader):
         x_train.drop(columns=['Survived'], inplace=True)
         x_train = self._get_features(x_train)
 
-        x_train = np.array(x_train)
         x_train, y_train = shuffle(x_train, y_train, random_state=self._seed)
         train_split = int(len(x_train) * self._train_split)
         x_test, y_test = x_train[train_split:], y_train[train_split:]
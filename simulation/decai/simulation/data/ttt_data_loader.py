@@ -1,9 +1,11 @@
+from array import array
+from collections import defaultdict
 from dataclasses import dataclass, field
 from logging import Logger
-from typing import List
+from typing import List, Optional, Tuple
 
 import numpy as np
-from injector import inject, Module
+from injector import ClassAssistedBuilder, Module, inject, provider, singleton
 from sklearn.utils import shuffle
 from tqdm import trange
 
@@ -19,111 +21,245 @@ class TicTacToeDataLoader(DataLoader):
     Data is flattened `width` x `length` games.
     The players are 1 and -1. The data is from the perspective of player 1, opponent is -1.
     0 means no one has played in that position.
+
+    Games are enumerated with bitboards: each player's positions are the set bits of an integer.
+    Results for positions that were already seen are reused so larger boards such as 4x4 can be enumerated.
     """
 
     _logger: Logger
     _seed: int = field(default=2, init=False)
     _train_split: float = field(default=0.7, init=False)
 
-    width: int = field(default=3, init=False)
-    length: int = field(default=3, init=False)
+    width: int = field(default=3)
+    length: int = field(default=3)
+    win_length: Optional[int] = field(default=None)
+    """
+    The number of positions in a row, column, or diagonal that a player needs to win.
+    Defaults to the width of the board.
+    """
+
+    deduplicate: bool = field(default=False)
+    """
+    `True` to only add each move once.
+    Otherwise, each move is added once for each game that it was made in.
+    The number of games grows quickly so this should be set for boards larger than 3x3.
+    """
+
+    remove_bad_moves: bool = field(default=False)
+    """
+    `True` to remove all moves that player -1 made in games that it lost, flipped to player 1's perspective.
+    Otherwise, only those moves at position 0 are removed, like the original enumeration.
+    """
+
+    _win_masks: List[int] = field(init=False)
+    """
+    Bitboards with the positions for each way to win.
+    """
+
+    _win_masks_by_pos: List[Tuple[int, ...]] = field(init=False)
+    """
+    The win masks that include each position.
+    """
+
+    def __post_init__(self):
+        assert self.width == self.length, "The following code assumes that the board is square."
+        if self.win_length is None:
+            self.win_length = self.width
+        assert 0 < self.win_length <= self.width
+        num_positions = self.width * self.length
+        # Moves are encoded with both bitboards and the position in a 64-bit integer.
+        assert 2 * num_positions + num_positions.bit_length() < 63, "The board is too large."
+
+        self._win_masks = []
+        for pos in range(num_positions):
+            i, j = self.map_pos(pos)
+            for di, dj in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                end_i, end_j = i + (self.win_length - 1) * di, j + (self.win_length - 1) * dj
+                if not (0 <= end_i < self.length and 0 <= end_j < self.width):
+                    continue
+                mask = 0
+                for k in range(self.win_length):
+                    mask |= 1 << ((i + k * di) * self.width + j + k * dj)
+                self._win_masks.append(mask)
+        self._win_masks_by_pos = [tuple(mask for mask in self._win_masks if mask >> pos & 1)
+                                  for pos in range(num_positions)]
 
     def classifications(self) -> List[str]:
         return list(map(str, map(self.map_pos, range(self.width * self.length))))
 
     def get_winner(self, board):
-        def get_single_winner(line: set):
-            if len(line) == 1:
-                val = next(iter(line))
-                if val != 0:
-                    return val
-            return None
-
-        for row in range(self.width):
-            result = get_single_winner(set(board[row]))
-            if result is not None:
-                return result
-        for col in range(self.length):
-            result = get_single_winner(set(board[:, col]))
-            if result is not None:
-                return result
-        result = get_single_winner(set(board.diagonal()))
-        if result is not None:
-            return result
-        diag_vals = set(board[i, self.length - 1 - i] for i in range(self.width))
-        result = get_single_winner(diag_vals)
-        if result is not None:
-            return result
-        return None
+        winner = self.get_winners(np.asarray(board).reshape(1, -1))[0]
+        return None if winner == 0 else int(winner)
+
+    def get_winners(self, boards: np.ndarray) -> np.ndarray:
+        """
+        :param boards: Flattened boards, one per row.
+        :return: The winner for each board: 1, -1, or 0 if no one has won.
+        """
+        powers_of_2 = 1 << np.arange(boards.shape[1], dtype=np.int64)
+        win_masks = np.array(self._win_masks, dtype=np.int64)
+        result = np.zeros(len(boards), dtype=np.int8)
+        for player in (-1, 1):
+            bits = (boards == player) @ powers_of_2
+            result[((bits[:, None] & win_masks) == win_masks).any(axis=1)] = player
+        return result
 
     def map_pos(self, pos):
         return pos // self.width, pos % self.width
 
-    def load_data(self, train_size: int = None, test_size: int = None) -> (tuple, tuple):
-        X, y = [], []
-        bad_moves = set()
+    def _enumerate_moves(self, count_games: bool) -> Tuple[np.ndarray, Optional[np.ndarray], np.ndarray]:
+        """
+        Enumerate games where the first move can be anywhere and later moves are after the first move.
+        A player that can win with their next move always makes the first such move.
 
-        players = (1, -1)
-        assert self.width == self.length, "The following code assumes that the board is square."
+        :param count_games: `True` to count the number of games that each move was made in.
+        :return: The encoded moves made by player 1 in games that player 1 wins,
+            the number of those games that each move was made in or `None` if `count_games` is `False`,
+            and the encoded moves, flipped to player 1's perspective, made by player -1 in those games.
+            See `_decode_moves`.
+        """
+        num_positions = self.width * self.length
+        win_masks_by_pos = self._win_masks_by_pos
+        pos_shift = 2 * num_positions
+        # Map boards to unique indices by using a base 3 digit for each position.
+        powers_of_3 = [3 ** pos for pos in range(num_positions)]
+        # The number of games from each board that player 1 wins, plus 1. 0 means not seen yet.
+        # Without counting games, only whether player 1 can win is kept so that a byte is enough.
+        if count_games and 3 ** num_positions <= 1 << 24:
+            memo = array('q', bytes(8 * 3 ** num_positions))
+        elif not count_games and 3 ** num_positions <= 1 << 27:
+            memo = bytearray(3 ** num_positions)
+        else:
+            memo = defaultdict(int)
+        winning_moves = array('q')
+        bad_moves = array('q')
+        # To count games: the board that each winning move was made on and the number of games won after it.
+        winning_move_boards = array('q')
+        winning_move_wins = array('q')
+        # To count games: the moves, as the boards before and after them, that are in games that player 1 wins.
+        # A move is always added after the moves from the board after it.
+        edge_starts = array('q')
+        edge_ends = array('q')
+
+        def fill(ones: int, others: int, board_index: int, start_pos: int, next_player: int) -> int:
+            """
+            :return: The number of games from this board that player 1 wins.
+            """
+            # The board determines `start_pos` and `next_player`.
+            seen = memo[board_index]
+            if seen != 0:
+                return seen - 1
+            occupied = ones | others
+            empty_positions = [pos for pos in range(start_pos, num_positions) if not occupied >> pos & 1]
+            player_bits = ones if next_player == 1 else others
 
-        def fill(board, start_pos, next_player, path):
             # See if there is a winning move.
-            winner = None
-            for pos in range(start_pos, self.width * self.length):
-                i, j = self.map_pos(pos)
-                if board[i, j] != 0:
-                    continue
-                _board = board.copy()
-                _board[i, j] = next_player
-                winner = self.get_winner(_board)
-                if winner is not None:
-                    path.append((board, pos, next_player))
-                    break
-
-            if winner is not None:
-                # Only count wins for one of the players to make setting up games simpler.
-                if winner == players[0]:
-                    for history_board, history_position, history_player in path:
-                        history_board = history_board.flatten()
-                        if history_player == winner:
-                            X.append(history_board)
-                            y.append(history_position)
-                        else:
-                            bad_moves.add((tuple(-history_board.flatten()), -history_position))
-            else:
-                # Recurse.
-                for pos in range(start_pos, self.width * self.length):
-                    i, j = self.map_pos(pos)
-                    if board[i, j] != 0:
-                        continue
-                    _path = list(path)
-                    _path.append((board, pos, next_player))
-                    _board = board.copy()
-                    _board[i, j] = next_player
-                    fill(_board, start_pos, next_player=-1 if next_player == 1 else 1, path=_path)
+            for pos in empty_positions:
+                bits = player_bits | 1 << pos
+                if any(bits & mask == mask for mask in win_masks_by_pos[pos]):
+                    # Only count wins for one of the players to make setting up games simpler.
+                    if next_player == 1:
+                        winning_moves.append(ones | others << num_positions | pos << pos_shift)
+                        if count_games:
+                            winning_move_boards.append(board_index)
+                            winning_move_wins.append(1)
+                        result = 1
+                    else:
+                        result = 0
+                    memo[board_index] = result + 1
+                    return result
 
-        self._logger.info("Loading Tic Tac Toe data.")
+            # Recurse.
+            result = 0
+            for pos in empty_positions:
+                if next_player == 1:
+                    next_board_index = board_index + powers_of_3[pos]
+                    wins = fill(ones | 1 << pos, others, next_board_index, start_pos, -1)
+                    if wins > 0:
+                        winning_moves.append(ones | others << num_positions | pos << pos_shift)
+                        if count_games:
+                            winning_move_boards.append(board_index)
+                            winning_move_wins.append(wins)
+                else:
+                    next_board_index = board_index + 2 * powers_of_3[pos]
+                    wins = fill(ones, others | 1 << pos, next_board_index, start_pos, 1)
+                    if wins > 0:
+                        # Flip the board for the opponent.
+                        bad_moves.append(others | ones << num_positions | pos << pos_shift)
+                if wins > 0 and count_games:
+                    edge_starts.append(board_index)
+                    edge_ends.append(next_board_index)
+                result += wins
+            if not count_games:
+                result = min(result, 1)
+            memo[board_index] = result + 1
+            return result
 
-        for init_pos in trange(self.width * self.length,
+        # The number of ways to get to each board in games that player 1 wins.
+        num_paths = defaultdict(int)
+        num_paths[0] = 1
+        for init_pos in trange(num_positions,
                                desc="Making boards",
                                unit_scale=True, mininterval=2, unit=" start positions"
                                ):
-            pos = self.map_pos(init_pos)
+            bit = 1 << init_pos
+            wins = fill(bit, 0, powers_of_3[init_pos], init_pos + 1, next_player=-1)
+            if wins > 0:
+                winning_moves.append(init_pos << pos_shift)
+                if count_games:
+                    winning_move_boards.append(0)
+                    winning_move_wins.append(wins)
+                    num_paths[powers_of_3[init_pos]] = 1
+            if fill(0, bit, 2 * powers_of_3[init_pos], init_pos + 1, next_player=1) > 0:
+                bad_moves.append(init_pos << pos_shift)
+                if count_games:
+                    num_paths[2 * powers_of_3[init_pos]] = 1
+
+        counts = None
+        if count_games:
+            # Go through the moves backwards so that all of the ways to get to a board are counted before the moves
+            # from that board.
+            for start, end in zip(reversed(edge_starts), reversed(edge_ends)):
+                num_paths[end] += num_paths[start]
+            counts = np.array([num_paths[board_index] * wins
+                               for board_index, wins in zip(winning_move_boards, winning_move_wins)],
+                              dtype=np.int64)
+
+        return np.frombuffer(winning_moves, dtype=np.int64), counts, np.frombuffer(bad_moves, dtype=np.int64)
+
+    def _decode_moves(self, moves: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param moves: Moves encoded as player 1's bitboard, player -1's bitboard, then the position.
+        :return: The flattened boards and the positions.
+        """
+        num_positions = self.width * self.length
+        boards = np.empty((len(moves), num_positions), dtype=np.int8)
+        # Go one position at a time to avoid large temporary arrays.
+        for pos in range(num_positions):
+            boards[:, pos] = ((moves >> pos) & 1) - ((moves >> (pos + num_positions)) & 1)
+        positions = moves >> (2 * num_positions)
+        return boards, positions
 
-            for player in players:
-                board = np.zeros((self.width, self.length), dtype=np.int8)
-                path = [(board.copy(), init_pos, player)]
-                board[pos] = player
-                fill(board, init_pos + 1, next_player=-1 if player == 1 else 1, path=path)
+    def load_data(self, train_size: int = None, test_size: int = None) -> (tuple, tuple):
+        self._logger.info("Loading Tic Tac Toe data.")
 
+        winning_moves, counts, bad_moves = self._enumerate_moves(count_games=not self.deduplicate)
+        if not self.remove_bad_moves:
+            # The original enumeration negated the positions of bad moves so only the ones at position 0 matched.
+            bad_moves = bad_moves[bad_moves >> (2 * self.width * self.length) == 0]
         # Remove bad moves.
         # Note this might not help much depending on the model.
-        X, y = zip(*[(X[i], y[i]) for i in range(len(X)) if (tuple(X[i]), y[i]) not in bad_moves])
+        keep = ~np.isin(winning_moves, bad_moves)
+        winning_moves = winning_moves[keep]
+        if counts is not None:
+            # Add each move once for each game that it was made in.
+            winning_moves = np.repeat(winning_moves, counts[keep])
+        X, y = self._decode_moves(winning_moves)
 
         X, y = shuffle(X, y, random_state=self._seed)
         split = int(self._train_split * len(X))
-        x_train, y_train = np.array(X[:split]), np.array(y[:split])
-        x_test, y_test = np.array(X[split:]), np.array(y[split:])
+        x_train, y_train = X[:split], y[:split]
+        x_test, y_test = X[split:], y[split:]
 
         if train_size is not None:
             x_train, y_train = x_train[:train_size], y_train[:train_size]
@@ -140,6 +276,16 @@ class TicTacToeDataLoader(DataLoader):
         return (x_train, y_train), (x_test, y_test)
 
 
+@dataclass
 class TicTacToeDataModule(Module):
-    def configure(self, binder):
-        binder.bind(DataLoader, TicTacToeDataLoader)
+    width: int = field(default=3)
+    length: int = field(default=3)
+    win_length: Optional[int] = field(default=None)
+    deduplicate: bool = field(default=False)
+    remove_bad_moves: bool = field(default=False)
+
+    @provider
+    @singleton
+    def provide_data_loader(self, builder: ClassAssistedBuilder[TicTacToeDataLoader]) -> DataLoader:
+        return builder.build(width=self.width, length=self.length, win_length=self.win_length,
+                             deduplicate=self.deduplicate, remove_bad_moves=self.remove_bad_moves)
@@ -0,0 +1,47 @@
+from typing import Tuple
+
+import numpy as np
+
+
+def lttb(x: np.ndarray, y: np.ndarray, max_points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Downsample a line while keeping its shape using the Largest-Triangle-Three-Buckets algorithm
+    from "Downsampling Time Series for Visual Representation" by Sveinn Steinarsson.
+
+    The first and last points are kept.
+    The other points are split into buckets and the point from each bucket that makes the largest triangle
+    with the point kept from the previous bucket and the average of the next bucket is kept.
+
+    :param x: The x values, sorted.
+    :param y: The y values.
+    :param max_points: The maximum number of points to keep. Must be at least 3.
+    :return: The kept x and y values.
+    """
+    assert len(x) == len(y)
+    assert max_points >= 3
+    num_points = len(x)
+    if num_points <= max_points:
+        return x, y
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # Bucket boundaries for the points between the first and last points.
+    bounds = np.floor(np.linspace(1, num_points - 1, max_points - 1)).astype(np.int64)
+    kept = np.empty(max_points, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = num_points - 1
+    prev = 0
+    for i in range(max_points - 2):
+        start, end = bounds[i], bounds[i + 1]
+        if i + 2 < len(bounds):
+            next_start, next_end = end, bounds[i + 2]
+        else:
+            next_start, next_end = num_points - 1, num_points
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+        # Twice the area of each triangle. The constant factor doesn't matter for finding the largest.
+        areas = np.abs((x[prev] - next_x) * (y[start:end] - y[prev])
+                       - (x[prev] - x[start:end]) * (next_y - y[prev]))
+        prev = start + int(np.argmax(areas))
+        kept[i + 1] = prev
+    return x[kept], y[kept]
@@ -0,0 +1,253 @@
+import math
+from dataclasses import dataclass
+from logging import Logger
+from statistics import NormalDist
+from threading import Condition, Thread
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+from decai.simulation.contract.classification.classifier import Classifier
+from decai.simulation.profiling import profiler
+
+
+@dataclass
+class AccuracyEstimate:
+    """
+    An estimate of a model's accuracy on a test set.
+    """
+
+    accuracy: float
+
+    half_width: float
+    """ Half of the width of the confidence interval for the accuracy. 0 for exact evaluations. """
+
+    num_samples: int
+    """ The number of test samples that were used. """
+
+    exact: bool
+    """ `True` if the entire test set was used. """
+
+    @property
+    def lower(self) -> float:
+        return max(0.0, self.accuracy - self.half_width)
+
+    @property
+    def upper(self) -> float:
+        return min(1.0, self.accuracy + self.half_width)
+
+
+class AccuracyEstimator(object):
+    """
+    Estimates the accuracy of a model on a test set from stratified subsamples
+    so that large test sets don't need to be evaluated every time.
+
+    Each estimate uses new random samples from each class in proportion to the size of the class.
+    The entire test set is evaluated when an exact value is requested,
+    when the confidence interval for an estimate is too wide, or when the subsample would be most of the test set.
+
+    The number of samples adapts to how much the accuracy changes between evaluations:
+    when the accuracy changes a lot, small changes don't matter so fewer samples are used,
+    when the accuracy is stable, more samples are used to see small changes.
+    """
+
+    def __init__(self, x_test, y_test,
+                 max_half_width: float = 0.01,
+                 min_half_width: Optional[float] = None,
+                 confidence: float = 0.95,
+                 min_sample_size: int = 100,
+                 max_sample_portion: float = 0.5,
+                 seed: Optional[int] = None):
+        """
+        :param x_test: The features of the test set.
+        :param y_test: The labels of the test set.
+        :param max_half_width: The widest allowed half-width of the confidence interval for estimates.
+        :param min_half_width: The narrowest half-width to aim for when the accuracy is stable.
+            Defaults to a quarter of `max_half_width`.
+        :param confidence: The confidence level for the intervals.
+        :param min_sample_size: The minimum number of samples to use for an estimate.
+        :param max_sample_portion: Evaluate the entire test set if a subsample would be larger than this portion.
+        :param seed: Seed for choosing subsamples.
+        """
+        if min_half_width is None:
+            min_half_width = max_half_width / 4
+        assert 0 < min_half_width <= max_half_width
+        assert 0 < confidence < 1
+        assert 0 < max_sample_portion <= 1
+        self.x_test = x_test
+        self.y_test = np.asarray(y_test)
+        self.max_half_width = max_half_width
+        self.min_half_width = min_half_width
+        self.min_sample_size = min_sample_size
+        self.max_sample_portion = max_sample_portion
+
+        self._num_test_samples = len(self.y_test)
+        assert self._num_test_samples > 0, "The test set is empty."
+        _, class_indices = np.unique(self.y_test, return_inverse=True)
+        self._indices_by_class = [np.flatnonzero(class_indices == c) for c in range(class_indices.max() + 1)]
+        self._class_weights = np.array([len(indices) for indices in self._indices_by_class]) / self._num_test_samples
+        self._z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self._rng = np.random.default_rng(seed)
+
+        self.sample_size = self._get_sample_size(0.5, max_half_width)
+        """ The number of samples to use for the next estimate. """
+
+        self._previous_accuracy: Optional[float] = None
+        self._mean_change: Optional[float] = None
+
+    def _evaluate_all(self, model: Classifier) -> AccuracyEstimate:
+        profiler.count('full accuracy evaluations')
+        accuracy = model.evaluate(self.x_test, self.y_test)
+        return AccuracyEstimate(accuracy, 0.0, self._num_test_samples, exact=True)
+
+    def _estimate(self, model: Classifier) -> AccuracyEstimate:
+        profiler.count('estimated accuracy evaluations')
+        num_per_class = [min(len(indices), max(1, int(round(self.sample_size * weight))))
+                         for indices, weight in zip(self._indices_by_class, self._class_weights)]
+        indices = np.concatenate([self._rng.choice(class_indices, n, replace=False)
+                                  for class_indices, n in zip(self._indices_by_class, num_per_class)])
+        correct = np.asarray(model.predict_batch(self.x_test[indices])) == self.y_test[indices]
+        accuracy = 0.0
+        variance = 0.0
+        start = 0
+        for class_indices, n, weight in zip(self._indices_by_class, num_per_class, self._class_weights):
+            num_correct = np.count_nonzero(correct[start:start + n])
+            start += n
+            accuracy += weight * num_correct / n
+            # Smooth the proportion so that classes that are all right or all wrong still have some variance.
+            p = (num_correct + 1) / (n + 2)
+            finite_population_correction = 1 - n / len(class_indices)
+            variance += weight ** 2 * p * (1 - p) / n * finite_population_correction
+        return AccuracyEstimate(accuracy, self._z * math.sqrt(variance), len(indices), exact=False)
+
+    def _get_sample_size(self, accuracy: float, half_width: float) -> int:
+        # The sample size for a simple random sample, corrected for the finite test set.
+        # Stratifying usually makes the interval narrower.
+        p = min(max(accuracy, 0.05), 0.95)
+        n = (self._z / half_width) ** 2 * p * (1 - p)
+        n = n / (1 + n / self._num_test_samples)
+        return int(min(max(math.ceil(n), self.min_sample_size), self._num_test_samples))
+
+    def _update_sample_size(self, accuracy: float):
+        if self._previous_accuracy is not None:
+            change = abs(accuracy - self._previous_accuracy)
+            self._mean_change = change if self._mean_change is None else 0.5 * (self._mean_change + change)
+        self._previous_accuracy = accuracy
+        if self._mean_change is None:
+            target_half_width = self.max_half_width
+        else:
+            # Aim for an interval that is small compared to the typical change.
+            target_half_width = min(self.max_half_width, max(self.min_half_width, self._mean_change / 2))
+        self.sample_size = self._get_sample_size(accuracy, target_half_width)
+
+    def evaluate(self, model: Classifier, exact: bool = False) -> AccuracyEstimate:
+        """
+        :param model: The model to evaluate.
+        :param exact: `True` to evaluate the entire test set.
+        :return: The estimated accuracy.
+        """
+        if exact or self.sample_size > self.max_sample_portion * self._num_test_samples:
+            result = self._evaluate_all(model)
+        else:
+            result = self._estimate(model)
+            if result.half_width > self.max_half_width:
+                result = self._evaluate_all(model)
+        self._update_sample_size(result.accuracy)
+        return result
+
+
+class AsyncEvaluator(object):
+    """
+    Evaluates snapshots of a model in a background thread so that the simulation can keep running.
+
+    Only the most recently submitted snapshot is evaluated:
+    snapshots submitted while another snapshot is being evaluated replace each other.
+    """
+
+    def __init__(self, evaluate: Callable[[Classifier], float], logger: Logger):
+        """
+        :param evaluate: Computes the accuracy of a snapshot. Only called from the background thread.
+        :param logger: Logs errors from evaluating.
+        """
+        self._evaluate = evaluate
+        self._logger = logger
+        self._condition = Condition()
+        self._pending: Optional[Tuple[float, Classifier]] = None
+        self._is_evaluating = False
+        self._result: Optional[Tuple[float, float]] = None
+        self._closed = False
+        self._thread: Optional[Thread] = None
+        self._warned_about_evaluating = False
+        self.num_evaluated = 0
+
+    def submit(self, t: float, model: Classifier):
+        """
+        Request the model to be evaluated as it is now.
+
+        :param t: The time that the snapshot is for.
+        :param model: The model to take a snapshot of.
+        """
+        # Take the snapshot in the caller's thread so that the model doesn't change while it is being copied.
+        with profiler.timer('AsyncEvaluator.snapshot'):
+            snapshot = model.snapshot()
+        with self._condition:
+            assert not self._closed, "The evaluator has been closed."
+            self._pending = (t, snapshot)
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="AsyncEvaluator", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def pop_result(self) -> Optional[Tuple[float, float]]:
+        """
+        :return: The time and accuracy for the most recently evaluated snapshot
+            or `None` if no snapshot was evaluated since the last call.
+        """
+        with self._condition:
+            result = self._result
+            self._result = None
+            return result
+
+    def wait(self):
+        """
+        Wait for the most recently submitted snapshot to be evaluated.
+        """
+        with self._condition:
+            while self._pending is not None or self._is_evaluating:
+                self._condition.wait()
+
+    def close(self):
+        """
+        Evaluate the most recently submitted snapshot and stop the background thread.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                t, snapshot = self._pending
+                self._pending = None
+                self._is_evaluating = True
+            result = None
+            try:
+                with profiler.timer('AsyncEvaluator.evaluate'):
+                    result = (t, self._evaluate(snapshot))
+            except Exception as e:
+                if not self._warned_about_evaluating:
+                    self._logger.exception("Could not evaluate the model.", exc_info=e)
+                    self._warned_about_evaluating = True
+            finally:
+                with self._condition:
+                    if result is not None:
+                        self._result = result
+                        self.num_evaluated += 1
+                    self._is_evaluating = False
+                    self._condition.notify_all()
@@ -0,0 +1,390 @@
+import json
+import logging
+import math
+import os
+import random
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from logging import Logger
+from threading import Thread
+from typing import Deque, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from injector import Injector, Module, inject
+from tqdm import tqdm
+
+from decai.simulation.contract.balances import Balances
+from decai.simulation.contract.collab_trainer import CollaborativeTrainer
+from decai.simulation.contract.incentive.prediction_market import PredictionMarket
+from decai.simulation.contract.objects import Msg, RejectException, TimeMock
+from decai.simulation.data.data_loader import DataLoader, SampleStream
+from decai.simulation.data.featuremapping.feature_index_mapper import FeatureIndexMapper
+from decai.simulation.plot_stream import PlotRateLimiter, PlotStreamBridge
+from decai.simulation.run_metrics import metrics_path_for, save_metrics
+from decai.simulation.scheduler import Event, EventScheduler, EventType
+from decai.simulation.simulate import Agent, AgentPopulation, _PendingClaim
+
+
+@dataclass
+class ModelRun:
+    """
+    The simulation of one of the models.
+    """
+
+    name: str
+
+    decai: CollaborativeTrainer
+    """ The model, incentive mechanism, and data handler for the run. """
+
+    balances: Balances
+    """ The balances of the agents for the run. """
+
+    save_path: str
+    """ Where the data for the run is saved. """
+
+
+@dataclass
+class _ModelState:
+    """
+    The state of the simulation for one model.
+    """
+
+    run: ModelRun
+    time: TimeMock
+    remaining: SampleStream
+    rng: random.Random
+    save_data: dict
+    plot_limiter: PlotRateLimiter
+    unclaimed: Deque[_PendingClaim]
+    """ Data that was added and might still have some of its deposit left to claim, oldest first. """
+    accuracy: float = 0
+
+
+@inject
+@dataclass
+class MultiModelSimulator(object):
+    """
+    Simulate several models with the same agents and data so that they can be compared.
+
+    The data is loaded and mapped once and one event scheduler drives every model
+    so the agents' turns, deposits, and wait times are only drawn once for all of the models.
+    Each model gets its own incentive mechanism, data handler, balances, and time
+    so the models don't affect each other.
+    Agents make their decisions for each model separately since they depend on the model's accuracy,
+    but models that behave the same way get the same decisions.
+
+    Prediction markets are not supported since their reward phase happens after agents stop acting.
+    """
+
+    _data_loader: DataLoader
+    _feature_index_mapper: FeatureIndexMapper
+    _logger: Logger
+
+    def simulate(self,
+                 model_modules: Dict[str, Module],
+                 modules: Sequence[Module],
+                 agents: Union[List[Agent], AgentPopulation],
+                 baseline_accuracies: Optional[Dict[str, float]] = None,
+                 init_train_data_portion: float = 0.1,
+                 accuracy_plot_wait_s=2E5,
+                 train_size: int = None, test_size: int = None,
+                 filename_indicator: str = None,
+                 max_plotted_agents: int = 20,
+                 plot_interval_s: float = 60 * 60,
+                 seed: Optional[int] = None,
+                 ) -> Tuple[List[ModelRun], Thread]:
+        """
+        Start a simulation of several models.
+        The accuracy of each model is plotted in one figure.
+        The data for each model is saved like the data for a run of `Simulator` so the runs can be combined.
+
+        :param model_modules: The module to provide the `Classifier` for each model, by a name for the model.
+        :param modules: The other modules for each model, e.g. for the incentive mechanism and the logger.
+        :param agents: The agents that will interact with the data.
+            Use an `AgentPopulation` for many agents.
+        :param baseline_accuracies: The baseline accuracy for each model.
+        :param init_train_data_portion: The portion of the data to initially use for training. Must be [0,1].
+        :param accuracy_plot_wait_s: The amount of time to wait in seconds between plotting the accuracy.
+        :param train_size: The amount of training data to use.
+        :param test_size: The amount of test data to use.
+        :param filename_indicator: Path of the filename to create for the runs.
+            The name of each model is added to it.
+        :param max_plotted_agents: The maximum number of agents to save the balances of.
+        :param plot_interval_s: The minimum amount of simulated time between saved points for each line.
+        :param seed: Seed for the random decisions of the agents and the order that they start in.
+            Agents given as a list also use it for their deposits and wait times.
+        :return: The run for each model and the thread running the simulation.
+        """
+        assert len(model_modules) > 0, "There must be at least one model."
+        assert 0 <= init_train_data_portion <= 1
+        if baseline_accuracies is None:
+            baseline_accuracies = dict()
+        if seed is None:
+            seed = random.randrange(1 << 32)
+
+        # Imported here since they're slow to import and only needed when running a simulation.
+        from bokeh.document import Document
+        from bokeh.models import AdaptiveTicker, ColumnDataSource, FuncTickFormatter, PrintfTickFormatter
+        from bokeh.palettes import Category10_10
+        from bokeh.plotting import curdoc, figure
+
+        if not isinstance(agents, AgentPopulation):
+            agents = AgentPopulation.from_agents(agents, seed=seed)
+        num_plotted_agents = min(len(agents), max_plotted_agents)
+        plotted_agents = [agents[i] for i in range(num_plotted_agents)]
+
+        classifications = self._data_loader.classifications()
+        (x_train, y_train), (x_test, y_test) = self._data_loader.load_data(train_size=train_size, test_size=test_size)
+        x_train, x_test, feature_index_mapping = self._feature_index_mapper.map(x_train, x_test)
+        init_idx = int(x_train.shape[0] * init_train_data_portion)
+        self._logger.info("Initializing models with %d out of %d samples.", init_idx, x_train.shape[0])
+        x_init_data, y_init_data = x_train[:init_idx], y_train[:init_idx]
+        x_remaining, y_remaining = x_train[init_idx:], y_train[init_idx:]
+
+        time_for_filenames = int(time.time())
+        states: List[_ModelState] = []
+        for name, model_module in model_modules.items():
+            # A new injector for each model so that each model has its own singletons such as the balances.
+            inj = Injector([*modules, model_module])
+            decai = inj.get(CollaborativeTrainer)
+            assert not isinstance(decai.im, PredictionMarket), "Prediction markets are not supported."
+            indicator = name if filename_indicator is None else f"{filename_indicator}-{name}"
+            save_path = f'saved_runs/{time_for_filenames}-{indicator}-simulation_data.json'
+            states.append(_ModelState(
+                run=ModelRun(name, decai, inj.get(Balances), save_path),
+                time=inj.get(TimeMock),
+                remaining=SampleStream.from_arrays(x_remaining, y_remaining),
+                # The same seed for each model so that models that behave the same way get the same decisions.
+                rng=random.Random(seed),
+                save_data=dict(agents=[asdict(a) for a in plotted_agents],
+                               numAgents=len(agents),
+                               baselineAccuracy=baseline_accuracies.get(name),
+                               initTrainDataPortion=init_train_data_portion,
+                               accuracies=[],
+                               balances=[],
+                               ),
+                plot_limiter=PlotRateLimiter(plot_interval_s),
+                unclaimed=deque(),
+            ))
+        self._logger.info("Saving run info to \"%s\".", os.path.dirname(states[0].run.save_path))
+        os.makedirs(os.path.dirname(states[0].run.save_path), exist_ok=True)
+
+        # Set up one plot for all of the models.
+        doc: Document = curdoc()
+        doc.title = "DeCAI Simulation"
+        plot_stream = PlotStreamBridge(doc)
+        plot = figure(title="Accuracy on Hidden Test Set")
+        plot.width = 800
+        plot.height = 600
+        plot.xaxis.axis_label = "Time (days)"
+        plot.yaxis.axis_label = "Percent"
+        plot.xaxis[0].ticker = AdaptiveTicker(base=5 * 24 * 60 * 60)
+        plot.xgrid[0].ticker = AdaptiveTicker(base=24 * 60 * 60)
+        # JavaScript code.
+        plot.xaxis[0].formatter = FuncTickFormatter(code="""
+        return (tick / 86400).toFixed(0);
+        """)
+        plot.yaxis[0].formatter = PrintfTickFormatter(format="%0.1f%%")
+        for state, color in zip(states, Category10_10 * len(states)):
+            name = state.run.name
+            source = ColumnDataSource(dict(t=[], a=[]))
+            plot_stream.add_source(name, source)
+            plot.line(x='t', y='a', line_width=2, source=source, color=color, legend=f"{name} Accuracy")
+            baseline_accuracy = baseline_accuracies.get(name)
+            if baseline_accuracy is not None:
+                plot.ray(x=[0], y=[baseline_accuracy * 100], length=0, angle=0, line_width=2, line_dash='dashed',
+                         color=color, legend=f"{name} accuracy when trained with all data: "
+                                             f"{baseline_accuracy * 100:0.1f}%")
+        plot.legend.location = 'bottom_right'
+
+        def record_accuracy(state: _ModelState, t, a):
+            t, a = float(t), float(a)
+            plot_stream.push(state.run.name, t=t, a=a * 100)
+            state.save_data['accuracies'].append(dict(t=t, accuracy=a))
+
+        def record_balance(state: _ModelState, agent_index: int, t, force=False):
+            if agent_index < num_plotted_agents:
+                address = agents.addresses[agent_index]
+                t = float(t)
+                if state.plot_limiter.should_plot(address, t, force):
+                    state.save_data['balances'].append(dict(t=t, a=address, b=float(state.run.balances[address])))
+
+        def save_progress():
+            for state in states:
+                with open(state.run.save_path, 'w') as f:
+                    json.dump(state.save_data, f, separators=(',', ':'))
+                save_metrics(metrics_path_for(state.run.save_path), state.save_data)
+
+        def task():
+            for state in states:
+                state.run.decai.model.init_model(x_init_data, y_init_data)
+                state.accuracy = state.run.decai.model.evaluate(x_test, y_test)
+                self._logger.info("Initial test set accuracy for \"%s\": %0.2f%%",
+                                  state.run.name, state.accuracy * 100)
+                record_accuracy(state, state.time(), state.accuracy)
+                for agent_index, (address, start_balance) in enumerate(zip(agents.addresses, agents.start_balance)):
+                    state.run.balances.initialize(address, float(start_balance))
+                    record_balance(state, agent_index, state.time(), force=True)
+
+            scheduler = EventScheduler()
+            # Schedule in a random order since events at the same time are handled in the order they were scheduled.
+            order = np.random.default_rng(seed).permutation(len(agents))
+            start_times = states[0].time() + agents.get_next_waits_s(order)
+            calls_model = agents.calls_model[order]
+            scheduler.schedule_many(start_times[calls_model], EventType.PREDICT, order[calls_model].tolist())
+            scheduler.schedule_many(start_times[~calls_model], EventType.ADD_DATA, order[~calls_model].tolist())
+            scheduler.schedule(1E4, EventType.ACCURACY_TICK)
+            current_time = 0
+
+            def set_time(t):
+                nonlocal current_time
+                current_time = t
+                for state in states:
+                    state.time.set_time(t)
+
+            def handle_accuracy_tick(t, events: List[Event]):
+                set_time(t)
+                for state in states:
+                    state.accuracy = state.run.decai.model.evaluate(x_test, y_test)
+                    record_accuracy(state, t, state.accuracy)
+                save_progress()
+                # Only keep evaluating while something else can still happen.
+                if len(scheduler) > 0 and accuracy_plot_wait_s < math.inf:
+                    scheduler.schedule(t + accuracy_plot_wait_s, EventType.ACCURACY_TICK)
+
+            def act(state: _ModelState, agent_index: int, deposit: int, t):
+                agent = agents[agent_index]
+                decai = state.run.decai
+                x, y = state.remaining.peek()
+                if agent.calls_model:
+                    # Only call the model if it's good.
+                    if state.rng.random() < state.accuracy:
+                        decai.predict(Msg(agent.address, agent.pay_to_call), x)
+                        record_balance(state, agent_index, t)
+                    return
+
+                if not agent.good:
+                    y = 1 - y
+                if agent.prob_mistake > 0 and state.rng.random() < agent.prob_mistake:
+                    y = 1 - y
+                # Bad agents always contribute.
+                # Good agents will only work if the model is doing well.
+                # Add a bit of chance they will contribute since 0.85 accuracy is okay.
+                if agent.good and state.rng.random() >= state.accuracy + 0.15:
+                    return
+                balance = state.run.balances[agent.address]
+                try:
+                    decai.add_data(Msg(agent.address, min(int(deposit), balance)), x, y)
+                except RejectException:
+                    # Probably failed because they didn't pay enough which is okay.
+                    if self._logger.isEnabledFor(logging.DEBUG):
+                        self._logger.exception("Error adding data for \"%s\".", state.run.name)
+                    return
+                state.unclaimed.append(_PendingClaim(t, agent_index, x, y, init_idx + state.remaining.num_read))
+                state.remaining.advance()
+                pbar.update()
+                record_balance(state, agent_index, t)
+
+            def claim_deposits(state: _ModelState, agent_index: int, t) -> bool:
+                """
+                Let an agent try to claim the deposits for data that can be refunded or reported, oldest first,
+                like in `Simulator`.
+
+                :return: `True` if a claim was accepted, `False` otherwise.
+                """
+                decai = state.run.decai
+                refund_time_s = decai.im.refund_time_s
+                any_address_claim_wait_time_s = decai.im.any_address_claim_wait_time_s
+                address = agents.addresses[agent_index]
+                result = False
+                # The claims that were checked and still have some of their deposit left.
+                kept = []
+                while len(state.unclaimed) > 0:
+                    claim = state.unclaimed[0]
+                    elapsed = t - claim.added_time
+                    if elapsed < refund_time_s:
+                        break
+                    if not state.remaining.has_next() and elapsed < any_address_claim_wait_time_s:
+                        # Once all data has been added, only wait for anyone to be able to take the deposit.
+                        break
+                    state.unclaimed.popleft()
+                    author = agents.addresses[claim.agent]
+                    msg = Msg(address, state.run.balances[address])
+                    try:
+                        if elapsed > any_address_claim_wait_time_s or claim.agent != agent_index:
+                            # Attempt to take the deposit.
+                            decai.report(msg, claim.x, claim.classification, claim.added_time, author)
+                        else:
+                            decai.refund(msg, claim.x, claim.classification, claim.added_time)
+                        result = True
+                    except RejectException:
+                        if self._logger.isEnabledFor(logging.DEBUG):
+                            self._logger.exception("Error claiming deposit for \"%s\".", state.run.name)
+                    stored_data = decai.data_handler.get_data(claim.x, claim.classification, claim.added_time, author)
+                    if stored_data.claimable_amount > 0:
+                        kept.append(claim)
+                state.unclaimed.extendleft(reversed(kept))
+                return result
+
+            def take_turn(state: _ModelState, agent_index: int, deposit: int, t) -> bool:
+                """
+                :return: `True` if the agent can keep acting for the model, `False` otherwise.
+                """
+                address = agents.addresses[agent_index]
+                if state.run.balances[address] <= 0:
+                    return False
+                if state.remaining.has_next():
+                    act(state, agent_index, deposit, t)
+                result = state.run.balances[address] > 0
+                # The agent also checks if it can claim deposits for data that was added.
+                if claim_deposits(state, agent_index, t):
+                    record_balance(state, agent_index, t)
+                return result
+
+            def handle_agent_turns(t, events: List[Event]):
+                set_time(t)
+                agent_indices = [event.payload for event in events]
+                if events[0].type == EventType.ADD_DATA:
+                    # Draw deposits once for every model.
+                    deposits = agents.get_next_deposits(agent_indices)
+                else:
+                    # Agents that call the model don't make deposits and might not be able to draw a positive one.
+                    deposits = np.zeros(len(events), dtype=np.int64)
+                active = []
+                for agent_index, deposit in zip(agent_indices, deposits):
+                    # Every model gets a turn so don't short-circuit.
+                    if any([take_turn(state, agent_index, deposit, t) for state in states]):
+                        active.append(agent_index)
+                if len(active) > 0:
+                    scheduler.schedule_many(t + agents.get_next_waits_s(active), events[0].type, active)
+
+            scheduler.register(EventType.ACCURACY_TICK, handle_accuracy_tick)
+            scheduler.register(EventType.ADD_DATA, handle_agent_turns)
+            scheduler.register(EventType.PREDICT, handle_agent_turns)
+
+            def is_done_with_data() -> bool:
+                return all(not state.remaining.has_next() and len(state.unclaimed) == 0 for state in states)
+
+            with tqdm(desc="Processing agent requests",
+                      unit_scale=True, mininterval=2, unit=" requests",
+                      total=sum(state.remaining.num_remaining for state in states),
+                      ) as pbar:
+                scheduler.run(stop_condition=is_done_with_data)
+
+            self._logger.info("Done going through data.")
+            for state in states:
+                state.accuracy = state.run.decai.model.log_evaluation_details(x_test, y_test)
+                self._logger.info("Final test set accuracy for \"%s\": %0.2f%%", state.run.name, state.accuracy * 100)
+                record_accuracy(state, current_time + 100, state.accuracy)
+                for agent_index in range(num_plotted_agents):
+                    record_balance(state, agent_index, current_time + 100, force=True)
+                model_save_path = state.run.save_path.replace('-simulation_data.json', '-model.json')
+                state.run.decai.model.export(model_save_path, classifications,
+                                             feature_index_mapping=feature_index_mapping)
+            save_progress()
+
+        doc.add_root(plot)
+        thread = Thread(target=task)
+        thread.start()
+        return [state.run for state in states], thread
@@ -0,0 +1,222 @@
+import os
+from itertools import cycle
+from logging import Logger
+from pathlib import Path
+from threading import Condition, Thread
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from decai.simulation.profiling import profiler
+
+
+class PlotImageExporter(object):
+    """
+    Saves images of plots in a background thread so that the simulation doesn't wait for them to render.
+
+    Only the most recently submitted image is rendered:
+    images submitted while another image is rendering replace each other.
+    Images are rendered to a temporary file first so that an existing image is never partially written.
+    """
+
+    def __init__(self, render: Callable[[Any, str], None], logger: Logger):
+        """
+        :param render: Saves an image of a snapshot to a path, e.g. `render_with_matplotlib`.
+        :param logger: Logs errors from rendering.
+        """
+        self._render = render
+        self._logger = logger
+        self._condition = Condition()
+        self._pending: Optional[Tuple[Any, str]] = None
+        self._is_rendering = False
+        self._closed = False
+        self._thread: Optional[Thread] = None
+        self._warned_about_rendering = False
+        self.num_rendered = 0
+
+    def submit(self, snapshot, path: str):
+        """
+        Request an image to be rendered.
+
+        :param snapshot: What to render. Should not be modified after it is submitted.
+        :param path: Where to save the image.
+        """
+        with self._condition:
+            assert not self._closed, "The exporter has been closed."
+            self._pending = (snapshot, path)
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="PlotImageExporter", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def wait(self):
+        """
+        Wait for the most recently submitted image to be saved.
+        """
+        with self._condition:
+            while self._pending is not None or self._is_rendering:
+                self._condition.wait()
+
+    def close(self):
+        """
+        Save the most recently submitted image and stop the background thread.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                snapshot, path = self._pending
+                self._pending = None
+                self._is_rendering = True
+            try:
+                self._export(snapshot, path)
+            finally:
+                with self._condition:
+                    self._is_rendering = False
+                    self._condition.notify_all()
+
+    def _export(self, snapshot, path: str):
+        path = Path(path)
+        tmp_path = path.with_suffix('.tmp' + path.suffix)
+        try:
+            with profiler.timer('PlotImageExporter.render'):
+                self._render(snapshot, str(tmp_path))
+        except Exception as e:
+            if not self._warned_about_rendering:
+                self._logger.exception("Could not save picture of the plot.", exc_info=e)
+                self._warned_about_rendering = True
+        if tmp_path.exists():
+            os.replace(tmp_path, path)
+            self.num_rendered += 1
+
+
+def make_bokeh_plot(snapshot: Dict[str, Any]):
+    """
+    Make a new Bokeh plot of a run's accuracy and balances like the plot shown while simulating.
+    The plot isn't attached to a document so it can be made and exported from a background thread.
+
+    :param snapshot: The data for a run from `run_metrics.to_columns`.
+    :return: The plot.
+    """
+    # Imported here since they're slow to import.
+    from bokeh import colors
+    from bokeh.models import AdaptiveTicker, ColumnDataSource, FuncTickFormatter, PrintfTickFormatter
+    from bokeh.plotting import figure
+
+    plot = figure(title="Balances & Accuracy on Hidden Test Set")
+    plot.width = 800
+    plot.height = 600
+
+    plot.xaxis.axis_label = "Time (days)"
+    plot.yaxis.axis_label = "Percent"
+    plot.title.text_font_size = '20pt'
+    plot.xaxis.major_label_text_font_size = '20pt'
+    plot.xaxis.axis_label_text_font_size = '20pt'
+    plot.yaxis.major_label_text_font_size = '20pt'
+    plot.yaxis.axis_label_text_font_size = '20pt'
+
+    plot.xaxis[0].ticker = AdaptiveTicker(base=5 * 24 * 60 * 60)
+    plot.xgrid[0].ticker = AdaptiveTicker(base=24 * 60 * 60)
+
+    good_colors = cycle([
+        colors.named.green,
+        colors.named.lawngreen,
+        colors.named.darkgreen,
+        colors.named.limegreen,
+    ])
+    bad_colors = cycle([
+        colors.named.red,
+        colors.named.darkred,
+    ])
+    for agent_index, agent in enumerate(snapshot['metadata']['agents']):
+        if agent.get('calls_model'):
+            color, line_dash = 'blue', 'dashdot'
+        elif agent.get('good', True):
+            color, line_dash = next(good_colors), 'dotted'
+        else:
+            color, line_dash = next(bad_colors), 'dashed'
+        is_agent = snapshot['balance_agent'] == agent_index
+        source = ColumnDataSource(dict(t=snapshot['balance_t'][is_agent],
+                                       b=snapshot['balance'][is_agent] * 100 / agent['start_balance']))
+        plot.line(x='t', y='b',
+                  line_dash=line_dash,
+                  line_width=2,
+                  source=source,
+                  color=color,
+                  legend=f"{agent['address']} Balance")
+
+    plot.legend.location = 'top_left'
+    plot.legend.label_text_font_size = '12pt'
+
+    # JavaScript code.
+    plot.xaxis[0].formatter = FuncTickFormatter(code="""
+    return (tick / 86400).toFixed(0);
+    """)
+    plot.yaxis[0].formatter = PrintfTickFormatter(format="%0.1f%%")
+
+    baseline_accuracy = snapshot['metadata'].get('baselineAccuracy')
+    if baseline_accuracy is not None:
+        plot.ray(x=[0], y=[baseline_accuracy * 100], length=0, angle=0, line_width=2,
+                 legend=f"Accuracy when trained with all data: {baseline_accuracy * 100:0.1f}%")
+    plot.line(x='t', y='a',
+              line_dash='solid',
+              line_width=2,
+              source=ColumnDataSource(dict(t=snapshot['accuracy_t'], a=snapshot['accuracy'] * 100)),
+              color='black',
+              legend="Current Accuracy")
+    return plot
+
+
+def render_with_matplotlib(snapshot: Dict[str, Any], path: str):
+    """
+    Save an image of a run's accuracy and balances without using a browser.
+    Requires matplotlib.
+
+    :param snapshot: The data for a run from `run_metrics.to_columns`.
+    :param path: Where to save the image.
+    """
+    # Imported here since matplotlib is optional.
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    seconds_per_day = 24 * 60 * 60
+    # Use the figure directly instead of `pyplot` since this runs in a background thread.
+    fig = Figure(figsize=(8, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.set_title("Balances & Accuracy on Hidden Test Set")
+    ax.set_xlabel("Time (days)")
+    ax.set_ylabel("Percent")
+
+    good_colors = ['green', 'lawngreen', 'darkgreen', 'limegreen']
+    bad_colors = ['red', 'darkred']
+    num_good, num_bad = 0, 0
+    for agent_index, agent in enumerate(snapshot['metadata']['agents']):
+        if agent.get('calls_model'):
+            color, line_style = 'blue', 'dashdot'
+        elif agent.get('good', True):
+            color, line_style = good_colors[num_good % len(good_colors)], 'dotted'
+            num_good += 1
+        else:
+            color, line_style = bad_colors[num_bad % len(bad_colors)], 'dashed'
+            num_bad += 1
+        is_agent = snapshot['balance_agent'] == agent_index
+        ax.plot(snapshot['balance_t'][is_agent] / seconds_per_day,
+                snapshot['balance'][is_agent] * 100 / agent['start_balance'],
+                color=color, linestyle=line_style, linewidth=2, label=f"{agent['address']} Balance")
+
+    baseline_accuracy = snapshot['metadata'].get('baselineAccuracy')
+    if baseline_accuracy is not None:
+        ax.axhline(baseline_accuracy * 100, color='grey', linewidth=2,
+                   label=f"Accuracy when trained with all data: {baseline_accuracy * 100:0.1f}%")
+    ax.plot(snapshot['accuracy_t'] / seconds_per_day, snapshot['accuracy'] * 100,
+            color='black', linewidth=2, label="Current Accuracy")
+    ax.legend(loc='upper left')
+    fig.savefig(path)
@@ -0,0 +1,92 @@
+from collections import defaultdict
+from threading import Lock
+from typing import Any, Dict, Hashable, List, Optional
+
+
+class PlotRateLimiter(object):
+    """
+    Decides when to plot points for a series based on the simulated time
+    so that long runs don't send too many points to the browser.
+    The same run always plots the same points.
+    """
+
+    def __init__(self, min_interval_s: float):
+        """
+        :param min_interval_s: The minimum amount of simulated time between plotted points for each series.
+        """
+        assert min_interval_s >= 0
+        self.min_interval_s = min_interval_s
+        self._last_plotted_times: Dict[Hashable, float] = dict()
+
+    def should_plot(self, key: Hashable, t: float, force: bool = False) -> bool:
+        """
+        :param key: Identifies the series.
+        :param t: The simulated time of the point.
+        :param force: `True` to always plot the point, e.g. for the first or last point of a series.
+        :return: `True` if the point should be plotted, `False` otherwise.
+            The point is considered plotted if `True` is returned.
+        """
+        last_plotted_time = self._last_plotted_times.get(key)
+        if not force and last_plotted_time is not None and t - last_plotted_time < self.min_interval_s:
+            return False
+        self._last_plotted_times[key] = t
+        return True
+
+
+class PlotStreamBridge(object):
+    """
+    Sends points from the simulation thread to Bokeh sources.
+
+    Points are buffered for each source and sent with one `stream` call per source
+    on the next tick of the document instead of one callback for each point.
+    """
+
+    def __init__(self, doc, rollover: Optional[int] = None):
+        """
+        :param doc: The Bokeh document that the sources are in.
+        :param rollover: The maximum number of points to keep in each source in the browser.
+            Keeps all points if `None`.
+        """
+        assert rollover is None or rollover > 0
+        self._doc = doc
+        self._rollover = rollover
+        self._sources: Dict[Hashable, Any] = dict()
+        self._buffers: Dict[Hashable, Dict[str, List]] = dict()
+        self._lock = Lock()
+        self._flush_scheduled = False
+
+    def add_source(self, key: Hashable, source):
+        """
+        :param key: Identifies the source when pushing points.
+        :param source: A `ColumnDataSource`.
+        """
+        assert key not in self._sources
+        self._sources[key] = source
+
+    def push(self, key: Hashable, **point):
+        """
+        Buffer a point to send to a source. Can be called from any thread.
+
+        :param key: Identifies the source.
+        :param point: The value for each column of the source.
+        """
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                buffer = self._buffers[key] = defaultdict(list)
+            for column, value in point.items():
+                buffer[column].append(value)
+            if not self._flush_scheduled:
+                self._flush_scheduled = True
+                self._doc.add_next_tick_callback(self.flush)
+
+    def flush(self):
+        """
+        Send all buffered points. Must be called from the document's thread.
+        """
+        with self._lock:
+            buffers = self._buffers
+            self._buffers = dict()
+            self._flush_scheduled = False
+        for key, buffer in buffers.items():
+            self._sources[key].stream(dict(buffer), rollover=self._rollover)
@@ -0,0 +1,199 @@
+import functools
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock, local
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+class _Stats(object):
+    __slots__ = ('count', 'total_s', 'max_s')
+
+    def __init__(self):
+        self.count = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+
+
+class Profiler(object):
+    """
+    Collects the number of calls to and the time spent in parts of a simulation, grouped by the phase of the run.
+
+    Disabled by default so that instrumented code only has the overhead of checking `enabled`.
+    Times for nested timers are included in the times of the timers around them.
+    Each thread has its own current phase so that work in background threads,
+    such as saving plot images, isn't attributed to the phase of the simulation thread.
+    Threads that haven't started a phase record under 'main'.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = Lock()
+        # The current phase and when it started for each thread.
+        self._thread_state = local()
+        # Keeps the order that phases were first used in.
+        self._phases: Dict[str, None] = dict()
+        self._timers: Dict[str, Dict[str, _Stats]] = defaultdict(lambda: defaultdict(_Stats))
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._phase_times_s: Dict[str, float] = defaultdict(float)
+
+    def reset(self):
+        """
+        Clear the collected results.
+        """
+        with self._lock:
+            self._thread_state = local()
+            self._phases.clear()
+            self._timers.clear()
+            self._counters.clear()
+            self._phase_times_s.clear()
+
+    @property
+    def _phase(self) -> str:
+        """
+        :return: The current phase of the calling thread.
+        """
+        return getattr(self._thread_state, 'phase', 'main')
+
+    def start_phase(self, name: str):
+        """
+        Group results from the calling thread from now until its next phase starts under `name`.
+        """
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        thread_state = self._thread_state
+        phase_start: Optional[float] = getattr(thread_state, 'phase_start', None)
+        with self._lock:
+            if phase_start is not None:
+                self._phase_times_s[self._phase] += now - phase_start
+            thread_state.phase = name
+            thread_state.phase_start = now
+            self._phases.setdefault(name)
+
+    def end_phase(self):
+        """
+        Stop timing the current phase of the calling thread.
+        Results are grouped under 'main' until the next phase starts.
+        """
+        self.start_phase('main')
+        self._thread_state.phase_start = None
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """
+        Time everything in this context.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, elapsed_s: float):
+        """
+        Record one call that took `elapsed_s` seconds.
+        """
+        phase = self._phase
+        with self._lock:
+            self._phases.setdefault(phase)
+            stats = self._timers[phase][name]
+            stats.count += 1
+            stats.total_s += elapsed_s
+            if elapsed_s > stats.max_s:
+                stats.max_s = elapsed_s
+
+    def count(self, name: str, amount: int = 1):
+        """
+        Increment a counter.
+        """
+        if not self.enabled:
+            return
+        phase = self._phase
+        with self._lock:
+            self._phases.setdefault(phase)
+            self._counters[phase][name] += amount
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        :return: The results for each phase in a format that can be saved as JSON.
+        """
+        with self._lock:
+            return dict(phases={
+                phase: dict(
+                    total_s=self._phase_times_s.get(phase),
+                    timers={name: dict(count=stats.count, total_s=stats.total_s, max_s=stats.max_s,
+                                       mean_s=stats.total_s / stats.count)
+                            for name, stats in sorted(self._timers.get(phase, {}).items(),
+                                                      key=lambda item: -item[1].total_s)},
+                    counters=dict(sorted(self._counters.get(phase, {}).items())),
+                )
+                for phase in self._phases
+                if phase in self._phase_times_s or phase in self._timers or phase in self._counters
+            })
+
+    def summary(self) -> str:
+        """
+        :return: A table of the results for each phase with the slowest timers first.
+        """
+        lines: List[str] = []
+        for phase, results in self.to_dict()['phases'].items():
+            total_s = results['total_s']
+            lines.append(f"Phase: {phase}" + (f" ({total_s:.3f}s)" if total_s is not None else ""))
+            if results['timers']:
+                lines.append(f"  {'Timer':<40} {'Calls':>10} {'Total (s)':>12} {'Mean (ms)':>12} {'Max (ms)':>12}")
+                for name, stats in results['timers'].items():
+                    lines.append(f"  {name:<40} {stats['count']:>10} {stats['total_s']:>12.3f}"
+                                 f" {stats['mean_s'] * 1E3:>12.4f} {stats['max_s'] * 1E3:>12.4f}")
+            if results['counters']:
+                lines.append(f"  {'Counter':<40} {'Value':>10}")
+                for name, value in results['counters'].items():
+                    lines.append(f"  {name:<40} {value:>10}")
+        return "\n".join(lines)
+
+    def save(self, path):
+        """
+        Save the results as JSON.
+
+        :param path: Where to save the results.
+        """
+        path = Path(path)
+        tmp_path = path.with_suffix('.tmp' + path.suffix)
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp_path, path)
+
+
+profiler = Profiler()
+""" The profiler used by instrumented code. """
+
+
+def profiled(name: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """
+    Decorate a function to time its calls with `profiler` when it is enabled.
+
+    :param name: The name of the timer. Defaults to the qualified name of the function.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        timer_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.record(timer_name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
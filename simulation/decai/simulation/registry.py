@@ -0,0 +1,144 @@
+import importlib
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from injector import Module
+
+
+@lru_cache(maxsize=None)
+def _resolve(path: str):
+    """
+    :param path: The location of an attribute in a module formatted as "package.module:attribute".
+    :return: The attribute.
+    """
+    module_name, _, attribute = path.partition(':')
+    assert attribute, f"The path must be formatted as \"package.module:attribute\". Got: \"{path}\"."
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+@dataclass
+class RegistryEntry:
+    """
+    A named `injector` module that is only imported when it is used.
+    """
+
+    module_path: str
+    """ The location of the module class formatted as "package.module:ModuleClass". """
+
+    module_kwargs: Dict[str, Any] = field(default_factory=dict)
+    """ Arguments to create the module with. """
+
+    info: Dict[str, Any] = field(default_factory=dict)
+    """ Extra information about the entry such as default settings for running simulations with it. """
+
+
+class Registry(object):
+    """
+    Named `injector` modules that are resolved lazily.
+
+    Modules can pull in heavy dependencies such as Keras or spaCy so they are only imported
+    when they are first used instead of when they are registered.
+    """
+
+    def __init__(self, kind: str):
+        """
+        :param kind: What the registered modules provide. Used in error messages.
+        """
+        self._kind = kind
+        self._entries: Dict[str, RegistryEntry] = dict()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def names(self) -> List[str]:
+        """
+        :return: The names of the registered entries.
+        """
+        return list(self._entries.keys())
+
+    def register(self, name: str, module_path: str, module_kwargs: Dict[str, Any] = None, **info):
+        """
+        Register a module without importing it.
+
+        :param name: The name to use to get the module.
+        :param module_path: The location of the module class formatted as "package.module:ModuleClass".
+        :param module_kwargs: Arguments to create the module with.
+        :param info: Extra information about the entry.
+        """
+        assert name not in self._entries, f"The {self._kind} \"{name}\" is already registered."
+        self._entries[name] = RegistryEntry(module_path, module_kwargs or dict(), info)
+
+    def _get_entry(self, name: str) -> RegistryEntry:
+        result = self._entries.get(name)
+        if result is None:
+            raise KeyError(f"Unknown {self._kind}: \"{name}\". Options: {', '.join(self._entries)}.")
+        return result
+
+    def get_info(self, name: str) -> Dict[str, Any]:
+        """
+        :param name: The name of a registered entry.
+        :return: Extra information about the entry.
+        """
+        return self._get_entry(name).info
+
+    def get_module(self, name: str) -> Module:
+        """
+        Import the module if it hasn't been imported yet.
+
+        :param name: The name of a registered entry.
+        :return: A new instance of the module.
+        """
+        entry = self._get_entry(name)
+        return _resolve(entry.module_path)(**entry.module_kwargs)
+
+
+datasets = Registry('dataset')
+datasets.register('bhp', 'decai.simulation.data.bhp_data_loader:BhpDataModule')
+datasets.register('fitness', 'decai.simulation.data.fitness_data_loader:FitnessDataModule',
+                  train_size=3500, test_size=1500)
+datasets.register('imdb', 'decai.simulation.data.imdb_data_loader:ImdbDataModule', dict(num_words=1000),
+                  train_size=None, test_size=None)
+datasets.register('news', 'decai.simulation.data.news_data_loader:NewsDataModule',
+                  train_size=None, test_size=None)
+datasets.register('offensive', 'decai.simulation.data.offensive_data_loader:OffensiveDataModule',
+                  train_size=None, test_size=None)
+datasets.register('synthetic', 'decai.simulation.data.synthetic_data_loader:SyntheticDataModule',
+                  train_size=None, test_size=None)
+datasets.register('titanic', 'decai.simulation.data.titanic_data_loader:TitanicDataModule')
+datasets.register('ttt', 'decai.simulation.data.ttt_data_loader:TicTacToeDataModule')
+
+models = Registry('model')
+models.register('dt', 'decai.simulation.contract.classification.decision_tree:DecisionTreeModule')
+models.register('nb', 'decai.simulation.contract.classification.naive_bayes:NaiveBayesModule',
+                baseline_accuracy=dict(
+                    # train_size, test_size = 3500, 1500
+                    fitness=0.97,
+                    # train_size, test_size = None, None
+                    imdb=0.8323,
+                    # train_size, test_size = None, None
+                    news=0.8181,
+                ))
+models.register('ncc', 'decai.simulation.contract.classification.ncc_module:NearestCentroidClassifierModule',
+                baseline_accuracy=dict(
+                    # train_size, test_size = 3500, 1500
+                    fitness=0.9513,
+                    # train_size, test_size = None, None
+                    imdb=0.7445,
+                    # train_size, test_size = None, None
+                    news=0.6727,
+                ))
+models.register('perceptron', 'decai.simulation.contract.classification.perceptron:PerceptronModule',
+                baseline_accuracy=dict(
+                    # train_size, test_size = 3500, 1500
+                    fitness=0.9507,
+                    # train_size, test_size = None, None
+                    imdb=0.73,
+                    # train_size, test_size = None, None
+                    news=0.9003,
+                ))
+
+incentive_mechanisms = Registry('incentive mechanism')
+incentive_mechanisms.register('prediction_market',
+                              'decai.simulation.contract.incentive.prediction_market:PredictionMarketImModule')
+incentive_mechanisms.register('stakeable', 'decai.simulation.contract.incentive.stakeable:StakeableImModule')
@@ -0,0 +1,66 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict
+
+import numpy as np
+
+
+def metrics_path_for(run_path) -> Path:
+    """
+    :param run_path: The path to the JSON data for a run.
+    :return: The path to the columnar metrics for the run.
+    """
+    return Path(run_path).with_suffix('.npz')
+
+
+def to_columns(save_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    :param save_data: The data for a run as it is saved in JSON.
+    :return: The data for the run with each metric in arrays instead of a list of records.
+        `balance_agent` is the index of the agent in `agents`.
+    """
+    agent_indices = {agent['address']: i for i, agent in enumerate(save_data['agents'])}
+    accuracies = save_data['accuracies']
+    balances = save_data['balances']
+    return dict(
+        metadata={k: v for k, v in save_data.items() if k not in ('accuracies', 'balances')},
+        accuracy_t=np.array([d['t'] for d in accuracies], dtype=np.float64),
+        accuracy=np.array([d['accuracy'] for d in accuracies], dtype=np.float64),
+        balance_t=np.array([d['t'] for d in balances], dtype=np.float64),
+        balance_agent=np.array([agent_indices[d['a']] for d in balances], dtype=np.int32),
+        balance=np.array([d['b'] for d in balances], dtype=np.float64),
+    )
+
+
+def save_metrics(path, save_data: Dict[str, Any]):
+    """
+    Save the data for a run in a columnar format that is quicker to load than JSON.
+
+    :param path: Where to save the metrics.
+    :param save_data: The data for a run as it is saved in JSON.
+    """
+    columns = to_columns(save_data)
+    metadata = columns.pop('metadata')
+    path = Path(path)
+    # Write to a temporary file first so that an interrupted run doesn't leave a partial file.
+    tmp_path = path.with_suffix('.tmp.npz')
+    np.savez(tmp_path, metadata=np.array(json.dumps(metadata, separators=(',', ':'))), **columns)
+    os.replace(tmp_path, path)
+
+
+def load_metrics(run_path) -> Dict[str, Any]:
+    """
+    Load the data for a run from the columnar metrics if they were saved and from the JSON data otherwise.
+
+    :param run_path: The path to the JSON data for a run.
+    :return: The data for the run. See `to_columns`.
+    """
+    metrics_path = metrics_path_for(run_path)
+    if metrics_path.exists():
+        with np.load(metrics_path) as data:
+            result: Dict[str, Any] = {k: data[k] for k in data.files}
+        result['metadata'] = json.loads(str(result['metadata']))
+        return result
+    with open(run_path) as f:
+        return to_columns(json.load(f))
@@ -0,0 +1,162 @@
+import heapq
+import itertools
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from decai.simulation.profiling import profiler
+
+
+class EventType(Enum):
+    """
+    Types of events in a simulation.
+
+    Events scheduled for the same time are dispatched in the order of these values.
+    """
+
+    MARKET_PHASE = 0
+    """ Move a prediction market to its next phase or step. """
+
+    ACCURACY_TICK = 1
+    """ Evaluate the model, plot the accuracy, and save the progress of the run. """
+
+    ADD_DATA = 2
+    """ An agent's turn to contribute data. """
+
+    PREDICT = 3
+    """ An agent's turn to call the model. """
+
+
+@dataclass
+class Event:
+    """
+    Something that should happen at a specific time in a simulation.
+    """
+
+    time: float
+    type: EventType
+    payload: Any = None
+
+
+EventHandler = Callable[[float, List[Event]], None]
+"""
+Handles a batch of events of the same type that happen at the same time.
+Called with the time of the events and the events in the order in which they were scheduled.
+"""
+
+
+class EventScheduler(object):
+    """
+    A discrete-event engine.
+
+    Events are kept in a heap and dispatched in chronological order to the handler registered for their type.
+    Events of the same type that happen at the same time are dispatched together in one batch.
+    This is not thread-safe, events should only be scheduled from the thread running the simulation.
+    """
+
+    def __init__(self):
+        self._queue: List[Tuple[float, int, int, Event]] = []
+        # Breaks ties so that events at the same time keep the order they were scheduled in.
+        self._counter = itertools.count()
+        self._handlers: Dict[EventType, EventHandler] = dict()
+
+    def __len__(self):
+        """
+        :return: The number of events that have not been dispatched yet.
+        """
+        return len(self._queue)
+
+    def register(self, event_type: EventType, handler: EventHandler):
+        """
+        Set the handler for a type of event.
+
+        :param event_type: The type of event to handle.
+        :param handler: Called with the time and the batch of events to handle.
+        """
+        self._handlers[event_type] = handler
+
+    def schedule(self, time: float, event_type: EventType, payload=None) -> Event:
+        """
+        Schedule an event.
+
+        :param time: The time at which the event should happen.
+        :param event_type: The type of event.
+        :param payload: Information for the handler.
+        :return: The scheduled event.
+        """
+        result = Event(time, event_type, payload)
+        heapq.heappush(self._queue, (time, event_type.value, next(self._counter), result))
+        return result
+
+    def schedule_many(self, times: Iterable[float], event_type: EventType, payloads: Iterable):
+        """
+        Schedule several events of the same type.
+        Cheaper than calling `schedule` for each event when scheduling many events at once.
+
+        :param times: The time for each event.
+        :param event_type: The type of the events.
+        :param payloads: The payload for each event.
+        """
+        type_value = event_type.value
+        items = [(time, type_value, next(self._counter), Event(time, event_type, payload))
+                 for time, payload in zip(times, payloads)]
+        if len(items) * 8 < len(self._queue):
+            # Re-heapifying the whole queue would be slower than pushing each event.
+            for item in items:
+                heapq.heappush(self._queue, item)
+        else:
+            self._queue.extend(items)
+            heapq.heapify(self._queue)
+
+    def clear(self):
+        """ Remove all events that have not been dispatched yet. """
+        self._queue.clear()
+
+    def peek_time(self) -> Optional[float]:
+        """
+        :return: The time of the next event or `None` if there are no more events.
+        """
+        if len(self._queue) == 0:
+            return None
+        return self._queue[0][0]
+
+    def pop_batch(self) -> Tuple[float, EventType, List[Event]]:
+        """
+        Remove the next events that have the same time and type.
+
+        :return: The time, the type, and the events.
+        """
+        time, type_value, _, event = heapq.heappop(self._queue)
+        events = [event]
+        while len(self._queue) > 0 and self._queue[0][0] == time and self._queue[0][1] == type_value:
+            events.append(heapq.heappop(self._queue)[-1])
+        return time, event.type, events
+
+    def step(self) -> bool:
+        """
+        Dispatch the next batch of events.
+
+        :return: `True` if events were dispatched, `False` if there were no more events.
+        """
+        if len(self._queue) == 0:
+            return False
+        time, event_type, events = self.pop_batch()
+        handler = self._handlers.get(event_type)
+        assert handler is not None, f"No handler was registered for {event_type}."
+        if profiler.enabled:
+            profiler.count(f'events.{event_type.name}', len(events))
+            with profiler.timer(f'EventScheduler.handle.{event_type.name}'):
+                handler(time, events)
+        else:
+            handler(time, events)
+        return True
+
+    def run(self, stop_condition: Callable[[], bool] = None):
+        """
+        Dispatch events until there are no more events or `stop_condition` is true.
+
+        :param stop_condition: Checked before dispatching each batch of events.
+        """
+        while stop_condition is None or not stop_condition():
+            if not self.step():
+                break
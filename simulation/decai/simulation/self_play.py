@@ -0,0 +1,101 @@
+from dataclasses import dataclass
+from typing import Dict
+
+import numpy as np
+
+from decai.simulation.contract.classification.classifier import Classifier
+from decai.simulation.data.ttt_data_loader import TicTacToeDataLoader
+
+
+@dataclass
+class SelfPlayResults:
+    """
+    Results of Tic-Tac-Toe games where a model plays against itself.
+    Results are from the perspective of player 1.
+    """
+
+    winners: np.ndarray
+    """
+    The winner of each game: 1, -1, or 0 for a draw.
+    A game is a draw when the model picks a position that already has a marker, such as when the board is full.
+    """
+
+    num_moves: np.ndarray
+    """
+    The number of markers that the player that made the last move has on the board at the end of each game.
+    """
+
+    @property
+    def wins(self) -> int:
+        return int(np.count_nonzero(self.winners == 1))
+
+    @property
+    def draws(self) -> int:
+        return int(np.count_nonzero(self.winners == 0))
+
+    @property
+    def losses(self) -> int:
+        return int(np.count_nonzero(self.winners == -1))
+
+    def summary(self) -> Dict[str, float]:
+        return dict(
+            wins=self.wins,
+            draws=self.draws,
+            losses=self.losses,
+            avg_winner_num_moves=float(np.mean(self.num_moves)) if len(self.num_moves) > 0 else 0.0,
+        )
+
+
+def play_against_self(classifier: Classifier, tic_tac_toe: TicTacToeDataLoader, boards: np.ndarray,
+                      next_player: int = 1) -> SelfPlayResults:
+    """
+    Play games in lockstep so that the model predicts the next move for every game that is still going
+    with one call per turn.
+    The model always predicts as if it is player 1 so the boards are flipped for player -1.
+
+    :param classifier: The model to play with.
+    :param tic_tac_toe: Determines the size of the board and when a player wins.
+    :param boards: The flattened boards to start each game with, one per row.
+        These are not modified.
+    :param next_player: The player to move first in every game.
+    :return: The results of each game in the same order as `boards`.
+    """
+    assert next_player in (1, -1)
+    boards = np.array(boards, dtype=np.int8)
+    num_games = len(boards)
+    winners = np.zeros(num_games, dtype=np.int8)
+    num_moves = np.zeros(num_games, dtype=np.int64)
+    active = np.arange(num_games)
+    player = next_player
+    while len(active) > 0:
+        positions = np.asarray(classifier.predict_batch(boards[active] * player), dtype=np.int64)
+        # It's a draw when the model picks a spot that is already taken.
+        is_taken = boards[active, positions] != 0
+        taken = active[is_taken]
+        num_moves[taken] = np.count_nonzero(boards[taken] == player, axis=1)
+
+        active, positions = active[~is_taken], positions[~is_taken]
+        boards[active, positions] = player
+        is_won = tic_tac_toe.get_winners(boards[active]) != 0
+        won = active[is_won]
+        winners[won] = player
+        num_moves[won] = np.count_nonzero(boards[won] == player, axis=1)
+
+        active = active[~is_won]
+        player = -player
+    return SelfPlayResults(winners, num_moves)
+
+
+def evaluate_self_play(classifier: Classifier, tic_tac_toe: TicTacToeDataLoader) -> SelfPlayResults:
+    """
+    Have the model play against itself starting with an empty board
+    and then once with the opponent (-1) starting in each position.
+
+    :param classifier: The model to evaluate.
+    :param tic_tac_toe: Determines the size of the board and when a player wins.
+    :return: The results from the empty board first and then the result when the opponent starts in each position.
+    """
+    num_positions = tic_tac_toe.width * tic_tac_toe.length
+    boards = np.zeros((1 + num_positions, num_positions), dtype=np.int8)
+    boards[1 + np.arange(num_positions), np.arange(num_positions)] = -1
+    return play_against_self(classifier, tic_tac_toe, boards, next_player=1)
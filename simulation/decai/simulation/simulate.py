@@ -1,33 +1,37 @@
 import json
 import logging
+import math
 import os
 import random
 import time
-from dataclasses import asdict, dataclass
-from functools import partial
+from array import array
+from dataclasses import asdict, dataclass, fields
+from collections import deque
 from itertools import cycle
 from logging import Logger
 from platform import uname
-from queue import PriorityQueue
 from threading import Thread
-from typing import List
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Union
 
 import numpy as np
-from bokeh import colors
-from bokeh.document import Document
-from bokeh.io import export_png
-from bokeh.models import AdaptiveTicker, ColumnDataSource, FuncTickFormatter, PrintfTickFormatter
-from bokeh.plotting import curdoc, figure
+import scipy.sparse
 from injector import inject
-from tornado import gen
 from tqdm import tqdm
 
 from decai.simulation.contract.balances import Balances
+from decai.simulation.contract.classification.classifier import Classifier
 from decai.simulation.contract.collab_trainer import CollaborativeTrainer
 from decai.simulation.contract.incentive.prediction_market import MarketPhase, PredictionMarket
 from decai.simulation.contract.objects import Address, Msg, RejectException, TimeMock
-from decai.simulation.data.data_loader import DataLoader
+from decai.simulation.data.data_loader import DataLoader, SampleStream
 from decai.simulation.data.featuremapping.feature_index_mapper import FeatureIndexMapper
+from decai.simulation.evaluation import AccuracyEstimator, AsyncEvaluator
+from decai.simulation.plot_export import PlotImageExporter, make_bokeh_plot, render_with_matplotlib
+from decai.simulation.plot_stream import PlotRateLimiter, PlotStreamBridge
+from decai.simulation.profiling import profiler
+from decai.simulation.run_metrics import metrics_path_for, save_metrics, to_columns
+from decai.simulation.scheduler import Event, EventScheduler, EventType
+from decai.simulation.trace import CallType, TraceRecorder
 
 
 @dataclass
@@ -65,6 +69,150 @@ class Agent:
                 return result
 
 
+class AgentPopulation(object):
+    """
+    Many agents stored as columns of parameters.
+
+    Each parameter can be given as one value for all agents or as a sequence with a value for each agent.
+    Deposits and wait times are drawn in batches for several agents at once.
+    """
+
+    _POOL_SIZE = 1 << 16
+
+    def __init__(self,
+                 addresses: Sequence[Address],
+                 start_balance: Union[float, Sequence[float]],
+                 mean_deposit: Union[float, Sequence[float]],
+                 stdev_deposit: Union[float, Sequence[float]],
+                 mean_update_wait_s: Union[float, Sequence[float]],
+                 stdev_update_wait_time: Union[float, Sequence[float]] = 1,
+                 pay_to_call: Union[float, Sequence[float]] = 0,
+                 good: Union[bool, Sequence[bool]] = True,
+                 prob_mistake: Union[float, Sequence[float]] = 0,
+                 calls_model: Union[bool, Sequence[bool]] = False,
+                 seed: Optional[int] = None,
+                 ):
+        """
+        :param addresses: The address of each agent.
+        :param start_balance: The starting balance.
+        :param mean_deposit: The mean of the deposit when adding data.
+        :param stdev_deposit: The standard deviation of the deposit when adding data.
+        :param mean_update_wait_s: The mean amount of time in seconds between actions.
+        :param stdev_update_wait_time: The standard deviation of the amount of time in seconds between actions.
+        :param pay_to_call: The amount paid to call the model.
+        :param good: `True` if the agent contributes correctly labeled data.
+        :param prob_mistake: The probability of mislabeling data.
+        :param calls_model: `True` if the agent only calls the model.
+        :param seed: Seed for the random number generator used to draw deposits and wait times.
+        """
+        self.addresses: List[Address] = list(addresses)
+        n = len(self.addresses)
+        assert n > 0, "There must be at least one agent."
+        assert len(set(self.addresses)) == n, "The addresses must be unique."
+
+        def column(value, dtype) -> np.ndarray:
+            result = np.array(np.broadcast_to(np.asarray(value, dtype=dtype), (n,)))
+            result.flags.writeable = False
+            return result
+
+        self.start_balance = column(start_balance, np.float64)
+        self.mean_deposit = column(mean_deposit, np.float64)
+        self.stdev_deposit = column(stdev_deposit, np.float64)
+        self.mean_update_wait_s = column(mean_update_wait_s, np.float64)
+        self.stdev_update_wait_time = column(stdev_update_wait_time, np.float64)
+        self.pay_to_call = column(pay_to_call, np.float64)
+        self.good = column(good, bool)
+        self.prob_mistake = column(prob_mistake, np.float64)
+        self.calls_model = column(calls_model, bool)
+        assert np.all(self.start_balance > self.mean_deposit)
+
+        self._rng = np.random.default_rng(seed)
+        self._pool = np.empty(0)
+        self._pool_index = 0
+        self._views: Dict[int, Agent] = dict()
+
+    @classmethod
+    def from_agents(cls, agents: Sequence[Agent], seed: Optional[int] = None) -> 'AgentPopulation':
+        """
+        :param agents: The agents to store.
+        :param seed: Seed for the random number generator used to draw deposits and wait times.
+        :return: A population with the same parameters as `agents`.
+        """
+        columns = {f.name: [getattr(a, f.name) for a in agents] for f in fields(Agent)}
+        return cls(addresses=columns.pop('address'), **columns, seed=seed)
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def __getitem__(self, index: int) -> Agent:
+        """
+        :param index: The index of an agent.
+        :return: The parameters of the agent.
+        """
+        result = self._views.get(index)
+        if result is None:
+            result = Agent(address=self.addresses[index],
+                           start_balance=float(self.start_balance[index]),
+                           mean_deposit=float(self.mean_deposit[index]),
+                           stdev_deposit=float(self.stdev_deposit[index]),
+                           mean_update_wait_s=float(self.mean_update_wait_s[index]),
+                           stdev_update_wait_time=float(self.stdev_update_wait_time[index]),
+                           pay_to_call=float(self.pay_to_call[index]),
+                           good=bool(self.good[index]),
+                           prob_mistake=float(self.prob_mistake[index]),
+                           calls_model=bool(self.calls_model[index]),
+                           )
+            self._views[index] = result
+        return result
+
+    def __iter__(self) -> Iterator[Agent]:
+        return (self[i] for i in range(len(self)))
+
+    def _standard_normal(self, size: int) -> np.ndarray:
+        # Draw from a pool since drawing many small batches from the generator is slow.
+        if self._pool_index + size > len(self._pool):
+            self._pool = self._rng.standard_normal(max(self._POOL_SIZE, size))
+            self._pool_index = 0
+        result = self._pool[self._pool_index:self._pool_index + size]
+        self._pool_index += size
+        return result
+
+    def _sample(self, mean: np.ndarray, stdev: np.ndarray, min_value: int) -> np.ndarray:
+        result = (mean + stdev * self._standard_normal(len(mean))).astype(np.int64)
+        redraw = np.flatnonzero(result < min_value)
+        while len(redraw) > 0:
+            result[redraw] = (mean[redraw] + stdev[redraw] * self._standard_normal(len(redraw))).astype(np.int64)
+            redraw = redraw[result[redraw] < min_value]
+        return result
+
+    def get_next_deposits(self, indices: np.ndarray) -> np.ndarray:
+        """
+        :param indices: The indices of the agents.
+        :return: A positive deposit for each agent.
+        """
+        return self._sample(self.mean_deposit[indices], self.stdev_deposit[indices], 1)
+
+    def get_next_waits_s(self, indices: np.ndarray) -> np.ndarray:
+        """
+        :param indices: The indices of the agents.
+        :return: The amount of time in seconds until the next action of each agent. At least 1.
+        """
+        return self._sample(self.mean_update_wait_s[indices], self.stdev_update_wait_time[indices], 1)
+
+
+@dataclass
+class _PendingClaim:
+    """
+    Data that was added and might still have some of its deposit left to claim.
+    """
+    added_time: int
+    agent: int
+    x: object
+    classification: object
+    sample_index: int
+    """ The index of the sample in the training data. """
+
+
 class Simulator(object):
     """
     A simulator for Decentralized & Collaborative AI.
@@ -89,6 +237,7 @@ class Simulator(object):
         self._warned_about_saving_plot = False
 
     def save_plot_image(self, plot, plot_save_path):
+        from bokeh.io import export_png
         try:
             export_png(plot, filename=plot_save_path)
         except Exception as e:
@@ -108,18 +257,29 @@ class Simulator(object):
             self._warned_about_saving_plot = True
 
     def simulate(self,
-                 agents: List[Agent],
+                 agents: Union[List[Agent], AgentPopulation],
                  baseline_accuracy: float = None,
                  init_train_data_portion: float = 0.1,
                  pm_test_sets: list = None,
                  accuracy_plot_wait_s=2E5,
                  train_size: int = None, test_size: int = None,
-                 filename_indicator: str = None
-                 ):
+                 filename_indicator: str = None,
+                 max_plotted_agents: int = 20,
+                 plot_interval_s: float = 60 * 60,
+                 plot_rollover: Optional[int] = None,
+                 plot_image_renderer: Optional[str] = 'bokeh',
+                 profile: bool = False,
+                 stream_chunk_size: Optional[int] = None,
+                 accuracy_max_half_width: Optional[float] = None,
+                 async_evaluation: bool = False,
+                 seed: Optional[int] = None,
+                 record_trace: bool = False,
+                 ) -> Thread:
         """
         Run a simulation.
 
         :param agents: The agents that will interact with the data.
+            Use an `AgentPopulation` for many agents.
         :param baseline_accuracy: The baseline accuracy of the model.
             Usually the accuracy on a hidden test set when the model is trained with all data.
         :param init_train_data_portion: The portion of the data to initially use for training. Must be [0,1].
@@ -128,12 +288,52 @@ class Simulator(object):
         :param train_size: The amount of training data to use.
         :param test_size: The amount of test data to use.
         :param filename_indicator: Path of the filename to create for the run.
+        :param max_plotted_agents: The maximum number of agents to plot and save the balances of.
+        :param plot_interval_s: The minimum amount of simulated time between plotted points for each line.
+        :param plot_rollover: The maximum number of points to keep for each line in the browser.
+            Keeps all points if `None`.
+        :param plot_image_renderer: How to save images of the plot in the background:
+            'bokeh' to use a browser through Selenium, 'matplotlib' to render quickly without a browser,
+            or `None` to not save images.
+        :param profile: `True` to time the main parts of the simulation.
+            A summary is logged and saved at the end of the run.
+        :param stream_chunk_size: The number of training samples to load at a time with
+            `DataLoader.load_data_stream` so that datasets larger than memory can be used.
+            Features are not mapped with the `FeatureIndexMapper` when streaming.
+            `None` to load all of the data at once.
+        :param accuracy_max_half_width: Estimate the accuracy during the simulation from subsamples of the test set
+            with confidence intervals at most this wide on each side, e.g. 0.01 for +/-1%.
+            The initial and final accuracies are always evaluated on the entire test set.
+            `None` to always evaluate the entire test set.
+        :param async_evaluation: `True` to evaluate snapshots of the model in a background thread
+            while agents keep acting. Agents use the most recently computed accuracy.
+        :param seed: Seed for the random decisions of the agents and the order that they start in.
+            Runs with the same seed, agents, and data make the same decisions until the models behave differently.
+            Agents given as a list also use it for their deposits and wait times.
+        :param record_trace: `True` to save the calls that agents make so that they can be replayed
+            with `TraceReplayer`, e.g. to compare incentive mechanisms on the same contributions.
+        :return: The thread running the simulation.
         """
 
         assert 0 <= init_train_data_portion <= 1
+        assert plot_image_renderer in ('bokeh', 'matplotlib', None), \
+            f"Unknown plot image renderer: {plot_image_renderer}"
+
+        # Imported here since they're slow to import and only needed when running a simulation.
+        from bokeh import colors
+        from bokeh.document import Document
+        from bokeh.models import AdaptiveTicker, ColumnDataSource, FuncTickFormatter, PrintfTickFormatter
+        from bokeh.plotting import curdoc, figure
+
+        if not isinstance(agents, AgentPopulation):
+            agents = AgentPopulation.from_agents(agents, seed=seed)
+        rng = random.Random(seed)
+        num_plotted_agents = min(len(agents), max_plotted_agents)
+        plotted_agents = [agents[i] for i in range(num_plotted_agents)]
 
         # Data to save.
-        save_data = dict(agents=[asdict(a) for a in agents],
+        save_data = dict(agents=[asdict(a) for a in plotted_agents],
+                         numAgents=len(agents),
                          baselineAccuracy=baseline_accuracy,
                          initTrainDataPortion=init_train_data_portion,
                          accuracies=[],
@@ -143,12 +343,24 @@ class Simulator(object):
         save_path = f'saved_runs/{time_for_filenames}-{filename_indicator}-simulation_data.json'
         model_save_path = f'saved_runs/{time_for_filenames}-{filename_indicator}-model.json'
         plot_save_path = f'saved_runs/{time_for_filenames}-{filename_indicator}.png'
+        profile_save_path = f'saved_runs/{time_for_filenames}-{filename_indicator}-profile.json'
+        trace_save_path = f'saved_runs/{time_for_filenames}-{filename_indicator}-trace.npz'
         self._logger.info("Saving run info to \"%s\".", save_path)
         os.makedirs(os.path.dirname(save_path), exist_ok=True)
 
         # Set up plots.
         doc: Document = curdoc()
         doc.title = "DeCAI Simulation"
+        plot_stream = PlotStreamBridge(doc, rollover=plot_rollover)
+        if plot_image_renderer == 'bokeh':
+            # Export a new plot made from a snapshot since the live plot is updated by other threads.
+            plot_image_exporter = PlotImageExporter(
+                lambda snapshot, path: self.save_plot_image(make_bokeh_plot(snapshot), path), self._logger)
+        elif plot_image_renderer == 'matplotlib':
+            plot_image_exporter = PlotImageExporter(render_with_matplotlib, self._logger)
+        else:
+            plot_image_exporter = None
+        plot_limiter = PlotRateLimiter(plot_interval_s)
 
         plot = figure(title="Balances & Accuracy on Hidden Test Set",
                       )
@@ -166,7 +378,6 @@ class Simulator(object):
         plot.xaxis[0].ticker = AdaptiveTicker(base=5 * 24 * 60 * 60)
         plot.xgrid[0].ticker = AdaptiveTicker(base=24 * 60 * 60)
 
-        balance_plot_sources_per_agent = dict()
         good_colors = cycle([
             colors.named.green,
             colors.named.lawngreen,
@@ -177,10 +388,9 @@ class Simulator(object):
             colors.named.red,
             colors.named.darkred,
         ])
-        for agent in agents:
+        for agent in plotted_agents:
             source = ColumnDataSource(dict(t=[], b=[]))
-            assert agent.address not in balance_plot_sources_per_agent
-            balance_plot_sources_per_agent[agent.address] = source
+            plot_stream.add_source(('balance', agent.address), source)
             if agent.calls_model:
                 color = 'blue'
                 line_dash = 'dashdot'
@@ -207,6 +417,7 @@ class Simulator(object):
         plot.yaxis[0].formatter = PrintfTickFormatter(format="%0.1f%%")
 
         acc_source = ColumnDataSource(dict(t=[], a=[]))
+        plot_stream.add_source('accuracy', acc_source)
         if baseline_accuracy is not None:
             plot.ray(x=[0], y=[baseline_accuracy * 100], length=0, angle=0, line_width=2,
                      legend=f"Accuracy when trained with all data: {baseline_accuracy * 100:0.1f}%")
@@ -217,30 +428,62 @@ class Simulator(object):
                   color='black',
                   legend="Current Accuracy")
 
-        @gen.coroutine
-        def plot_cb(agent: Agent, t, b):
-            source = balance_plot_sources_per_agent[agent.address]
-            source.stream(dict(t=[t], b=[b * 100 / agent.start_balance]))
-            save_data['balances'].append(dict(t=t, a=agent.address, b=b))
-
-        @gen.coroutine
-        def plot_accuracy_cb(t, a):
-            acc_source.stream(dict(t=[t], a=[a * 100]))
-            save_data['accuracies'].append(dict(t=t, accuracy=a))
+        def plot_agent_balance(agent: Agent, t, b, force=False):
+            # Times might be NumPy values which can't be saved as JSON.
+            t, b = float(t), float(b)
+            # Plot less often for long runs so that the browser stays responsive.
+            if plot_limiter.should_plot(('balance', agent.address), t, force):
+                profiler.count('plotted points')
+                plot_stream.push(('balance', agent.address), t=t, b=b * 100 / agent.start_balance)
+                save_data['balances'].append(dict(t=t, a=agent.address, b=b))
+
+        def plot_accuracy(t, a, force=True):
+            t, a = float(t), float(a)
+            if plot_limiter.should_plot('accuracy', t, force):
+                profiler.count('plotted points')
+                plot_stream.push('accuracy', t=t, a=a * 100)
+                save_data['accuracies'].append(dict(t=t, accuracy=a))
 
         continuous_evaluation = not isinstance(self._decai.im, PredictionMarket)
+        # Markets that only store hashes of the data need the data to be re-submitted to compute rewards.
+        resubmit_market_data = isinstance(self._decai.im, PredictionMarket) and self._decai.im.store_data_hashes
+        assert not resubmit_market_data or stream_chunk_size is None, \
+            "Streamed data can't be re-submitted to a prediction market that only stores hashes of the data."
 
         def task():
-            (x_train, y_train), (x_test, y_test) = \
-                self._data_loader.load_data(train_size=train_size, test_size=test_size)
+            if profile:
+                profiler.reset()
+                profiler.enabled = True
+            profiler.start_phase('setup')
             classifications = self._data_loader.classifications()
-            x_train, x_test, feature_index_mapping = self._feature_index_mapper.map(x_train, x_test)
-            x_train_len = x_train.shape[0]
-            init_idx = int(x_train_len * init_train_data_portion)
-            self._logger.info("Initializing model with %d out of %d samples.",
-                              init_idx, x_train_len)
-            x_init_data, y_init_data = x_train[:init_idx], y_train[:init_idx]
-            x_remaining, y_remaining = x_train[init_idx:], y_train[init_idx:]
+            if stream_chunk_size is None:
+                (x_train, y_train), (x_test, y_test) = \
+                    self._data_loader.load_data(train_size=train_size, test_size=test_size)
+                x_train, x_test, feature_index_mapping = self._feature_index_mapper.map(x_train, x_test)
+                x_train_len = x_train.shape[0]
+                init_idx = int(x_train_len * init_train_data_portion)
+                self._logger.info("Initializing model with %d out of %d samples.",
+                                  init_idx, x_train_len)
+                x_init_data, y_init_data = x_train[:init_idx], y_train[:init_idx]
+                x_remaining, y_remaining = x_train[init_idx:], y_train[init_idx:]
+                remaining = SampleStream.from_arrays(x_remaining, y_remaining)
+                # The index in the training data of the first sample in `remaining`.
+                sample_offset = init_idx
+            else:
+                remaining, (x_test, y_test) = self._data_loader.load_data_stream(
+                    train_size=train_size, test_size=test_size, chunk_size=stream_chunk_size)
+                feature_index_mapping = None
+                if scipy.sparse.issparse(x_test):
+                    # Training samples are dense when streaming.
+                    x_test = x_test.toarray()
+                x_train_len = remaining.num_samples
+                assert x_train_len is not None, "The number of training samples must be known to initialize the model."
+                init_idx = int(x_train_len * init_train_data_portion)
+                self._logger.info("Initializing model with %d out of %d samples.",
+                                  init_idx, x_train_len)
+                x_init_data, y_init_data = remaining.read(init_idx)
+                # The initial samples were read from `remaining`.
+                sample_offset = 0
 
             save_model = isinstance(self._decai.im, PredictionMarket) and self._decai.im.reset_model_during_reward_phase
             self._decai.model.init_model(x_init_data, y_init_data, save_model)
@@ -248,101 +491,222 @@ class Simulator(object):
             if self._logger.isEnabledFor(logging.DEBUG):
                 s = self._decai.model.evaluate(x_init_data, y_init_data)
                 self._logger.debug("Initial training data evaluation: %s", s)
-                if len(x_remaining) > 0:
+                if stream_chunk_size is not None:
+                    self._logger.debug("Not evaluating the remaining training data since it is streamed.")
+                elif len(x_remaining) > 0:
                     s = self._decai.model.evaluate(x_remaining, y_remaining)
                     self._logger.debug("Remaining training data evaluation: %s", s)
                 else:
                     self._logger.debug("There is no more remaining data to evaluate.")
 
+            if resubmit_market_data:
+                # The index in the training data of each contribution to the market.
+                market_sample_indices = array('q')
+            else:
+                market_sample_indices = None
+
+            if record_trace:
+                trace_recorder = TraceRecorder(agents.addresses, agents.start_balance.tolist(), init_idx,
+                                               train_size=train_size, test_size=test_size,
+                                               map_features=stream_chunk_size is None)
+            else:
+                trace_recorder = None
+
+            if accuracy_max_half_width is not None:
+                accuracy_estimator = AccuracyEstimator(x_test, y_test, max_half_width=accuracy_max_half_width)
+            else:
+                accuracy_estimator = None
+
+            def evaluate_accuracy(model: Classifier) -> float:
+                if accuracy_estimator is None:
+                    return model.evaluate(x_test, y_test)
+                estimate = accuracy_estimator.evaluate(model)
+                self._logger.debug("Estimated accuracy: %0.2f%% +/- %0.2f%% using %d samples.",
+                                   estimate.accuracy * 100, estimate.half_width * 100, estimate.num_samples)
+                return estimate.accuracy
+
+            if async_evaluation:
+                accuracy_evaluator = AsyncEvaluator(evaluate_accuracy, self._logger)
+            else:
+                accuracy_evaluator = None
+
             self._logger.info("Evaluating initial model.")
             accuracy = self._decai.model.log_evaluation_details(x_test, y_test)
             self._logger.info("Initial test set accuracy: %0.2f%%", accuracy * 100)
             t = self._time()
-            doc.add_next_tick_callback(
-                partial(plot_accuracy_cb, t=t, a=accuracy))
-
-            q = PriorityQueue()
-            random.shuffle(agents)
-            for agent in agents:
-                self._balances.initialize(agent.address, agent.start_balance)
-                q.put((self._time() + agent.get_next_wait_s(), agent))
-                doc.add_next_tick_callback(
-                    partial(plot_cb, agent=agent, t=t, b=agent.start_balance))
-
-            unclaimed_data = []
-            next_data_index = 0
-            next_accuracy_plot_time = 1E4
+            plot_accuracy(t, accuracy)
+
+            def save_progress():
+                with profiler.timer('Simulator.save_run_data'):
+                    with open(save_path, 'w') as f:
+                        json.dump(save_data, f, separators=(',', ':'))
+                with profiler.timer('Simulator.save_metrics'):
+                    save_metrics(metrics_path_for(save_path), save_data)
+                with profiler.timer('Simulator.export_model'):
+                    self._decai.model.export(model_save_path, classifications,
+                                             feature_index_mapping=feature_index_mapping)
+
+                with profiler.timer('Simulator.submit_plot_image'):
+                    if plot_image_exporter is not None:
+                        plot_image_exporter.submit(to_columns(save_data), plot_save_path)
+
+            def plot_balance(agent_index: int, t):
+                if agent_index < num_plotted_agents:
+                    agent = plotted_agents[agent_index]
+                    plot_agent_balance(agent, t, self._balances[agent.address])
+
+            scheduler = EventScheduler()
+            for address, start_balance in zip(agents.addresses, agents.start_balance):
+                self._balances.initialize(address, float(start_balance))
+            for agent in plotted_agents:
+                plot_agent_balance(agent, t, agent.start_balance, force=True)
+            # Schedule in a random order since events at the same time are handled in the order they were scheduled.
+            order = np.random.default_rng(seed).permutation(len(agents))
+            start_times = self._time() + agents.get_next_waits_s(order)
+            calls_model = agents.calls_model[order]
+            scheduler.schedule_many(start_times[calls_model], EventType.PREDICT, order[calls_model].tolist())
+            scheduler.schedule_many(start_times[~calls_model], EventType.ADD_DATA, order[~calls_model].tolist())
+            scheduler.schedule(1E4, EventType.ACCURACY_TICK)
+
+            refund_time_s = self._decai.im.refund_time_s
+            any_address_claim_wait_time_s = self._decai.im.any_address_claim_wait_time_s
+            # Data that was added and might still have some of its deposit left to claim, oldest first.
+            unclaimed: Deque[_PendingClaim] = deque()
             desc = "Processing agent requests"
             current_time = 0
-            with tqdm(desc=desc,
-                      unit_scale=True, mininterval=2, unit=" requests",
-                      total=len(x_remaining),
-                      ) as pbar:
-                while not q.empty():
-                    # For now assume sending a transaction (editing) is free (no gas)
-                    # since it should be relatively cheaper than the deposit required to add data.
-                    # It may not be cheaper than calling `report`.
 
-                    if next_data_index >= len(x_remaining):
-                        if not continuous_evaluation or len(unclaimed_data) == 0:
-                            break
+            def update_accuracy():
+                """
+                Use the most recent accuracy from the background evaluations.
+                """
+                nonlocal accuracy
+                result = accuracy_evaluator.pop_result()
+                if result is not None:
+                    evaluated_time, accuracy = result
+                    plot_accuracy(evaluated_time, accuracy)
+
+            def handle_accuracy_tick(t, events: List[Event]):
+                nonlocal accuracy, current_time
+                current_time = t
+                self._time.set_time(t)
+                self._logger.debug("Evaluating.")
+                if accuracy_evaluator is None:
+                    accuracy = evaluate_accuracy(self._decai.model)
+                    plot_accuracy(t, accuracy)
+                else:
+                    update_accuracy()
+                    accuracy_evaluator.submit(t, self._decai.model)
+
+                if continuous_evaluation:
+                    self._logger.debug("Unclaimed data: %d", len(unclaimed))
+                    pbar.set_description(f"{desc} ({len(unclaimed)} unclaimed)")
+
+                save_progress()
+                # Only keep evaluating while something else can still happen.
+                if len(scheduler) > 0 and accuracy_plot_wait_s < math.inf:
+                    scheduler.schedule(t + accuracy_plot_wait_s, EventType.ACCURACY_TICK)
+
+            def claim_deposits(agent_index: int, t) -> bool:
+                """
+                Let an agent try to claim the deposits for data that can be refunded or reported, oldest first.
+
+                :return: `True` if a claim was accepted, `False` otherwise.
+                """
+                address = agents.addresses[agent_index]
+                result = False
+                # The claims that were checked and still have some of their deposit left.
+                kept = []
+                while len(unclaimed) > 0:
+                    claim = unclaimed[0]
+                    elapsed = t - claim.added_time
+                    if elapsed < refund_time_s:
+                        break
+                    if not remaining.has_next() and elapsed < any_address_claim_wait_time_s:
+                        # Once all data has been added, only wait for anyone to be able to take the deposit.
+                        break
+                    unclaimed.popleft()
+                    author = agents.addresses[claim.agent]
+                    msg = Msg(address, self._balances[address])
+                    try:
+                        if elapsed > any_address_claim_wait_time_s or claim.agent != agent_index:
+                            # Attempt to take the deposit.
+                            call_type = CallType.REPORT
+                            self._decai.report(msg, claim.x, claim.classification, claim.added_time, author)
+                        else:
+                            call_type = CallType.REFUND
+                            self._decai.refund(msg, claim.x, claim.classification, claim.added_time)
+                        result = True
+                        if trace_recorder is not None:
+                            trace_recorder.record(call_type, t, address, msg.value, claim.sample_index,
+                                                  claim.classification, added_time=claim.added_time, author=author)
+                    except RejectException:
+                        if self._logger.isEnabledFor(logging.DEBUG):
+                            self._logger.exception("Error claiming deposit.")
+                    stored_data = self._decai.data_handler.get_data(claim.x, claim.classification,
+                                                                    claim.added_time, author)
+                    if stored_data.claimable_amount > 0:
+                        kept.append(claim)
+                unclaimed.extendleft(reversed(kept))
+                return result
 
-                    current_time, agent = q.get()
+            def handle_agent_turns(t, events: List[Event]):
+                nonlocal current_time
+                # For now assume sending a transaction (editing) is free (no gas)
+                # since it should be relatively cheaper than the deposit required to add data.
+                # It may not be cheaper than calling `report`.
+                current_time = t
+                self._time.set_time(t)
+                if accuracy_evaluator is not None:
+                    update_accuracy()
+                active = []
+                if events[0].type == EventType.ADD_DATA:
+                    # Draw deposits for the whole batch at once even though some agents won't contribute.
+                    deposits = agents.get_next_deposits([event.payload for event in events])
+                else:
+                    # Agents that call the model don't make deposits and might not be able to draw a positive one.
+                    deposits = np.zeros(len(events), dtype=np.int64)
+                for event, deposit in zip(events, deposits):
+                    agent_index: int = event.payload
+                    agent = agents[agent_index]
                     update_balance_plot = False
-                    if current_time > next_accuracy_plot_time:
-                        self._logger.debug("Evaluating.")
-                        next_accuracy_plot_time += accuracy_plot_wait_s
-                        accuracy = self._decai.model.evaluate(x_test, y_test)
-                        doc.add_next_tick_callback(
-                            partial(plot_accuracy_cb, t=current_time, a=accuracy))
-
-                        if continuous_evaluation:
-                            self._logger.debug("Unclaimed data: %d", len(unclaimed_data))
-                            pbar.set_description(f"{desc} ({len(unclaimed_data)} unclaimed)")
-
-                        with open(save_path, 'w') as f:
-                            json.dump(save_data, f, separators=(',', ':'))
-                        self._decai.model.export(model_save_path, classifications,
-                                                 feature_index_mapping=feature_index_mapping)
-
-                        if os.path.exists(plot_save_path):
-                            os.remove(plot_save_path)
-                        self.save_plot_image(plot, plot_save_path)
-
-                    self._time.set_time(current_time)
-
                     balance = self._balances[agent.address]
-                    if balance > 0 and next_data_index < len(x_remaining):
+                    if balance > 0 and remaining.has_next():
                         # Pick data.
-                        x, y = x_remaining[next_data_index], y_remaining[next_data_index]
+                        x, y = remaining.peek()
+                        sample_index = sample_offset + remaining.num_read
 
                         if agent.calls_model:
                             # Only call the model if it's good.
-                            if random.random() < accuracy:
+                            if rng.random() < accuracy:
                                 update_balance_plot = True
                                 self._decai.predict(Msg(agent.address, agent.pay_to_call), x)
+                                if trace_recorder is not None:
+                                    trace_recorder.record(CallType.PREDICT, t, agent.address, agent.pay_to_call,
+                                                          sample_index)
                         else:
                             if not agent.good:
                                 y = 1 - y
-                            if agent.prob_mistake > 0 and random.random() < agent.prob_mistake:
+                            if agent.prob_mistake > 0 and rng.random() < agent.prob_mistake:
                                 y = 1 - y
 
                             # Bad agents always contribute.
                             # Good agents will only work if the model is doing well.
                             # Add a bit of chance they will contribute since 0.85 accuracy is okay.
-                            if not agent.good or random.random() < accuracy + 0.15:
-                                value = agent.get_next_deposit()
+                            if not agent.good or rng.random() < accuracy + 0.15:
+                                value = int(deposit)
                                 if value > balance:
                                     value = balance
                                 msg = Msg(agent.address, value)
                                 try:
                                     self._decai.add_data(msg, x, y)
-                                    # Don't need to plot every time. Plot less as we get more data.
-                                    update_balance_plot = next_data_index / len(x_remaining) + 0.1 < random.random()
+                                    update_balance_plot = True
                                     balance = self._balances[agent.address]
+                                    if trace_recorder is not None:
+                                        trace_recorder.record(CallType.ADD_DATA, t, agent.address, value,
+                                                              sample_index, y)
                                     if continuous_evaluation:
-                                        unclaimed_data.append((current_time, agent, x, y))
-                                    next_data_index += 1
+                                        unclaimed.append(_PendingClaim(t, agent_index, x, y, sample_index))
+                                    remaining.advance()
                                     pbar.update()
                                 except RejectException:
                                     # Probably failed because they didn't pay enough which is okay.
@@ -351,140 +715,152 @@ class Simulator(object):
                                     # because the smallest unit of time we can use is 1s.
                                     if self._logger.isEnabledFor(logging.DEBUG):
                                         self._logger.exception("Error adding data.")
+                                if market_sample_indices is not None:
+                                    # The market keeps contributions even if adding the data fails afterwards.
+                                    num_market_contributions = self._decai.im.get_num_contributions_in_market()
+                                    if len(market_sample_indices) < num_market_contributions:
+                                        market_sample_indices.append(sample_index)
 
                     if balance > 0:
-                        q.put((current_time + agent.get_next_wait_s(), agent))
-
-                    claimed_indices = []
-                    for i in range(len(unclaimed_data)):
-                        added_time, adding_agent, x, classification = unclaimed_data[i]
-                        if current_time - added_time < self._decai.im.refund_time_s:
-                            break
-                        if next_data_index >= len(x_remaining) \
-                                and current_time - added_time < self._decai.im.any_address_claim_wait_time_s:
-                            break
-                        balance = self._balances[agent.address]
-                        msg = Msg(agent.address, balance)
-
-                        if current_time - added_time > self._decai.im.any_address_claim_wait_time_s:
-                            # Attempt to take the entire deposit.
-                            try:
-                                self._decai.report(msg, x, classification, added_time, adding_agent.address)
-                                update_balance_plot = True
-                            except RejectException:
-                                if self._logger.isEnabledFor(logging.DEBUG):
-                                    self._logger.exception("Error taking reward.")
-                        elif adding_agent.address == agent.address:
-                            try:
-                                self._decai.refund(msg, x, classification, added_time)
-                                update_balance_plot = True
-                            except RejectException:
-                                if self._logger.isEnabledFor(logging.DEBUG):
-                                    self._logger.exception("Error getting refund.")
-                        else:
-                            try:
-                                self._decai.report(msg, x, classification, added_time, adding_agent.address)
-                                update_balance_plot = True
-                            except RejectException:
-                                if self._logger.isEnabledFor(logging.DEBUG):
-                                    self._logger.exception("Error taking reward.")
-
-                        stored_data = self._decai.data_handler.get_data(x, classification,
-                                                                        added_time, adding_agent.address)
-                        if stored_data.claimable_amount <= 0:
-                            claimed_indices.append(i)
+                        active.append(agent_index)
 
-                    for i in claimed_indices[::-1]:
-                        unclaimed_data.pop(i)
+                    # The agent also checks if it can claim deposits for data that was added.
+                    if continuous_evaluation and claim_deposits(agent_index, t):
+                        update_balance_plot = True
 
                     if update_balance_plot:
-                        balance = self._balances[agent.address]
-                        doc.add_next_tick_callback(
-                            partial(plot_cb, agent=agent, t=current_time, b=balance))
+                        plot_balance(agent_index, t)
+
+                if len(active) > 0:
+                    scheduler.schedule_many(t + agents.get_next_waits_s(active), events[0].type, active)
+
+            scheduler.register(EventType.ACCURACY_TICK, handle_accuracy_tick)
+            scheduler.register(EventType.ADD_DATA, handle_agent_turns)
+            scheduler.register(EventType.PREDICT, handle_agent_turns)
+
+            def is_done_with_data() -> bool:
+                return not remaining.has_next() \
+                       and (not continuous_evaluation or len(unclaimed) == 0)
+
+            profiler.start_phase('agents')
+            with tqdm(desc=desc,
+                      unit_scale=True, mininterval=2, unit=" requests",
+                      total=remaining.num_remaining,
+                      ) as pbar:
+                scheduler.run(stop_condition=is_done_with_data)
 
             self._logger.info("Done going through data.")
+            if accuracy_evaluator is not None:
+                accuracy_evaluator.close()
+                update_accuracy()
             if continuous_evaluation:
-                pbar.set_description(f"{desc} ({len(unclaimed_data)} unclaimed)")
+                pbar.set_description(f"{desc} ({len(unclaimed)} unclaimed)")
 
             if isinstance(self._decai.im, PredictionMarket):
-                self._time.add_time(agents[0].get_next_wait_s())
-                self._decai.im.end_market()
-                for i, test_set_portion in enumerate(pm_test_sets):
-                    if i != self._decai.im.test_reveal_index:
-                        self._decai.im.verify_next_test_set(test_set_portion)
-                with tqdm(desc="Processing contributions",
-                          unit_scale=True, mininterval=2, unit=" contributions",
-                          total=self._decai.im.get_num_contributions_in_market(),
-                          ) as pbar:
-                    finished_first_round_of_rewards = False
-                    while self._decai.im.remaining_bounty_rounds > 0:
-                        self._time.add_time(agents[0].get_next_wait_s())
-                        self._decai.im.process_contribution()
-                        pbar.update()
+                im: PredictionMarket = self._decai.im
+                profiler.start_phase('rewards')
+                # Agents no longer act during the reward phase.
+                scheduler.clear()
+                finished_first_round_of_rewards = False
+
+                def handle_market_phase(t, events: List[Event]):
+                    nonlocal accuracy, finished_first_round_of_rewards
+                    self._time.set_time(t)
+                    if im.state == MarketPhase.PARTICIPATION:
+                        im.end_market()
+                        for i, test_set_portion in enumerate(pm_test_sets):
+                            if i != im.test_reveal_index:
+                                im.verify_next_test_set(test_set_portion)
+                    else:
+                        if market_sample_indices is None:
+                            im.process_contribution()
+                        else:
+                            im.process_contribution(x_train[market_sample_indices[im.next_contribution_index]])
+                        reward_pbar.update()
 
                         if not finished_first_round_of_rewards:
-                            accuracy = self._decai.im.prev_acc
+                            accuracy = im.prev_acc
                             # If we plot too often then we end up with a blob instead of a line.
-                            if random.random() < 0.1:
-                                doc.add_next_tick_callback(
-                                    partial(plot_accuracy_cb, t=self._time(), a=accuracy))
+                            plot_accuracy(self._time(), accuracy, force=False)
 
-                        if self._decai.im.state == MarketPhase.REWARD_RESTART:
+                        if im.state == MarketPhase.REWARD_RESTART:
                             finished_first_round_of_rewards = True
-                            if self._decai.im.reset_model_during_reward_phase:
+                            if im.reset_model_during_reward_phase:
                                 # Update the accuracy after resetting all data.
-                                accuracy = self._decai.im.prev_acc
+                                accuracy = im.prev_acc
                             else:
                                 # Use the accuracy after training with all data.
                                 pass
-                            doc.add_next_tick_callback(
-                                partial(plot_accuracy_cb, t=self._time(), a=accuracy))
-                            pbar.total += self._decai.im.get_num_contributions_in_market()
+                            plot_accuracy(self._time(), accuracy)
+                            reward_pbar.total += im.get_num_contributions_in_market()
                             self._time.add_time(self._time() * 0.001)
 
-                            for agent in agents:
+                            for agent in plotted_agents:
                                 balance = self._balances[agent.address]
-                                market_bal = self._decai.im._market_balances[agent.address]
+                                market_bal = im._market_balances[agent.address]
                                 self._logger.debug("\"%s\" market balance: %0.2f   Balance: %0.2f",
                                                    agent.address, market_bal, balance)
-                                doc.add_next_tick_callback(
-                                    partial(plot_cb, agent=agent, t=self._time(), b=max(balance + market_bal, 0)))
+                                plot_agent_balance(agent, self._time(), max(balance + market_bal, 0), force=True)
+
+                    if im.remaining_bounty_rounds > 0:
+                        scheduler.schedule(self._time() + int(agents.get_next_waits_s([0])[0]), EventType.MARKET_PHASE)
+
+                scheduler.register(EventType.MARKET_PHASE, handle_market_phase)
+                scheduler.schedule(self._time() + int(agents.get_next_waits_s([0])[0]), EventType.MARKET_PHASE)
+                with tqdm(desc="Processing contributions",
+                          unit_scale=True, mininterval=2, unit=" contributions",
+                          total=im.get_num_contributions_in_market(),
+                          ) as reward_pbar:
+                    scheduler.run()
 
                 self._time.add_time(self._time() * 0.02)
-                for agent in agents:
-                    msg = Msg(agent.address, 0)
-                    # Find data submitted by them.
-                    data = None
-                    for key, stored_data in self._decai.data_handler:
-                        if stored_data.sender == agent.address:
-                            data = key[0]
-                            break
-                    if data is not None:
+                # Find data submitted by each agent.
+                data_per_sender = dict()
+                for key, stored_data in self._decai.data_handler:
+                    if stored_data.sender not in data_per_sender:
+                        data_per_sender[stored_data.sender] = (key[0], stored_data)
+                for agent_index, agent_address in enumerate(agents.addresses):
+                    msg = Msg(agent_address, 0)
+                    is_plotted = agent_index < num_plotted_agents
+                    if agent_address in data_per_sender:
+                        data, stored_data = data_per_sender[agent_address]
                         self._decai.refund(msg, np.array(data), stored_data.classification, stored_data.time)
-                        balance = self._balances[agent.address]
-                        doc.add_next_tick_callback(
-                            partial(plot_cb, agent=agent, t=self._time(), b=balance))
-                        self._logger.info("Balance for \"%s\": %.2f (%+.2f%%)",
-                                          agent.address, balance,
-                                          (balance - agent.start_balance) / agent.start_balance * 100)
-                    else:
+                        if is_plotted:
+                            agent = plotted_agents[agent_index]
+                            balance = self._balances[agent.address]
+                            plot_agent_balance(agent, self._time(), balance, force=True)
+                            self._logger.info("Balance for \"%s\": %.2f (%+.2f%%)",
+                                              agent.address, balance,
+                                              (balance - agent.start_balance) / agent.start_balance * 100)
+                    elif is_plotted:
                         self._logger.warning("No data submitted by \"%s\" was found."
-                                             "\nWill not update it's balance.", agent.address)
+                                             "\nWill not update it's balance.", agent_address)
 
                 self._logger.info("Done issuing rewards.")
 
+            profiler.start_phase('final')
             accuracy = self._decai.model.log_evaluation_details(x_test, y_test)
-            doc.add_next_tick_callback(
-                partial(plot_accuracy_cb, t=current_time + 100, a=accuracy))
-
-            with open(save_path, 'w') as f:
-                json.dump(save_data, f, separators=(',', ':'))
-            self._decai.model.export(model_save_path, classifications, feature_index_mapping=feature_index_mapping)
-
-            if os.path.exists(plot_save_path):
-                os.remove(plot_save_path)
-            self.save_plot_image(plot, plot_save_path)
+            plot_accuracy(current_time + 100, accuracy)
+
+            if trace_recorder is not None:
+                self._logger.info("Saving trace of %d calls to \"%s\".", len(trace_recorder), trace_save_path)
+                with profiler.timer('Simulator.save_trace'):
+                    trace_recorder.save(trace_save_path)
+
+            save_progress()
+            if plot_image_exporter is not None:
+                # Make sure the final image is saved.
+                plot_image_exporter.close()
+
+            if profiler.enabled:
+                profiler.end_phase()
+                self._logger.info("Profile:\n%s", profiler.summary())
+                self._logger.info("Saving profile to \"%s\".", profile_save_path)
+                profiler.save(profile_save_path)
+                if profile:
+                    profiler.enabled = False
 
         doc.add_root(plot)
         thread = Thread(target=task)
         thread.start()
+        return thread
@@ -3,69 +3,17 @@ import re
 import sys
 
 from injector import Injector
-from sklearn.naive_bayes import MultinomialNB
 
-from decai.simulation.contract.classification.ncc_module import NearestCentroidClassifierModule
-from decai.simulation.contract.classification.perceptron import PerceptronModule
-from decai.simulation.contract.classification.scikit_classifier import SciKitClassifierModule
 from decai.simulation.contract.collab_trainer import DefaultCollaborativeTrainerModule
-from decai.simulation.contract.incentive.stakeable import StakeableImModule
 from decai.simulation.data.featuremapping.hashing.murmurhash3 import MurmurHash3Module
-from decai.simulation.data.fitness_data_loader import FitnessDataModule
-from decai.simulation.data.imdb_data_loader import ImdbDataModule
-from decai.simulation.data.news_data_loader import NewsDataModule
-from decai.simulation.data.offensive_data_loader import OffensiveDataModule
 from decai.simulation.logging_module import LoggingModule
+from decai.simulation.multi_model import MultiModelSimulator
+from decai.simulation.registry import datasets, incentive_mechanisms, models
 from decai.simulation.simulate import Agent, Simulator
 
 # For `bokeh serve`.
 sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
 
-datasets = dict(
-    fitness=dict(module=FitnessDataModule,
-                 train_size=3500, test_size=1500,
-                 ),
-    imdb=dict(module=ImdbDataModule(num_words=1000),
-              train_size=None, test_size=None,
-              ),
-    news=dict(module=NewsDataModule,
-              train_size=None, test_size=None,
-              ),
-    offensive=dict(module=OffensiveDataModule,
-                   train_size=None, test_size=None,
-                   ),
-)
-
-models = dict(
-    nb=dict(module=SciKitClassifierModule(MultinomialNB),
-            baseline_accuracy=dict(
-                # train_size, test_size = 3500, 1500
-                fitness=0.97,
-                # train_size, test_size = None, None
-                imdb=0.8323,
-                # train_size, test_size = None, None
-                news=0.8181,
-            )),
-    ncc=dict(module=NearestCentroidClassifierModule,
-             baseline_accuracy=dict(
-                 # train_size, test_size = 3500, 1500
-                 fitness=0.9513,
-                 # train_size, test_size = None, None
-                 imdb=0.7445,
-                 # train_size, test_size = None, None
-                 news=0.6727,
-             )),
-    perceptron=dict(module=PerceptronModule,
-                    baseline_accuracy=dict(
-                        # train_size, test_size = 3500, 1500
-                        fitness=0.9507,
-                        # train_size, test_size = None, None
-                        imdb=0.73,
-                        # train_size, test_size = None, None
-                        news=0.9003,
-                    )),
-)
-
 # Set up the agents that will act in the simulation.
 agents = [
     # Good
@@ -102,12 +50,16 @@ def main():
     # This file is set up to use different models and datasets.
     dataset = 'offensive'
     model_type = 'nb'
+    # Other models to simulate with the same agents and data to compare with, e.g. ['ncc', 'perceptron'].
+    compared_model_types = []
 
     assert dataset in datasets
     assert model_type in models
+    assert all(t in models for t in compared_model_types)
 
-    train_size = datasets[dataset]['train_size']
-    test_size = datasets[dataset]['test_size']
+    dataset_info = datasets.get_info(dataset)
+    train_size = dataset_info.get('train_size')
+    test_size = dataset_info.get('test_size')
     if train_size is None:
         init_train_data_portion = 0.08
     else:
@@ -116,20 +68,47 @@ def main():
     # No caller (assume free to call).
     agents = agents[:-1]
 
+    if len(compared_model_types) > 0:
+        model_types = [model_type, *compared_model_types]
+        # Set up the data once for all of the models.
+        inj = Injector([
+            datasets.get_module(dataset),
+            MurmurHash3Module,
+            LoggingModule,
+        ])
+        s = inj.get(MultiModelSimulator)
+
+        # Start the simulation.
+        s.simulate({t: models.get_module(t) for t in model_types},
+                   # Set up the incentive mechanism for each model.
+                   [
+                       DefaultCollaborativeTrainerModule,
+                       LoggingModule,
+                       incentive_mechanisms.get_module('stakeable'),
+                   ],
+                   agents,
+                   baseline_accuracies={t: models.get_info(t)['baseline_accuracy'].get(dataset) for t in model_types},
+                   init_train_data_portion=init_train_data_portion,
+                   train_size=train_size,
+                   test_size=test_size,
+                   filename_indicator=dataset,
+                   )
+        return
+
     # Set up the data, model, and incentive mechanism.
     inj = Injector([
         DefaultCollaborativeTrainerModule,
-        datasets[dataset]['module'],
+        datasets.get_module(dataset),
         MurmurHash3Module,
         LoggingModule,
-        models[model_type]['module'],
-        StakeableImModule,
+        models.get_module(model_type),
+        incentive_mechanisms.get_module('stakeable'),
     ])
     s = inj.get(Simulator)
 
     # Start the simulation.
     s.simulate(agents,
-               baseline_accuracy=models[model_type]['baseline_accuracy'].get(dataset),
+               baseline_accuracy=models.get_info(model_type)['baseline_accuracy'].get(dataset),
                init_train_data_portion=init_train_data_portion,
                train_size=train_size,
                test_size=test_size,
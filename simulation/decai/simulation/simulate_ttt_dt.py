@@ -2,7 +2,6 @@ import json
 import os
 import random
 import sys
-from collections import Counter
 from typing import cast
 
 import math
@@ -16,6 +15,7 @@ from decai.simulation.contract.incentive.stakeable import StakeableImModule
 from decai.simulation.data.data_loader import DataLoader
 from decai.simulation.data.ttt_data_loader import TicTacToeDataModule, TicTacToeDataLoader
 from decai.simulation.logging_module import LoggingModule
+from decai.simulation.self_play import SelfPlayResults, evaluate_self_play
 from decai.simulation.simulate import Agent, Simulator
 
 # For `bokeh serve`.
@@ -132,44 +132,21 @@ def play_game(classifier, tic_tac_toe):
 def evaluate_on_self(classifier, tic_tac_toe):
     print("Evaluating by playing against itself.")
 
-    def _run_game(board, next_player):
-        if next_player == -1:
-            # Flip the board since the bot always thinks it is 1.
-            board_for_prediction = -board
-        else:
-            board_for_prediction = board
-        pos = classifier.predict(board_for_prediction.flatten())
-        pos = _map_pos(tic_tac_toe, board, pos)
-        if board[pos] != 0:
-            return "TIE", np.count_nonzero(board == next_player)
-        board[pos] = next_player
-        if tic_tac_toe.get_winner(board):
-            return next_player, np.count_nonzero(board == next_player)
-        else:
-            return _run_game(board, -1 if next_player == 1 else 1)
-
     # Start with empty board and let the model pick where to start.
-    board = np.zeros((tic_tac_toe.width, tic_tac_toe.length), dtype=np.int8)
-    winner, num_moves = _run_game(board, 1)
+    # Then have -1 start in each position.
+    results = evaluate_self_play(classifier, tic_tac_toe)
+    winner, num_moves = results.winners[0], results.num_moves[0]
     if winner == 1:
         print(f"When model starts: WINS in {num_moves} moves.")
-    elif isinstance(winner, str):
-        print(f"When model starts: {winner} in {num_moves} moves.")
+    elif winner == 0:
+        print(f"When model starts: TIE in {num_moves} moves.")
     else:
         print(f"When model starts: LOSES. Winner has {num_moves} moves.")
 
-    winners = Counter()
-    winner_move_counts = []
-    for start_pos in range(board.size):
-        board = np.zeros((tic_tac_toe.width, tic_tac_toe.length), dtype=np.int8)
-        board[_map_pos(tic_tac_toe, board, start_pos)] = -1
-        winner, num_moves = _run_game(board, 1)
-        winners[winner] += 1
-        winner_move_counts.append(num_moves)
-    print("Winners when -1 starts in each position:")
-    print(json.dumps(winners, indent=2))
-    print(f"Winner move counts:\n{winner_move_counts}")
-    print(f"Avg # winner moves: {np.average(winner_move_counts)}")
+    results = SelfPlayResults(results.winners[1:], results.num_moves[1:])
+    print("Results when -1 starts in each position:")
+    print(json.dumps(results.summary(), indent=2))
+    print(f"Winner move counts:\n{results.num_moves.tolist()}")
 
 
 if __name__ == '__main__':
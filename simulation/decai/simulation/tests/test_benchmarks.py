@@ -0,0 +1,59 @@
+import json
+import os
+import tempfile
+import unittest
+
+from decai.simulation.benchmarks import compare_results, get_benchmarks, main, run_benchmarks
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_run(self):
+        benchmarks = get_benchmarks(['perceptron'])
+        names = {b.name for b in benchmarks}
+        self.assertIn('PredictionMarket.settle', names)
+        self.assertIn('SciKitClassifier-perceptron.update', names)
+
+        results = run_benchmarks(benchmarks, repeats=1, quick=True)
+        self.assertTrue(results['metadata']['quick'])
+        self.assertEqual(sum(len(b.quick_sizes) for b in benchmarks), len(results['results']))
+        for name, result in results['results'].items():
+            self.assertGreater(result['best_s'], 0, name)
+            self.assertAlmostEqual(result['best_s'] / result['num_ops'], result['per_op_s'])
+        # Make sure the results can be saved.
+        json.dumps(results)
+
+    def test_compare(self):
+        baseline = dict(results={
+            'a[10]': dict(best_s=1.0),
+            'b[10]': dict(best_s=1.0),
+            'c[10]': dict(best_s=1.0),
+            'removed[10]': dict(best_s=1.0),
+        })
+        current = dict(results={
+            'a[10]': dict(best_s=1.5),
+            'b[10]': dict(best_s=0.5),
+            'c[10]': dict(best_s=1.05),
+            'new[10]': dict(best_s=1.0),
+        })
+        comparison = {c['name']: c for c in compare_results(baseline, current, threshold=0.1)}
+        self.assertEqual({'a[10]', 'b[10]', 'c[10]'}, set(comparison.keys()))
+        self.assertEqual('slower', comparison['a[10]']['change'])
+        self.assertAlmostEqual(1.5, comparison['a[10]']['ratio'])
+        self.assertEqual('faster', comparison['b[10]']['change'])
+        self.assertEqual('same', comparison['c[10]']['change'])
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as d:
+            output = os.path.join(d, 'results.json')
+            args = ['--quick', '--repeats', '1', '--filter', 'Balances', '--models', 'perceptron']
+            self.assertEqual(0, main(args + ['--output', output]))
+            with open(output) as f:
+                results = json.load(f)
+            self.assertEqual(['Balances.send[20]'], list(results['results'].keys()))
+
+            # Compare with results that were much faster.
+            results['results']['Balances.send[20]']['best_s'] /= 1E6
+            baseline = os.path.join(d, 'baseline.json')
+            with open(baseline, 'w') as f:
+                json.dump(results, f)
+            self.assertEqual(1, main(args + ['--output', output, '--compare', baseline]))
@@ -0,0 +1,28 @@
+import unittest
+
+import numpy as np
+
+from decai.simulation.downsampling import lttb
+
+
+class TestDownsampling(unittest.TestCase):
+    def test_small(self):
+        x, y = np.arange(5), np.arange(5) ** 2
+        x_sampled, y_sampled = lttb(x, y, max_points=5)
+        self.assertEqual(x.tolist(), x_sampled.tolist())
+        self.assertEqual(y.tolist(), y_sampled.tolist())
+
+    def test_keeps_peaks(self):
+        x = np.arange(10_000, dtype=np.float64)
+        y = np.zeros_like(x)
+        y[1234] = 50
+        y[7777] = -20
+        x_sampled, y_sampled = lttb(x, y, max_points=100)
+        self.assertEqual(100, len(x_sampled))
+        self.assertEqual(0, x_sampled[0])
+        self.assertEqual(9999, x_sampled[-1])
+        self.assertTrue(np.all(np.diff(x_sampled) > 0))
+        self.assertIn(1234, x_sampled)
+        self.assertIn(7777, x_sampled)
+        self.assertEqual(50, y_sampled.max())
+        self.assertEqual(-20, y_sampled.min())
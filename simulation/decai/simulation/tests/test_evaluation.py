@@ -0,0 +1,163 @@
+import logging
+import threading
+import unittest
+from typing import List
+
+import numpy as np
+
+from decai.simulation.contract.classification.classifier import Classifier
+from decai.simulation.evaluation import AccuracyEstimator, AsyncEvaluator
+
+
+class _FirstFeatureClassifier(Classifier):
+    """
+    Predicts the first feature of each sample.
+    """
+
+    def __init__(self, offset: int = 0):
+        self.num_evaluated = 0
+        self.offset = offset
+
+    def evaluate(self, data, labels) -> float:
+        self.num_evaluated += len(labels)
+        return float(np.mean(data[:, 0] == labels))
+
+    def log_evaluation_details(self, data, labels, level=logging.INFO) -> float:
+        return self.evaluate(data, labels)
+
+    def init_model(self, training_data, labels, save_model=False):
+        pass
+
+    def predict(self, data):
+        return data[0]
+
+    def predict_batch(self, data):
+        self.num_evaluated += len(data)
+        return data[:, 0]
+
+    def snapshot(self) -> '_FirstFeatureClassifier':
+        return _FirstFeatureClassifier(self.offset)
+
+    def update(self, data, classification):
+        pass
+
+    def reset_model(self):
+        pass
+
+    def export(self, path: str, classifications: List[str] = None, model_type: str = None,
+               feature_index_mapping=None):
+        pass
+
+
+def _make_test_set(num_samples: int, accuracy: float, rng: np.random.Generator):
+    # Imbalanced classes.
+    y = (rng.random(num_samples) < 0.2).astype(np.int64)
+    x = y.copy()[:, None]
+    wrong = rng.choice(num_samples, int(round((1 - accuracy) * num_samples)), replace=False)
+    x[wrong, 0] = 1 - x[wrong, 0]
+    return x, y
+
+
+class TestAccuracyEstimator(unittest.TestCase):
+    def test_estimate(self):
+        rng = np.random.default_rng(1)
+        num_samples = 100_000
+        x, y = _make_test_set(num_samples, 0.9, rng)
+        model = _FirstFeatureClassifier()
+        estimator = AccuracyEstimator(x, y, max_half_width=0.02, seed=2)
+        num_in_interval = 0
+        for _ in range(20):
+            estimate = estimator.evaluate(model)
+            self.assertFalse(estimate.exact)
+            self.assertLessEqual(estimate.half_width, 0.02)
+            self.assertLess(estimate.num_samples, num_samples / 5)
+            if estimate.lower <= 0.9 <= estimate.upper:
+                num_in_interval += 1
+        self.assertGreaterEqual(num_in_interval, 17)
+        # Only some of the test set was evaluated each time.
+        self.assertLess(model.num_evaluated, 20 * num_samples / 5)
+
+        estimate = estimator.evaluate(model, exact=True)
+        self.assertTrue(estimate.exact)
+        self.assertEqual(0.9, estimate.accuracy)
+        self.assertEqual(0, estimate.half_width)
+        self.assertEqual(num_samples, estimate.num_samples)
+
+    def test_small_test_set(self):
+        x, y = _make_test_set(150, 0.8, np.random.default_rng(1))
+        estimator = AccuracyEstimator(x, y, max_half_width=0.01, seed=2)
+        for _ in range(3):
+            estimate = estimator.evaluate(_FirstFeatureClassifier())
+            self.assertTrue(estimate.exact)
+            self.assertAlmostEqual(0.8, estimate.accuracy)
+
+    def test_adapts_to_changes(self):
+        rng = np.random.default_rng(1)
+        test_sets = [_make_test_set(100_000, accuracy, rng) for accuracy in [0.6, 0.7, 0.8, 0.9]]
+        x, y = test_sets[0]
+        estimator = AccuracyEstimator(x, y, max_half_width=0.02, seed=2)
+        model = _FirstFeatureClassifier()
+        estimator.evaluate(model)
+        initial_sample_size = estimator.sample_size
+
+        # The accuracy changes a lot so a small sample is enough.
+        for x, y in test_sets[1:]:
+            estimator.x_test, estimator.y_test = x, y
+            estimator.evaluate(model)
+        changing_sample_size = estimator.sample_size
+        self.assertLessEqual(changing_sample_size, initial_sample_size)
+
+        # The accuracy is stable so more samples are used to see smaller changes.
+        for _ in range(10):
+            estimator.evaluate(model)
+        self.assertGreater(estimator.sample_size, 4 * changing_sample_size)
+
+
+class TestAsyncEvaluator(unittest.TestCase):
+    def test_latest_result(self):
+        started = threading.Event()
+        release = threading.Event()
+        evaluated_offsets = []
+
+        def evaluate(model: _FirstFeatureClassifier) -> float:
+            started.set()
+            release.wait()
+            evaluated_offsets.append(model.offset)
+            return model.offset / 10
+
+        evaluator = AsyncEvaluator(evaluate, logging.getLogger())
+        self.assertIsNone(evaluator.pop_result())
+        model = _FirstFeatureClassifier()
+        evaluator.submit(0, model)
+        started.wait()
+        # These are submitted while the first snapshot is being evaluated so only the last one is evaluated.
+        for offset in range(1, 4):
+            model.offset = offset
+            evaluator.submit(offset * 100, model)
+        # Changes after submitting don't affect the snapshot.
+        model.offset = 9
+        release.set()
+        evaluator.wait()
+        self.assertEqual([0, 3], evaluated_offsets)
+        self.assertEqual((300, 0.3), evaluator.pop_result())
+        self.assertIsNone(evaluator.pop_result())
+        evaluator.close()
+        self.assertEqual(2, evaluator.num_evaluated)
+
+    def test_errors(self):
+        def evaluate(model: _FirstFeatureClassifier) -> float:
+            if model.offset == 0:
+                raise ValueError("Can't evaluate.")
+            return 1.0
+
+        logger = logging.getLogger('test_async_evaluator')
+        evaluator = AsyncEvaluator(evaluate, logger)
+        model = _FirstFeatureClassifier()
+        with self.assertLogs(logger, logging.ERROR):
+            evaluator.submit(0, model)
+            evaluator.wait()
+        self.assertIsNone(evaluator.pop_result())
+        model.offset = 1
+        evaluator.submit(1, model)
+        evaluator.close()
+        self.assertEqual((1, 1.0), evaluator.pop_result())
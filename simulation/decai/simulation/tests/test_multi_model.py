@@ -0,0 +1,67 @@
+import json
+import logging
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from injector import Injector
+
+from decai.simulation.contract.classification.perceptron import PerceptronModule
+from decai.simulation.contract.collab_trainer import DefaultCollaborativeTrainerModule
+from decai.simulation.contract.incentive.stakeable import StakeableImModule
+from decai.simulation.data.featuremapping.hashing.murmurhash3 import MurmurHash3Module
+from decai.simulation.data.synthetic_data_loader import SyntheticDataModule
+from decai.simulation.logging_module import LoggingModule
+from decai.simulation.multi_model import MultiModelSimulator
+from decai.simulation.registry import models
+from decai.simulation.simulate import Agent
+
+
+class TestMultiModelSimulator(unittest.TestCase):
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._dir = tempfile.TemporaryDirectory()
+        # Runs are saved relative to the working directory.
+        os.chdir(self._dir.name)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._dir.cleanup()
+
+    def test_simulate(self):
+        inj = Injector([
+            LoggingModule(logging.WARNING),
+            MurmurHash3Module,
+            SyntheticDataModule(num_samples=400, num_features=5),
+        ])
+        agents = [
+            Agent(address="Good", start_balance=10_000, mean_deposit=5, stdev_deposit=1, mean_update_wait_s=10 * 60),
+            Agent(address="Bad", start_balance=10_000, mean_deposit=10, stdev_deposit=1, mean_update_wait_s=60 * 60,
+                  good=False),
+        ]
+        runs, thread = inj.get(MultiModelSimulator).simulate(
+            # Two of the same model should be simulated the same way.
+            dict(a=PerceptronModule, b=PerceptronModule, nb=models.get_module('nb')),
+            [DefaultCollaborativeTrainerModule, LoggingModule(logging.WARNING), StakeableImModule],
+            agents,
+            filename_indicator='test',
+            seed=1,
+        )
+        thread.join()
+        self.assertEqual(['a', 'b', 'nb'], [run.name for run in runs])
+        self.assertEqual(3, len({id(run.decai.im) for run in runs}))
+        self.assertEqual(3, len({id(run.decai.data_handler) for run in runs}))
+        self.assertEqual(3, len({id(run.balances) for run in runs}))
+        for run in runs:
+            self.assertGreater(len(list(run.decai.data_handler)), 0)
+
+        saved_runs = dict()
+        for name in ['a', 'b', 'nb']:
+            paths = list(Path('saved_runs').glob(f'*-test-{name}-simulation_data.json'))
+            self.assertEqual(1, len(paths))
+            with open(paths[0]) as f:
+                saved_runs[name] = json.load(f)
+            self.assertGreater(len(saved_runs[name]['accuracies']), 1)
+        self.assertEqual(saved_runs['a']['accuracies'], saved_runs['b']['accuracies'])
+        self.assertEqual(saved_runs['a']['balances'], saved_runs['b']['balances'])
@@ -0,0 +1,85 @@
+import logging
+import os
+import tempfile
+import unittest
+from threading import Event
+
+from decai.simulation.plot_export import PlotImageExporter, make_bokeh_plot, render_with_matplotlib
+from decai.simulation.run_metrics import to_columns
+
+try:
+    import matplotlib
+except ImportError:
+    matplotlib = None
+
+
+class TestPlotImageExporter(unittest.TestCase):
+    def test_latest_wins(self):
+        rendered = []
+        first_started = Event()
+        can_finish = Event()
+
+        def render(snapshot, path):
+            first_started.set()
+            can_finish.wait()
+            rendered.append(snapshot)
+            with open(path, 'w') as f:
+                f.write(str(snapshot))
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'plot.png')
+            exporter = PlotImageExporter(render, logging.getLogger())
+            exporter.submit(0, path)
+            first_started.wait()
+            for snapshot in range(1, 5):
+                exporter.submit(snapshot, path)
+            can_finish.set()
+            exporter.close()
+
+            self.assertEqual([0, 4], rendered)
+            self.assertEqual(2, exporter.num_rendered)
+            self.assertEqual(['plot.png'], os.listdir(d))
+            with open(path) as f:
+                self.assertEqual('4', f.read())
+
+    def test_error(self):
+        def render(snapshot, path):
+            raise ValueError("Can't render.")
+
+        with tempfile.TemporaryDirectory() as d:
+            exporter = PlotImageExporter(render, logging.getLogger())
+            exporter.submit(0, os.path.join(d, 'plot.png'))
+            exporter.wait()
+            exporter.submit(1, os.path.join(d, 'plot.png'))
+            exporter.close()
+            self.assertEqual(0, exporter.num_rendered)
+            self.assertEqual([], os.listdir(d))
+
+    def test_make_bokeh_plot(self):
+        save_data = dict(
+            agents=[dict(address="Good", start_balance=10, good=True), dict(address="Bad", start_balance=20, good=False)],
+            baselineAccuracy=0.9,
+            accuracies=[dict(t=0, accuracy=0.5), dict(t=1E5, accuracy=0.75)],
+            balances=[dict(t=0, a="Good", b=10), dict(t=0, a="Bad", b=20), dict(t=5E4, a="Good", b=11.5)],
+        )
+        plot = make_bokeh_plot(to_columns(save_data))
+        # A new plot that isn't shared with the document of the simulation.
+        self.assertIsNone(plot.document)
+        balances = [list(r.data_source.data['b']) for r in plot.renderers if 'b' in r.data_source.data]
+        self.assertEqual([[100, 115], [100]], balances)
+        accuracies = [list(r.data_source.data['a']) for r in plot.renderers if 'a' in r.data_source.data]
+        self.assertEqual([[50, 75]], accuracies)
+
+    @unittest.skipIf(matplotlib is None, "matplotlib is not installed.")
+    def test_matplotlib(self):
+        save_data = dict(
+            agents=[dict(address="Good", start_balance=10, good=True), dict(address="Bad", start_balance=20, good=False)],
+            baselineAccuracy=0.9,
+            accuracies=[dict(t=0, accuracy=0.5), dict(t=1E5, accuracy=0.75)],
+            balances=[dict(t=0, a="Good", b=10), dict(t=0, a="Bad", b=20), dict(t=5E4, a="Good", b=11.5)],
+        )
+        with tempfile.TemporaryDirectory() as d:
+            exporter = PlotImageExporter(render_with_matplotlib, logging.getLogger())
+            exporter.submit(to_columns(save_data), os.path.join(d, 'plot.png'))
+            exporter.close()
+            self.assertEqual(['plot.png'], os.listdir(d))
@@ -0,0 +1,57 @@
+import unittest
+
+from decai.simulation.plot_stream import PlotRateLimiter, PlotStreamBridge
+
+
+class _FakeDocument(object):
+    def __init__(self):
+        self.callbacks = []
+
+    def add_next_tick_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def run_callbacks(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+class _FakeSource(object):
+    def __init__(self):
+        self.streamed = []
+
+    def stream(self, new_data, rollover=None):
+        self.streamed.append((new_data, rollover))
+
+
+class TestPlotStream(unittest.TestCase):
+    def test_rate_limiter(self):
+        limiter = PlotRateLimiter(10)
+        plotted = [t for t in [0, 3, 9, 10, 15, 21, 22] if limiter.should_plot('a', t)]
+        self.assertEqual([0, 10, 21], plotted)
+        # Series are limited separately.
+        self.assertTrue(limiter.should_plot('b', 22))
+        self.assertFalse(limiter.should_plot('b', 23))
+        self.assertTrue(limiter.should_plot('b', 24, force=True))
+        self.assertFalse(limiter.should_plot('b', 33))
+
+    def test_bridge(self):
+        doc = _FakeDocument()
+        bridge = PlotStreamBridge(doc, rollover=100)
+        a, b = _FakeSource(), _FakeSource()
+        bridge.add_source('a', a)
+        bridge.add_source('b', b)
+        bridge.push('a', t=1, v=10)
+        bridge.push('b', t=1, v=20)
+        bridge.push('a', t=2, v=11)
+        # Only one callback for all of the points.
+        self.assertEqual(1, len(doc.callbacks))
+        doc.run_callbacks()
+        self.assertEqual([(dict(t=[1, 2], v=[10, 11]), 100)], a.streamed)
+        self.assertEqual([(dict(t=[1], v=[20]), 100)], b.streamed)
+
+        bridge.push('b', t=3, v=21)
+        self.assertEqual(1, len(doc.callbacks))
+        doc.run_callbacks()
+        self.assertEqual(1, len(a.streamed))
+        self.assertEqual([(dict(t=[1], v=[20]), 100), (dict(t=[3], v=[21]), 100)], b.streamed)
@@ -0,0 +1,91 @@
+import json
+import os
+import tempfile
+import unittest
+from threading import Thread
+
+from decai.simulation.profiling import Profiler, profiled, profiler
+
+
+@profiled()
+def _double(x):
+    return 2 * x
+
+
+@profiled('custom name')
+def _fail():
+    raise ValueError()
+
+
+class TestProfiling(unittest.TestCase):
+    def tearDown(self):
+        profiler.enabled = False
+        profiler.reset()
+
+    def test_disabled(self):
+        self.assertFalse(profiler.enabled)
+        self.assertEqual(4, _double(2))
+        profiler.start_phase('phase')
+        profiler.count('counter')
+        with profiler.timer('timer'):
+            pass
+        self.assertEqual(dict(phases=dict()), profiler.to_dict())
+
+    def test_profiled(self):
+        profiler.enabled = True
+        self.assertEqual(4, _double(2))
+        profiler.start_phase('second')
+        self.assertEqual(6, _double(3))
+        self.assertEqual(8, _double(4))
+        with self.assertRaises(ValueError):
+            _fail()
+        profiler.count('counter', 5)
+        profiler.count('counter')
+        profiler.end_phase()
+
+        result = profiler.to_dict()['phases']
+        self.assertEqual(['main', 'second'], list(result.keys()))
+        self.assertIsNone(result['main']['total_s'])
+        self.assertEqual(1, result['main']['timers']['_double']['count'])
+        self.assertGreater(result['second']['total_s'], 0)
+        self.assertEqual(2, result['second']['timers']['_double']['count'])
+        self.assertEqual(1, result['second']['timers']['custom name']['count'])
+        self.assertEqual(dict(counter=6), result['second']['counters'])
+
+        summary = profiler.summary()
+        self.assertIn("Phase: second", summary)
+        self.assertIn("custom name", summary)
+
+    def test_threads(self):
+        profiler.enabled = True
+        profiler.start_phase('simulation')
+
+        def work():
+            self.assertEqual(4, _double(2))
+            profiler.count('background')
+
+        thread = Thread(target=work)
+        thread.start()
+        thread.join()
+        self.assertEqual(6, _double(3))
+        profiler.end_phase()
+
+        result = profiler.to_dict()['phases']
+        # The other thread didn't start a phase so its results aren't in the phase of this thread.
+        self.assertEqual(1, result['main']['timers']['_double']['count'])
+        self.assertEqual(dict(background=1), result['main']['counters'])
+        self.assertEqual(1, result['simulation']['timers']['_double']['count'])
+        self.assertEqual(dict(), result['simulation']['counters'])
+
+    def test_save(self):
+        p = Profiler()
+        p.enabled = True
+        p.start_phase('phase')
+        with p.timer('timer'):
+            pass
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'profile.json')
+            p.save(path)
+            self.assertEqual(['profile.json'], os.listdir(d))
+            with open(path) as f:
+                self.assertEqual(p.to_dict(), json.load(f))
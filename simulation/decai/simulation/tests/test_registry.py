@@ -0,0 +1,61 @@
+import json
+import subprocess
+import sys
+import unittest
+
+from decai.simulation.contract.classification.naive_bayes import NaiveBayesModule
+from decai.simulation.registry import Registry, datasets, incentive_mechanisms, models
+
+# Startup includes importing NumPy, scikit-learn, and the simulator so keep some leeway for slow machines.
+IMPORT_TIME_BUDGET_S = 8
+
+_IMPORT_SCRIPT = """
+import json
+import sys
+import time
+
+start = time.perf_counter()
+from injector import Injector
+from decai.simulation.contract.collab_trainer import DefaultCollaborativeTrainerModule
+from decai.simulation.logging_module import LoggingModule
+from decai.simulation.registry import datasets, incentive_mechanisms, models
+from decai.simulation.simulate import Simulator
+
+inj = Injector([
+    DefaultCollaborativeTrainerModule,
+    datasets.get_module('fitness'),
+    LoggingModule,
+    models.get_module('nb'),
+    incentive_mechanisms.get_module('stakeable'),
+])
+inj.get(Simulator)
+elapsed = time.perf_counter() - start
+print(json.dumps(dict(elapsed=elapsed, modules=sorted(m for m in sys.modules if '.' not in m))))
+"""
+
+
+class TestRegistry(unittest.TestCase):
+    def test_get_module(self):
+        self.assertIsInstance(models.get_module('nb'), NaiveBayesModule)
+        self.assertIsNot(models.get_module('nb'), models.get_module('nb'))
+        self.assertEqual(3500, datasets.get_info('fitness')['train_size'])
+        self.assertIn('stakeable', incentive_mechanisms)
+        self.assertNotIn('missing', incentive_mechanisms)
+
+    def test_unknown(self):
+        r = Registry('thing')
+        r.register('a', 'decai.simulation.contract.classification.naive_bayes:NaiveBayesModule')
+        self.assertEqual(['a'], r.names())
+        with self.assertRaises(KeyError):
+            r.get_module('b')
+        with self.assertRaises(AssertionError):
+            r.register('a', 'decai.simulation.contract.classification.perceptron:PerceptronModule')
+
+    def test_import_time(self):
+        # Run in a new process so that modules that were already imported by other tests are not cached.
+        output = subprocess.run([sys.executable, '-c', _IMPORT_SCRIPT],
+                                check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        for heavy_module in ['bokeh', 'keras', 'spacy', 'tensorflow']:
+            self.assertNotIn(heavy_module, result['modules'])
+        self.assertLess(result['elapsed'], IMPORT_TIME_BUDGET_S)
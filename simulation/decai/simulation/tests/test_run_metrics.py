@@ -0,0 +1,35 @@
+import json
+import os
+import tempfile
+import unittest
+
+from decai.simulation.run_metrics import load_metrics, metrics_path_for, save_metrics
+
+
+class TestRunMetrics(unittest.TestCase):
+    def test_round_trip(self):
+        save_data = dict(
+            agents=[dict(address="Good", start_balance=10), dict(address="Bad", start_balance=20)],
+            baselineAccuracy=0.9,
+            accuracies=[dict(t=0, accuracy=0.5), dict(t=10, accuracy=0.75)],
+            balances=[dict(t=0, a="Good", b=10), dict(t=0, a="Bad", b=20), dict(t=5, a="Good", b=11.5)],
+        )
+        with tempfile.TemporaryDirectory() as d:
+            run_path = os.path.join(d, 'run-simulation_data.json')
+            with open(run_path, 'w') as f:
+                json.dump(save_data, f)
+            from_json = load_metrics(run_path)
+
+            save_metrics(metrics_path_for(run_path), save_data)
+            self.assertEqual(['run-simulation_data.json', 'run-simulation_data.npz'], sorted(os.listdir(d)))
+            # Make sure the JSON isn't used.
+            os.remove(run_path)
+            from_metrics = load_metrics(run_path)
+
+        for data in [from_json, from_metrics]:
+            self.assertEqual(dict(agents=save_data['agents'], baselineAccuracy=0.9), data['metadata'])
+            self.assertEqual([0, 10], data['accuracy_t'].tolist())
+            self.assertEqual([0.5, 0.75], data['accuracy'].tolist())
+            self.assertEqual([0, 0, 5], data['balance_t'].tolist())
+            self.assertEqual([0, 1, 0], data['balance_agent'].tolist())
+            self.assertEqual([10, 20, 11.5], data['balance'].tolist())
@@ -0,0 +1,46 @@
+import unittest
+
+from decai.simulation.scheduler import EventScheduler, EventType
+
+
+class TestEventScheduler(unittest.TestCase):
+    def test_order(self):
+        s = EventScheduler()
+        handled = []
+        for event_type in EventType:
+            s.register(event_type, lambda t, events: handled.append((t, events[0].type, [e.payload for e in events])))
+
+        s.schedule(5, EventType.ADD_DATA, 'a')
+        s.schedule(2, EventType.PREDICT, 'p')
+        s.schedule(5, EventType.ACCURACY_TICK)
+        s.schedule_many([5, 5, 7], EventType.ADD_DATA, ['b', 'c', 'd'])
+        self.assertEqual(6, len(s))
+        self.assertEqual(2, s.peek_time())
+
+        s.run()
+        self.assertEqual([
+            (2, EventType.PREDICT, ['p']),
+            (5, EventType.ACCURACY_TICK, [None]),
+            (5, EventType.ADD_DATA, ['a', 'b', 'c']),
+            (7, EventType.ADD_DATA, ['d']),
+        ], handled)
+        self.assertEqual(0, len(s))
+        self.assertIsNone(s.peek_time())
+        self.assertFalse(s.step())
+
+    def test_stop_condition(self):
+        s = EventScheduler()
+        count = 0
+
+        def handle(t, events):
+            nonlocal count
+            count += len(events)
+            s.schedule(t + 1, EventType.PREDICT)
+
+        s.register(EventType.PREDICT, handle)
+        s.schedule(0, EventType.PREDICT)
+        s.run(stop_condition=lambda: count >= 3)
+        self.assertEqual(3, count)
+        self.assertEqual(3, s.peek_time())
+        s.clear()
+        self.assertEqual(0, len(s))
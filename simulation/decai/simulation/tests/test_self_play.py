@@ -0,0 +1,96 @@
+import logging
+import unittest
+from typing import List
+
+import numpy as np
+from injector import Injector
+
+from decai.simulation.contract.classification.classifier import Classifier
+from decai.simulation.contract.classification.perceptron import PerceptronModule
+from decai.simulation.data.ttt_data_loader import TicTacToeDataLoader
+from decai.simulation.logging_module import LoggingModule
+from decai.simulation.self_play import evaluate_self_play
+
+
+class _FirstEmptyClassifier(Classifier):
+    """
+    Picks the first empty position.
+    """
+
+    def __init__(self):
+        self.num_batches = 0
+
+    def evaluate(self, data, labels) -> float:
+        pass
+
+    def log_evaluation_details(self, data, labels, level=logging.INFO) -> float:
+        pass
+
+    def init_model(self, training_data, labels, save_model=False):
+        pass
+
+    def predict(self, data):
+        return int(np.argmax(data == 0))
+
+    def predict_batch(self, data):
+        self.num_batches += 1
+        return super().predict_batch(data)
+
+    def update(self, data, classification):
+        pass
+
+    def reset_model(self):
+        pass
+
+    def export(self, path: str, classifications: List[str] = None, model_type: str = None,
+               feature_index_mapping=None):
+        pass
+
+
+class TestSelfPlay(unittest.TestCase):
+    def _play_one_at_a_time(self, classifier, tic_tac_toe, board, next_player):
+        # One prediction per turn like the original recursive evaluation.
+        while True:
+            pos = classifier.predict(board * next_player)
+            if board[pos] != 0:
+                return 0, np.count_nonzero(board == next_player)
+            board[pos] = next_player
+            if tic_tac_toe.get_winner(board.reshape(tic_tac_toe.width, tic_tac_toe.length)):
+                return next_player, np.count_nonzero(board == next_player)
+            next_player = -next_player
+
+    def test_same_as_one_at_a_time(self):
+        tic_tac_toe = TicTacToeDataLoader(logging.getLogger())
+        c = _FirstEmptyClassifier()
+        results = evaluate_self_play(c, tic_tac_toe)
+        self.assertEqual(10, len(results.winners))
+        # Games stop once the board is full or someone wins.
+        self.assertLessEqual(c.num_batches, 9)
+
+        board = np.zeros(9, dtype=np.int8)
+        self.assertEqual((results.winners[0], results.num_moves[0]),
+                         self._play_one_at_a_time(c, tic_tac_toe, board, 1))
+        for start_pos in range(9):
+            board = np.zeros(9, dtype=np.int8)
+            board[start_pos] = -1
+            self.assertEqual((results.winners[1 + start_pos], results.num_moves[1 + start_pos]),
+                             self._play_one_at_a_time(c, tic_tac_toe, board, 1),
+                             f"start_pos: {start_pos}")
+
+        # Player 1 gets the diagonal from the top right.
+        self.assertEqual((1, 4), (results.winners[0], results.num_moves[0]))
+
+        summary = results.summary()
+        self.assertEqual(10, summary['wins'] + summary['draws'] + summary['losses'])
+        self.assertEqual(results.wins, summary['wins'])
+
+    def test_scikit_classifier(self):
+        tic_tac_toe = TicTacToeDataLoader(logging.getLogger(), deduplicate=True, remove_bad_moves=True)
+        (x_train, y_train), (x_test, _) = tic_tac_toe.load_data()
+        c = Injector([LoggingModule, PerceptronModule]).get(Classifier)
+        c.init_model(x_train, y_train)
+        self.assertEqual([c.predict(x) for x in x_test], c.predict_batch(x_test).tolist())
+
+        results = evaluate_self_play(c, tic_tac_toe)
+        self.assertEqual(10, len(results.winners))
+        self.assertTrue(np.all(results.num_moves > 0))
@@ -1,7 +1,22 @@
+import logging
+import os
+import tempfile
 import unittest
+from pathlib import Path
 from queue import PriorityQueue
 
-from decai.simulation.simulate import Agent
+import numpy as np
+from injector import Injector
+
+from decai.simulation.contract.classification.perceptron import PerceptronModule
+from decai.simulation.contract.collab_trainer import DefaultCollaborativeTrainerModule
+from decai.simulation.contract.incentive.incentive_mechanism import IncentiveMechanism
+from decai.simulation.contract.incentive.stakeable import StakeableImModule
+from decai.simulation.data.featuremapping.hashing.murmurhash3 import MurmurHash3Module
+from decai.simulation.data.synthetic_data_loader import SyntheticDataModule
+from decai.simulation.logging_module import LoggingModule
+from decai.simulation.simulate import Agent, AgentPopulation, Simulator
+from decai.simulation.trace import CallType, Trace
 
 
 class TestAgent(unittest.TestCase):
@@ -15,3 +30,79 @@ class TestAgent(unittest.TestCase):
         [q.put((0, a)) for a in agents]
         results = [q.get()[1].address for _ in agents]
         self.assertEqual(['a0', 'a1', 'a2'], results)
+
+
+class TestAgentPopulation(unittest.TestCase):
+    def test_from_agents(self):
+        agents = [
+            Agent('good', 10, 1, 1, 60),
+            Agent('bad', 20, 2, 1, 120, good=False),
+        ]
+        population = AgentPopulation.from_agents(agents, seed=1)
+        self.assertEqual(2, len(population))
+        self.assertEqual(agents, list(population))
+        self.assertEqual([True, False], population.good.tolist())
+        self.assertIs(population[1], population[1])
+
+    def test_draws(self):
+        n = 10_000
+        population = AgentPopulation([f'a{i}' for i in range(n)],
+                                     start_balance=100, mean_deposit=np.arange(n) % 3, stdev_deposit=2,
+                                     mean_update_wait_s=60, stdev_update_wait_time=30,
+                                     seed=1)
+        indices = np.arange(n)
+        deposits = population.get_next_deposits(indices)
+        self.assertEqual((n,), deposits.shape)
+        self.assertTrue(np.all(deposits >= 1))
+        waits = population.get_next_waits_s(indices)
+        self.assertTrue(np.all(waits >= 1))
+        self.assertAlmostEqual(60, waits.mean(), delta=2)
+
+
+class TestSimulator(unittest.TestCase):
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._dir = tempfile.TemporaryDirectory()
+        # Runs are saved relative to the working directory.
+        os.chdir(self._dir.name)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._dir.cleanup()
+
+    def test_claims(self):
+        inj = Injector([
+            DefaultCollaborativeTrainerModule,
+            LoggingModule(logging.WARNING),
+            MurmurHash3Module,
+            PerceptronModule,
+            StakeableImModule,
+            SyntheticDataModule(num_samples=400, num_features=5),
+        ])
+        agents = [
+            Agent(address="Good", start_balance=10_000, mean_deposit=5, stdev_deposit=1, mean_update_wait_s=10 * 60),
+            Agent(address="Bad", start_balance=10_000, mean_deposit=10, stdev_deposit=1, mean_update_wait_s=60 * 60,
+                  good=False),
+        ]
+        inj.get(Simulator).simulate(agents, filename_indicator='test', plot_image_renderer=None, seed=1,
+                                    record_trace=True).join()
+        trace = Trace.load(next(Path('saved_runs').glob('*-test-trace.npz')))
+        im = inj.get(IncentiveMechanism)
+
+        is_claim = np.isin(trace.call_type, [CallType.REFUND.value, CallType.REPORT.value])
+        self.assertGreater(np.count_nonzero(trace.call_type == CallType.REFUND.value), 0)
+        self.assertGreater(np.count_nonzero(trace.call_type == CallType.REPORT.value), 0)
+        elapsed = trace.t[is_claim] - trace.added_time[is_claim]
+        self.assertTrue(np.all(elapsed >= im.refund_time_s))
+        # Contributors get refunds and other agents report data when it's their turn.
+        is_refund = trace.call_type[is_claim] == CallType.REFUND.value
+        is_author = trace.sender[is_claim] == trace.author[is_claim]
+        np.testing.assert_array_equal(is_author[is_refund], True)
+        np.testing.assert_array_equal(is_author[~is_refund] & (elapsed[~is_refund] <= im.any_address_claim_wait_time_s),
+                                      False)
+        turn_times = {(t, sender) for t, sender, call_type in zip(trace.t.tolist(), trace.sender.tolist(),
+                                                                   trace.call_type.tolist())
+                      if call_type == CallType.ADD_DATA.value}
+        claim_times = set(zip(trace.t[is_claim].tolist(), trace.sender[is_claim].tolist()))
+        # Claims are made during an agent's turn, which usually includes adding data.
+        self.assertGreater(len(claim_times & turn_times), 0)
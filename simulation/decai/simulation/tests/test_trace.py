@@ -0,0 +1,103 @@
+import logging
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from injector import ClassAssistedBuilder, Injector, Module, provider, singleton
+
+from decai.simulation.contract.balances import Balances
+from decai.simulation.contract.classification.perceptron import PerceptronModule
+from decai.simulation.contract.collab_trainer import CollaborativeTrainer, DefaultCollaborativeTrainerModule
+from decai.simulation.contract.incentive.incentive_mechanism import IncentiveMechanism
+from decai.simulation.contract.incentive.stakeable import Stakeable, StakeableImModule
+from decai.simulation.data.data_loader import DataLoader
+from decai.simulation.data.featuremapping.hashing.murmurhash3 import MurmurHash3Module
+from decai.simulation.data.synthetic_data_loader import SyntheticDataModule
+from decai.simulation.logging_module import LoggingModule
+from decai.simulation.simulate import Agent, Simulator
+from decai.simulation.trace import CallType, Trace, TraceRecorder, TraceReplayer
+
+
+class _ExpensiveStakeableModule(Module):
+    @provider
+    @singleton
+    def provide_incentive_mechanism(self, builder: ClassAssistedBuilder[Stakeable]) -> IncentiveMechanism:
+        return builder.build(cost_weight=1E9)
+
+
+def _make_injector(im_module=StakeableImModule) -> Injector:
+    return Injector([
+        DefaultCollaborativeTrainerModule,
+        im_module,
+        LoggingModule(logging.WARNING),
+        MurmurHash3Module,
+        PerceptronModule,
+        SyntheticDataModule(num_samples=400, num_features=5),
+    ])
+
+
+class TestTrace(unittest.TestCase):
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._dir = tempfile.TemporaryDirectory()
+        # Runs are saved relative to the working directory.
+        os.chdir(self._dir.name)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._dir.cleanup()
+
+    def test_save_load(self):
+        recorder = TraceRecorder(['a', 'b'], [100, 200], init_size=5, train_size=50)
+        recorder.record(CallType.ADD_DATA, 10, 'a', 3, 7, label=1)
+        recorder.record(CallType.REPORT, 20, 'b', 200, 7, label=1, added_time=10, author='a')
+        recorder.save('trace.npz')
+
+        trace = Trace.load('trace.npz')
+        self.assertEqual(2, len(trace))
+        self.assertEqual(['a', 'b'], trace.addresses)
+        self.assertEqual([100, 200], trace.start_balances.tolist())
+        self.assertEqual(5, trace.init_size)
+        self.assertEqual(50, trace.train_size)
+        self.assertIsNone(trace.test_size)
+        self.assertTrue(trace.map_features)
+        self.assertEqual([CallType.ADD_DATA.value, CallType.REPORT.value], trace.call_type.tolist())
+        self.assertEqual([0, 1], trace.sender.tolist())
+        self.assertEqual([7, 7], trace.sample_index.tolist())
+        self.assertEqual(10, trace.added_time[1])
+        self.assertEqual([-1, 0], trace.author.tolist())
+
+    def test_replay(self):
+        agents = [
+            Agent(address="Good", start_balance=10_000, mean_deposit=5, stdev_deposit=1, mean_update_wait_s=10 * 60),
+            Agent(address="Bad", start_balance=10_000, mean_deposit=10, stdev_deposit=1, mean_update_wait_s=60 * 60,
+                  good=False),
+            Agent(address="Caller", start_balance=10_000, mean_deposit=0, stdev_deposit=0,
+                  mean_update_wait_s=60 * 60, calls_model=True, pay_to_call=5),
+        ]
+        inj = _make_injector()
+        inj.get(Simulator).simulate(agents, filename_indicator='test', plot_image_renderer=None,
+                                    record_trace=True).join()
+        trace_paths = list(Path('saved_runs').glob('*-test-trace.npz'))
+        self.assertEqual(1, len(trace_paths))
+        trace = Trace.load(trace_paths[0])
+        call_types = set(trace.call_type.tolist())
+        self.assertIn(CallType.ADD_DATA.value, call_types)
+        self.assertIn(CallType.PREDICT.value, call_types)
+        self.assertIn(CallType.REFUND.value, call_types)
+
+        # Replaying with the same configuration gives the same results.
+        replay_inj = _make_injector()
+        result = replay_inj.get(TraceReplayer).replay(trace)
+        self.assertEqual(len(trace), result.num_calls)
+        self.assertEqual([], result.divergences)
+        balances = inj.get(Balances)
+        self.assertEqual({agent.address: balances[agent.address] for agent in agents}, result.balances)
+        _, (x_test, y_test) = inj.get(DataLoader).load_data()
+        self.assertEqual(inj.get(CollaborativeTrainer).model.evaluate(x_test, y_test), result.accuracy)
+
+        # Contributions are rejected when they cost too much.
+        result = _make_injector(_ExpensiveStakeableModule).get(TraceReplayer).replay(trace)
+        self.assertGreater(len(result.divergences), 0)
+        self.assertEqual(CallType.ADD_DATA, result.divergences[0].call_type)
@@ -0,0 +1,288 @@
+import json
+import math
+import os
+from array import array
+from dataclasses import dataclass
+from enum import Enum
+from logging import Logger
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import scipy.sparse
+from injector import inject
+
+from decai.simulation.contract.balances import Balances
+from decai.simulation.contract.collab_trainer import CollaborativeTrainer
+from decai.simulation.contract.objects import Address, Msg, RejectException, TimeMock
+from decai.simulation.data.data_loader import DataLoader
+from decai.simulation.data.featuremapping.feature_index_mapper import FeatureIndexMapper
+from decai.simulation.profiling import profiler
+
+
+class CallType(Enum):
+    """
+    Types of calls that agents make to a `CollaborativeTrainer`.
+    """
+
+    ADD_DATA = 0
+    REFUND = 1
+    REPORT = 2
+    PREDICT = 3
+
+
+_NO_AUTHOR = -1
+
+
+class TraceRecorder(object):
+    """
+    Records the calls that agents make in a simulation so that they can be replayed with `TraceReplayer`.
+
+    Samples are stored as indices into the training data instead of their features
+    so each call only takes a few bytes.
+    """
+
+    def __init__(self,
+                 addresses: Sequence[Address],
+                 start_balances: Sequence[float],
+                 init_size: int,
+                 train_size: Optional[int] = None,
+                 test_size: Optional[int] = None,
+                 map_features: bool = True):
+        """
+        :param addresses: The address of each agent.
+        :param start_balances: The starting balance of each agent.
+        :param init_size: The number of training samples used to initialize the model.
+        :param train_size: The amount of training data that was requested from the `DataLoader`.
+        :param test_size: The amount of test data that was requested from the `DataLoader`.
+        :param map_features: `True` if the data was mapped with the `FeatureIndexMapper`.
+        """
+        self.addresses = list(addresses)
+        self._address_indices = {address: i for i, address in enumerate(self.addresses)}
+        self.start_balances = list(start_balances)
+        assert len(self.start_balances) == len(self.addresses)
+        self.init_size = init_size
+        self.train_size = train_size
+        self.test_size = test_size
+        self.map_features = map_features
+
+        self._t = array('d')
+        self._call_type = array('B')
+        self._sender = array('i')
+        self._value = array('d')
+        self._sample_index = array('q')
+        self._label = array('q')
+        self._added_time = array('d')
+        self._author = array('i')
+
+    def __len__(self):
+        return len(self._t)
+
+    def record(self, call_type: CallType, t: float, sender: Address, value: float, sample_index: int,
+               label=0, added_time: float = math.nan, author: Optional[Address] = None):
+        """
+        Record a call that was accepted.
+
+        :param call_type: The type of call.
+        :param t: The time of the call.
+        :param sender: The agent that made the call.
+        :param value: The value sent with the call.
+        :param sample_index: The index of the sample in the training data.
+        :param label: The label that was used for the sample.
+        :param added_time: The time that the data was added, for refunds and reports.
+        :param author: The agent that added the data, for refunds and reports.
+        """
+        self._t.append(t)
+        self._call_type.append(call_type.value)
+        self._sender.append(self._address_indices[sender])
+        self._value.append(value)
+        self._sample_index.append(sample_index)
+        self._label.append(int(label))
+        self._added_time.append(added_time)
+        self._author.append(_NO_AUTHOR if author is None else self._address_indices[author])
+
+    def save(self, path):
+        """
+        Save the trace in a compressed binary format.
+
+        :param path: Where to save the trace.
+        """
+        metadata = dict(init_size=self.init_size, train_size=self.train_size, test_size=self.test_size,
+                        map_features=self.map_features)
+        path = Path(path)
+        # Write to a temporary file first so that an interrupted run doesn't leave a partial file.
+        tmp_path = path.with_suffix('.tmp.npz')
+        np.savez_compressed(tmp_path,
+                            metadata=np.array(json.dumps(metadata, separators=(',', ':'))),
+                            addresses=np.array(self.addresses, dtype=str),
+                            start_balances=np.array(self.start_balances, dtype=np.float64),
+                            t=np.frombuffer(self._t, dtype=np.float64),
+                            call_type=np.frombuffer(self._call_type, dtype=np.uint8),
+                            sender=np.frombuffer(self._sender, dtype=np.int32),
+                            value=np.frombuffer(self._value, dtype=np.float64),
+                            sample_index=np.frombuffer(self._sample_index, dtype=np.int64),
+                            label=np.frombuffer(self._label, dtype=np.int64),
+                            added_time=np.frombuffer(self._added_time, dtype=np.float64),
+                            author=np.frombuffer(self._author, dtype=np.int32),
+                            )
+        os.replace(tmp_path, path)
+
+
+@dataclass
+class Trace:
+    """
+    The calls that agents made in a simulation, stored as columns.
+    """
+
+    addresses: List[Address]
+    start_balances: np.ndarray
+    init_size: int
+    train_size: Optional[int]
+    test_size: Optional[int]
+    map_features: bool
+
+    t: np.ndarray
+    call_type: np.ndarray
+    sender: np.ndarray
+    """ The index in `addresses` of the agent that made each call. """
+    value: np.ndarray
+    sample_index: np.ndarray
+    label: np.ndarray
+    added_time: np.ndarray
+    author: np.ndarray
+    """ The index in `addresses` of the agent that added the data for each refund and report. """
+
+    @classmethod
+    def load(cls, path) -> 'Trace':
+        """
+        :param path: The path to a trace saved by `TraceRecorder`.
+        :return: The trace.
+        """
+        with np.load(path) as data:
+            columns = {k: data[k] for k in data.files}
+        metadata = json.loads(str(columns.pop('metadata')))
+        return cls(addresses=columns.pop('addresses').tolist(), **metadata, **columns)
+
+    def __len__(self):
+        return len(self.t)
+
+
+@dataclass
+class Divergence:
+    """
+    A call in a trace that was rejected when it was replayed.
+    """
+
+    index: int
+    """ The index of the call in the trace. """
+
+    call_type: CallType
+    t: float
+    sender: Address
+    reason: str
+
+
+@dataclass
+class ReplayResult:
+    num_calls: int
+    """ The number of calls that were replayed. """
+
+    divergences: List[Divergence]
+
+    accuracy: float
+    """ The accuracy of the model on the test set after replaying all of the calls. """
+
+    balances: Dict[Address, float]
+    """ The balance of each agent after replaying all of the calls. """
+
+
+class TraceReplayer(object):
+    """
+    Makes the calls from a trace so that different configurations can be compared on the same contributions.
+
+    Agents don't make decisions during a replay so it runs much faster than a simulation.
+    Calls that are rejected are reported as divergences from the trace, e.g. when a different incentive mechanism
+    doesn't allow a refund that was allowed when the trace was recorded.
+    Calls in a prediction market's reward phase are not recorded so they are not replayed.
+    """
+
+    @inject
+    def __init__(self,
+                 balances: Balances,
+                 data_loader: DataLoader,
+                 decai: CollaborativeTrainer,
+                 feature_index_mapper: FeatureIndexMapper,
+                 logger: Logger,
+                 time_method: TimeMock,
+                 ):
+        self._balances = balances
+        self._data_loader = data_loader
+        self._decai = decai
+        self._feature_index_mapper = feature_index_mapper
+        self._logger = logger
+        self._time = time_method
+
+    def replay(self, trace: Trace) -> ReplayResult:
+        """
+        Initialize the model and replay the calls in a trace.
+
+        :param trace: The trace to replay.
+        :return: The results of the replay.
+        """
+        (x_train, y_train), (x_test, y_test) = self._data_loader.load_data(train_size=trace.train_size,
+                                                                           test_size=trace.test_size)
+        if trace.map_features:
+            x_train, x_test, _ = self._feature_index_mapper.map(x_train, x_test)
+        else:
+            # The samples were dense when they were streamed.
+            if scipy.sparse.issparse(x_train):
+                x_train = x_train.toarray()
+            if scipy.sparse.issparse(x_test):
+                x_test = x_test.toarray()
+        self._decai.model.init_model(x_train[:trace.init_size], y_train[:trace.init_size])
+
+        addresses = trace.addresses
+        for address, start_balance in zip(addresses, trace.start_balances.tolist()):
+            self._balances.initialize(address, start_balance)
+
+        self._logger.info("Replaying %d calls.", len(trace))
+        divergences = []
+        # Refunds and reports can't be replayed for contributions that were rejected.
+        rejected_contributions = set()
+        call_types = list(CallType)
+        with profiler.timer('TraceReplayer.replay'):
+            for i, (t, call_type, sender, value, sample_index, label, added_time, author) in enumerate(zip(
+                    trace.t.tolist(), trace.call_type.tolist(), trace.sender.tolist(), trace.value.tolist(),
+                    trace.sample_index.tolist(), trace.label.tolist(), trace.added_time.tolist(),
+                    trace.author.tolist())):
+                call_type = call_types[call_type]
+                self._time.set_time(t)
+                msg = Msg(addresses[sender], value)
+                x = x_train[sample_index]
+                if call_type in (CallType.REFUND, CallType.REPORT) \
+                        and (sample_index, added_time, author) in rejected_contributions:
+                    divergences.append(Divergence(i, call_type, t, msg.sender, "The data was not added."))
+                    continue
+                try:
+                    if call_type == CallType.ADD_DATA:
+                        self._decai.add_data(msg, x, label)
+                    elif call_type == CallType.REFUND:
+                        self._decai.refund(msg, x, label, added_time)
+                    elif call_type == CallType.REPORT:
+                        self._decai.report(msg, x, label, added_time, addresses[author])
+                    else:
+                        self._decai.predict(msg, x)
+                except RejectException as e:
+                    divergences.append(Divergence(i, call_type, t, msg.sender, str(e)))
+                    if call_type == CallType.ADD_DATA:
+                        rejected_contributions.add((sample_index, t, sender))
+
+        if len(divergences) > 0:
+            self._logger.warning("%d out of %d calls were rejected when replaying. First: %s",
+                                 len(divergences), len(trace), divergences[0])
+        accuracy = self._decai.model.evaluate(x_test, y_test)
+        self._logger.info("Test set accuracy after replaying: %0.2f%%", accuracy * 100)
+        return ReplayResult(num_calls=len(trace),
+                            divergences=divergences,
+                            accuracy=accuracy,
+                            balances={address: self._balances[address] for address in addresses})
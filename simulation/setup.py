@@ -38,6 +38,8 @@ setup(
     install_requires=install_requires,
     tests_require=test_deps,
     extras_require=dict(
+        # For saving images of plots without a browser.
+        matplotlib=['matplotlib'],
         test=test_deps,
     ),
 )